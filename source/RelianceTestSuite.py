@@ -34,10 +34,28 @@
 #Modern (tall) vs Classic (short)
 
 
+import argparse
+import datetime
+import json
+import os
+import sys
 import hid
 import serial
 from commands import * 
 from testManager import *
+from capture import CaptureRecorder
+from checkpoint import Checkpoint
+from results import ResultsWriter
+from scheduler import Scheduler
+from serialWriter import SerialWriter
+from statusPoller import StatusPoller
+from tracer import TicketTracer
+from faults import FaultMonitor
+import transport
+from transport import ObservedSerial
+import metrics
+import prompts
+import render
 
 ### HID Comms Parameters ##
 VENDOR_ID = 0x0425
@@ -49,97 +67,62 @@ RX_ID = 2
 SERIAL_PORT = 'COM3'  
 baudrate = 19200 
 
-if __name__ == "__main__":
-    print(r"""
-  ____      _ _                                    
- |  _ \ ___| (_) __ _ _ __   ___ ___               
- | |_) / _ \ | |/ _` | '_ \ / __/ _ \              
- |  _ <  __/ | | (_| | | | | (_|  __/              
- |_|_\_\___|_|_|\__,_|_| |_|\___\___|              
- |  _ \ ___  __ _ _ __ ___  ___ ___(_) ___  _ __   
- | |_) / _ \/ _` | '__/ _ \/ __/ __| |/ _ \| '_ \  
- |  _ <  __/ (_| | | |  __/\__ \__ \ | (_) | | | | 
- |_| \_\___|\__, |_|  \___||___/___/_|\___/|_| |_| 
-   ____ _   |___/                                  
-  / ___| |   |_ _|                                 
- | |   | |    | |                                  
- | |___| |___ | |                                  
-  \____|_____|___|                      
-    """)
+# Headless config file (JSON), all keys optional:
+# {
+#   "port": "COM3",                      serial port (or a number: 3 -> COM3)
+#   "hid_path": null,                    hid path when several printers are attached
+#   "tests": ["CRLF", "AUTOCUT"],        default: all
+#   "answers": {"SENTRY_QRTS": {"quantity": 2, "pairing_code": "X...", "redemption": ["Z...", "Z..."]}},
+#   "expect": {"AUTOCUT": "DEFERRED"},   verdicts expected up front; mismatches fail the run
+#   "repeat_failed": 1,                  automatic reruns of failed tests
+#   "results": "test_results.txt",
+#   "checkpoint": "checkpoint.json",     progress saved after every test; an unfinished run resumes (--fresh to restart)
+#   "deferred": "deferred_verdicts.json",
+#   "deferred_ok": false,                exit 0 rather than EXIT_DEFERRED (3) when verdicts were left deferred
+#   "jsonl": "results.jsonl",            per-step timing events (default results_<time>.jsonl)
+#   "junit": "results.xml",              JUnit XML, rewritten after every test
+#   "metrics": true,                     per-command latency histograms (metrics_<time>.json)
+#   "schedule": true,                    reorder tests to save paper swaps / pairing, skip repeated SET_*
+#   "paper": 58,                         schedule: paper loaded at the start
+#   "fleet": [{"port": "COM3", "hid_serial": "..."}],   --fleet: printers to run on (see fleet.py)
+#   "fleet_dir": "fleet_results",        --fleet: per-printer results, captures and summary
+#   "golden": "golden",                  compare rendered tickets with golden images in this folder (see render.py)
+#   "golden_tolerance": 0.001,           fraction of dots a ticket may differ by
+#   "trace": true,                       per-ticket phase timings from status polling (trace_<time>.jsonl)
+#   "trace_hz": 20,                      trace / fault monitor: status polling rate
+#   "fault_monitor": true,               stop and fail jam tests on a printer fault (see faults.py), default on;
+#                                        polls status only while a jam test runs
+#   "baudrate": 57600,                   serial rate to run at (see --baud-sweep), default 19200
+#   "baud_sweep": {"rates": [19200, 57600, 115200], "tickets": 3}   --baud-sweep: see baudsweep.py
+#   "benchmark": {"densities": [100, 160], "lines": [10, 40]}   --benchmark: sweep (see benchmark.py)
+#   "flash": {"window": 8},              --flash: frames in flight etc. (see flash.py)
+#   "logo": {"image": "logo.png", "bank": 0, "paper": 80}   upload a logo before the tests (see logo.py)
+#   "soak": {"modes": ["retract", "continuous"], "tickets": 10000}   --soak: see soak.py
+# }
 
-    print("Setup:" \
-    "\n- Connect the printer to the computer via USB HID" \
-    "\n- Connect the printer to the computer via Serial USB -> RS232 (note the COM#)" \
-    "\n- Load 56mm paper into the printer. Have 80mm paper ready" \
-    "\n- Place the printer on the edge of your desk with the disposal below exposed" \
-    "\n- Locate main.bin, copy its location" \
-    )
-    while True:
-        com_num = input("Enter COM port NUMBER for serial connection (e.g., 3): ")
-        if not com_num.isdigit():
-            print("Invalid input. Please enter a numeric value.")
-            continue
-        SERIAL_PORT = 'COM' + com_num
-        try: 
-            # Open serial port
-            ser = serial.Serial(SERIAL_PORT, baudrate, timeout=1) 
-        except Exception as e:
-            print(f"Error opening serial port {SERIAL_PORT}: {e}")
-            continue  
-        try: 
-            # Open USB HID device
-            device = hid.device()
-            device.open(VENDOR_ID, PRODUCT_ID)
-            device.set_nonblocking(0)  # 0 means blocking mode
-            break
-        except Exception as e:
-            print(f"Error opening USB HID device: {e}")
-            ser.close()
-            device.close()
-            continue
 
-    print ("\n========================")
-    # Ping to check if the device is connected
-    response = write_command(device, "PING")
-    if response == "NAK":
-        print("Device not responding")
-        exit(1)
-    else:
-        print("Device connected")
-    # Set serial config 
-    # 19200 baud, 8N1, no handshaking
-    response = write_command(device, "SET_SERIAL")
-    if response == "NAK":
-        print("Failed to set serial configuration")
-        exit(1)
-    else:
-        print("Serial configuration set\n")
-    
-    print ("CONNECTION SUCCESSFUL")
-    print ("BEGINNING TESTS")
-    print ("========================\n")
-    
-    TESTS = {
+def build_tests(ser, device):
+    return {
         "JAM_RETRACTION_58MM": TestEntry(
             "JAM_TST_RETRACTION_56MM", 
             False, 
             test_jamTestingRetractionMode, 
-            [ser, device, 6, 58]),  #args: ser,device, quantity, mm
+            [ser, device, 6, 58], paper=58, monitored=True),  #args: ser,device, quantity, mm
         "JAM_CONTINUOUS_58MM": TestEntry(
             "JAM_CONTINUOUS_56MM", 
             False, 
             test_jamTestingContinuousMode, 
-            [ser, device, 6, 58]),  #args: ser,device, quantity, mm
+            [ser, device, 6, 58], paper=58, monitored=True),  #args: ser,device, quantity, mm
         "JAM_RETRACTION_80MM": TestEntry(
             "JAM_RETRACTION_80MM", 
             False, 
             test_jamTestingRetractionMode, 
-            [ser, device, 6, 80]),  #args: ser,device, quantity, mm
+            [ser, device, 6, 80], paper=80, monitored=True),  #args: ser,device, quantity, mm
         "JAM_CONTINUOUS_80MM": TestEntry(
             "JAM_CONTINUOUS_80MM", 
             False, 
             test_jamTestingContinuousMode, 
-            [ser, device, 6, 80]),  #args: ser,device, quantity, mm
+            [ser, device, 6, 80], paper=80, monitored=True),  #args: ser,device, quantity, mm
         "PRINT_QUALITY": TestEntry(
             "PRINT_QUALITY",
             False, 
@@ -174,67 +157,139 @@ if __name__ == "__main__":
             "FONTS", 
             False, 
             test_fonts, 
-            [ser, device]),  #args: ser,device, quantity
+            [ser, device], external_config=True),  #args: ser,device, quantity
         "DUPLICATE_KEY": TestEntry(
             "DUPLICATE_KEY", 
             False, 
             test_SENTRY_duplicateKeywords, 
-            [ser, device]),  #args: ser,device, quantity
+            [ser, device], paired=True),  #args: ser,device, quantity
         "SENTRY_CONFIG": TestEntry(  
             "SENTRY_CONFIG", 
             False, 
             test_SENTRY_config, 
-            [ser, device]),  #args: ser,device, quantity       
+            [ser, device], paper=80, paired=True),  #args: ser,device, quantity       
         "SENTRY_QRTS": TestEntry(  
             "SENTRY_QRTS", 
             False, 
             test_SENTRY_qrTimeStamp, 
-            [ser, device]),  #args: ser,device, quantity  
+            [ser, device], paired=True),  #args: ser,device, quantity  
         "ESC_POS": TestEntry(  
             "ESC_POS", 
             False, 
             test_ESCPOS, 
-            [ser, device]),  #args: ser,device, quantity
+            [ser, device], paired=None, unpairs=True),  #args: ser,device, quantity
         "PAGE_ESC_POS": TestEntry(  
             "PAGE_ESC_POS", 
             False, 
             test_pageESCPOS, 
-            [ser, device]),  #args: ser,device, quantity      
+            [ser, device], paired=None, unpairs=True),  #args: ser,device, quantity      
     }
 
-print ("Welcome to the Reliance Test Suite!\n")
-while True:
-    selection = input("Run all tests (r)\nSelect specific tests (s)\nEnter: ").strip().lower()
-    if selection != "r" and selection != "s":
-        print("Invalid input. Please enter 'r' or 's'.")
-        continue
-    break
-
-tests_todo = []
-tests_completed = []
-if selection == "s":
-    print("Available tests:")
-    for test_name in TESTS.keys():
-        print(f"- {test_name}")
-    while True:
-        selected_tests = input("Enter the names of the tests you want to run (comma-separated): ").strip().split(",")
-        selected_tests = [test.strip() for test in selected_tests if test.strip() in TESTS]
-        if not selected_tests:
-            print("No valid tests selected. Please try again.")
-            continue
-        break
 
-    tests_todo = [TESTS[test_name] for test_name in selected_tests] 
-elif selection == "r": 
-    for test_name, test_entry in TESTS.items():  
-        tests_todo.append(test_entry)  
+def port_name(port):
+    port = str(port)
+    return 'COM' + port if port.isdigit() else port
+
+
+def open_devices(port, hid_path=None, baud=baudrate):
+    """
+    Opens the serial port and the USB HID device. Raises on failure.
+    Ticket data goes through a SerialWriter that coalesces small writes.
+    """
+    # Open serial port
+    ser = ObservedSerial(serial.Serial(port_name(port), baud, timeout=1))
+    try: 
+        device = open_hid(hid_path)
+    except Exception:
+        ser.close()
+        raise
+    return SerialWriter(ser, baud, device=device), device
+
+
+def open_hid(hid_path=None):
+    """Opens the USB HID device (the first Reliance printer if no path is given). Raises on failure."""
+    device = hid.device()
+    if hid_path:
+        device.open_path(hid_path.encode() if isinstance(hid_path, str) else hid_path)
+    else:
+        device.open(VENDOR_ID, PRODUCT_ID)
+    device.set_nonblocking(0)  # 0 means blocking mode
+    return device
+
 
-try:        
+def printer_id(port, device):
+    """Port plus USB serial number, to tell whether a checkpoint belongs to this printer."""
+    try:
+        serial_number = device.get_serial_number_string()
+    except Exception:
+        serial_number = None
+    return f"{port_name(port)} {serial_number}" if serial_number else port_name(port)
+
+
+def prepare_printer(device, baud=baudrate):
+    """Pings the printer and sets the serial config. :return: True on success"""
+    # Ping to check if the device is connected
+    response = write_command(device, "PING")
+    if response == "NAK":
+        print("Device not responding")
+        return False
+    else:
+        print("Device connected")
+    # Set serial config 
+    # 19200 baud (or `baud`, see --baud-sweep), 8N1, no handshaking
+    if baud == 19200:
+        response = write_command(device, "SET_SERIAL")
+    else:
+        response = write_command(device, "SET_SERIAL_CONFIG", {"baud": baud})
+    if response == "NAK":
+        print("Failed to set serial configuration")
+        return False
+    else:
+        print("Serial configuration set\n")
+    return True
+
+
+def run_tests(tests_todo, repeat_failed=None, scheduler=None, results=None, checkpoint=None, tracer=None,
+              monitor=None):
+    """
+    Runs tests until they pass or the operator stops repeating failures.
+    :param repeat_failed: number of automatic reruns; None asks the operator
+    :param scheduler: optional scheduler.Scheduler that reorders each pass
+    :param results: optional results.ResultsWriter that records every test as it finishes
+    :param checkpoint: optional checkpoint.Checkpoint saved after every test
+    :param tracer: optional tracer.TicketTracer, told which test is running
+    :param monitor: optional faults.FaultMonitor, fails monitored tests on a printer fault
+    :return: tests_completed, in completion order
+    """
+    tests_completed = []
     while tests_todo:
+        if scheduler is not None:
+            tests_todo = scheduler.order(tests_todo)
         # Iterate through all tests and run them
         for test_entry in tests_todo[:]:  
             print(f"\nRunning {test_entry.name}...")  
-            test_entry.run()  #
+            if scheduler is not None:
+                scheduler.before(test_entry)
+            step = results.begin(test_entry.name) if results is not None else None
+            if checkpoint is not None:
+                checkpoint.begin(test_entry)
+            if tracer is not None:
+                tracer.begin(test_entry)
+            if monitor is not None:
+                monitor.begin(test_entry)
+            try:
+                test_entry.run()  #
+                if monitor is not None:
+                    monitor.end(test_entry)
+            finally:
+                if step is not None:
+                    results.end(step, test_entry.success, test_entry.deferred, test_entry.verdict)
+            if scheduler is not None:
+                scheduler.after(test_entry)
+            if checkpoint is not None:
+                checkpoint.end(test_entry)
+            if tracer is not None:
+                tracer.end(test_entry)
             print("--------------------------------------")
 
         # Print results of all tests
@@ -245,7 +300,7 @@ try:
                 if test_entry in tests_completed:
                     tests_completed.remove(test_entry)  
                 tests_completed.append(test_entry) 
-                print(f"{test_entry.name} ... PASSED")
+                print(f"{test_entry.name} ... {test_entry.verdict}")
             else:
                 if test_entry in tests_completed:
                     tests_completed.remove(test_entry)                  
@@ -254,8 +309,17 @@ try:
             print("*************************************")
         
         if not tests_todo:
-            print("\nAll tests passed!")
+            deferred = sum(1 for entry in tests_completed if entry.deferred)
+            if deferred:
+                print(f"\n{len(tests_completed) - deferred} passed, {deferred} deferred")
+            else:
+                print("\nAll tests passed!")
             break
+        elif repeat_failed is not None:
+            if repeat_failed <= 0:
+                break
+            repeat_failed -= 1
+            print("Repeating failed tests...\n")
         else:
             while True:
                 status = input(f"Repeat failed tests? (y/n): ").strip().lower()
@@ -267,22 +331,343 @@ try:
                 break
             else:
                 print("Repeating failed tests...\n")
-    
-    with open("test_results.txt", "w") as results_file:
+    if scheduler is not None:
+        scheduler.report()
+    return tests_completed
+
+
+def make_scheduler(config, device):
+    if not config.get("schedule"):
+        return None
+    return Scheduler(device, paper=config.get("paper", 58))
+
+
+def make_poller(config, device):
+    """Status poller for the tracer, shared with the fault monitor, if tracing is on."""
+    if not config.get("trace"):
+        return None
+    poller = StatusPoller(device, rate_hz=config.get("trace_hz", 20))
+    poller.start()
+    return poller
+
+
+def make_tracer(config, ser, poller):
+    if not config.get("trace"):
+        return None
+    return TicketTracer(poller, ser)
+
+
+def make_monitor(config, ser, device, poller=None):
+    """Without a poller the monitor polls on its own, only during monitored tests."""
+    if not config.get("fault_monitor", True):
+        return None
+    return FaultMonitor(poller, ser, device, rate_hz=config.get("trace_hz", 20))
+
+
+def close_tracer(tracer, path):
+    tracer.close()
+    tracer.report()
+    tracer.dump(path)
+    print(f"Ticket traces saved to {path}")
+
+
+def make_results(config, base, **properties):
+    """Streaming per-test results (JSONL events + JUnit XML) next to test_results.txt."""
+    return ResultsWriter(config.get("jsonl", base + ".jsonl"), config.get("junit", base + ".xml"),
+                         properties=properties).start()
+
+
+def write_results(tests_completed, path="test_results.txt"):
+    with open(path, "w") as results_file:
         results_file.write(f"    RELIANCE FIRMWARE\n      TEST RESULTS\n*************************")
         for test_entry in tests_completed:
-            status = "PASSED" if test_entry.success else ">FAILED<"
+            status = test_entry.verdict if test_entry.success else ">FAILED<"
             results_file.write(f"\n{test_entry.name}: {status}\n*************************")
-    print ("\nTest results saved to test_results.txt")
-    
-finally:
-    if ser.is_open:
-        ser.close()
-        print("\nSerial connection closed.")
+    print (f"\nTest results saved to {path}")
+
+
+def check_expectations(tests_completed, expect):
+    """Compares verdicts with the outcomes expected up front. :return: list of mismatches"""
+    verdicts = {entry.name: entry.verdict for entry in tests_completed}
+    mismatches = []
+    for name, expected in expect.items():
+        actual = verdicts.get(name, "NOT RUN")
+        if actual != expected.upper():
+            mismatches.append((name, expected.upper(), actual))
+            print(f"EXPECTATION MISMATCH: {name} expected {expected.upper()}, got {actual}")
+    return mismatches
+
+
+def select_tests_interactive(TESTS):
+    while True:
+        selection = input("Run all tests (r)\nSelect specific tests (s)\nEnter: ").strip().lower()
+        if selection != "r" and selection != "s":
+            print("Invalid input. Please enter 'r' or 's'.")
+            continue
+        break
+
+    if selection == "s":
+        print("Available tests:")
+        for test_name in TESTS.keys():
+            print(f"- {test_name}")
+        while True:
+            selected_tests = input("Enter the names of the tests you want to run (comma-separated): ").strip().split(",")
+            selected_tests = [test.strip() for test in selected_tests if test.strip() in TESTS]
+            if not selected_tests:
+                print("No valid tests selected. Please try again.")
+                continue
+            break
+        return [TESTS[test_name] for test_name in selected_tests] 
+    return list(TESTS.values())
+
+
+def select_tests(TESTS, names):
+    unknown = [name for name in names if name not in TESTS]
+    if unknown:
+        raise SystemExit(f"Unknown test(s): {', '.join(unknown)}. Available: {', '.join(TESTS)}")
+    return [TESTS[name] for name in names]
+
+
+EXIT_DEFERRED = 3      # Nothing failed, but some verdicts are still waiting for a human
+
+
+def exit_code(tests_completed, config, mismatches=()):
+    """
+    1 on a failed test or an unmet expectation, EXIT_DEFERRED if verdicts were
+    left deferred (0 with "deferred_ok" or when "expect" lists what to expect), else 0.
+    """
+    if config.get("expect"):
+        return 1 if mismatches else 0
+    if any(not entry.success for entry in tests_completed):
+        return 1
+    if any(entry.deferred for entry in tests_completed) and not config.get("deferred_ok"):
+        return EXIT_DEFERRED
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Reliance firmware regression suite")
+    parser.add_argument("--headless", action="store_true",
+                        help="run unattended: no prompts, automatic or deferred verdicts")
+    parser.add_argument("--config", help="JSON run config (see top of RelianceTestSuite.py)")
+    parser.add_argument("--port", help="serial port, e.g. COM3, 3 or /dev/ttyUSB0")
+    parser.add_argument("--hid-path", help="HID device path, if several printers are attached")
+    parser.add_argument("--tests", help="comma-separated test names (default: all)")
+    parser.add_argument("--list", action="store_true", help="list test names and exit")
+    parser.add_argument("--fresh", action="store_true",
+                        help="start over instead of resuming an interrupted run")
+    parser.add_argument("--metrics", action="store_true",
+                        help="collect per-command latency histograms and ACK/NAK/timeout counts")
+    parser.add_argument("--schedule", action="store_true",
+                        help="reorder tests to minimise paper swaps and repeated settings")
+    parser.add_argument("--fleet", action="store_true",
+                        help="run headless on every attached printer in parallel")
+    parser.add_argument("--trace", action="store_true",
+                        help="trace every ticket through print, cut, present and removal (p50/p95 per phase)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="measure print throughput across quality, density, paper and ticket length")
+    parser.add_argument("--flash", metavar="FILE",
+                        help="update the printer firmware first; tests run afterwards only if --tests/config name them")
+    parser.add_argument("--soak", action="store_true",
+                        help="endurance run: print tickets until the configured count or Ctrl+C, with streaming stats")
+    parser.add_argument("--baud-sweep", action="store_true",
+                        help="try every serial baud rate and recommend the fastest one that printed cleanly")
+    parser.add_argument("--golden", metavar="DIR",
+                        help="check rendered tickets against golden images in DIR (recorded on first run)")
+    return parser.parse_args(argv)
+
+
+def load_config(args):
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    if args.port:
+        config["port"] = args.port
+    if args.hid_path:
+        config["hid_path"] = args.hid_path
+    if args.tests:
+        config["tests"] = [name.strip() for name in args.tests.split(",") if name.strip()]
+    config["schedule"] = args.schedule or config.get("schedule", False)
+    config["metrics"] = args.metrics or config.get("metrics", False)
+    config["trace"] = args.trace or config.get("trace", False)
+    if args.golden:
+        config["golden"] = args.golden
+    config["headless"] = args.headless or args.fleet or config.get("headless", False)
+    return config
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        for test_name in build_tests(None, None):
+            print(test_name)
+        return 0
+    config = load_config(args)
+    if args.fresh and os.path.exists(config.get("checkpoint", "checkpoint.json")):
+        os.remove(config.get("checkpoint", "checkpoint.json"))
+    if config["metrics"]:
+        metrics.enable()
+    if config.get("golden"):
+        render.goldens = render.Goldens(config["golden"], config.get("golden_tolerance", 0.001))
+    if args.fleet:
+        import fleet
+        return fleet.run_fleet(config)
+    headless = config["headless"]
+    if headless:
+        if "port" not in config:
+            print("Headless mode needs a serial port (--port or \"port\" in --config)")
+            return 2
+        prompts.use_headless(config.get("answers"))
+
+    print(r"""
+  ____      _ _                                    
+ |  _ \ ___| (_) __ _ _ __   ___ ___               
+ | |_) / _ \ | |/ _` | '_ \ / __/ _ \              
+ |  _ <  __/ | | (_| | | | | (_|  __/              
+ |_|_\_\___|_|_|\__,_|_| |_|\___\___|              
+ |  _ \ ___  __ _ _ __ ___  ___ ___(_) ___  _ __   
+ | |_) / _ \/ _` | '__/ _ \/ __/ __| |/ _ \| '_ \  
+ |  _ <  __/ (_| | | |  __/\__ \__ \ | (_) | | | | 
+ |_| \_\___|\__, |_|  \___||___/___/_|\___/|_| |_| 
+   ____ _   |___/                                  
+  / ___| |   |_ _|                                 
+ | |   | |    | |                                  
+ | |___| |___ | |                                  
+  \____|_____|___|                      
+    """)
+    print("Setup:" \
+    "\n- Connect the printer to the computer via USB HID" \
+    "\n- Connect the printer to the computer via Serial USB -> RS232 (note the COM#)" \
+    "\n- Load 56mm paper into the printer. Have 80mm paper ready" \
+    "\n- Place the printer on the edge of your desk with the disposal below exposed" \
+    "\n- Locate main.bin, copy its location" \
+    )
+    while True:
+        if "port" in config:
+            SERIAL_PORT = port_name(config["port"])
+        else:
+            com_num = input("Enter COM port NUMBER for serial connection (e.g., 3): ")
+            if not com_num.isdigit():
+                print("Invalid input. Please enter a numeric value.")
+                continue
+            SERIAL_PORT = 'COM' + com_num
+        try: 
+            ser, device = open_devices(SERIAL_PORT, config.get("hid_path"), config.get("baudrate", baudrate))
+            break
+        except Exception as e:
+            print(f"Error opening {SERIAL_PORT} / USB HID device: {e}")
+            if "port" in config:
+                return 1
+            continue
+
+    # Record all HID and serial traffic so failures can be inspected afterwards
+    # (python capture.py summary <file>)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    recorder = CaptureRecorder(f"capture_{stamp}.rtscap").start()
+
     try:
-        device.close()
-        print("USB HID device closed.\n")
-    except Exception:
-        pass
+        print ("\n========================")
+        if not prepare_printer(device, config.get("baudrate", baudrate)):
+            return 1
+        
+        print ("CONNECTION SUCCESSFUL")
+        if args.flash:
+            import flash
+            try:
+                device = flash.flash_firmware(device, args.flash, config.get("flash"),
+                                              reopen=lambda: open_hid(config.get("hid_path")))
+            except (transport.TransferError, ValueError) as e:
+                print(f"Flash update failed: {e}")
+                return 1
+            ser.device = device
+            if not prepare_printer(device, config.get("baudrate", baudrate)):
+                return 1
+        if config.get("logo"):
+            import logo
+            if not logo.upload_config(device, config["logo"]):
+                return 1
+        if args.flash and "tests" not in config:
+            return 0
+        if args.benchmark:
+            import benchmark
+            benchmark.run_benchmark(ser, device, config.get("benchmark"))
+            return 0
+        if args.soak:
+            import soak
+            soak.run_soak(ser, device, config.get("soak"))
+            return 0
+        if args.baud_sweep:
+            import baudsweep
+            baudsweep.run_sweep(ser, device, SERIAL_PORT, config.get("baud_sweep"))
+            return 0
+        print ("BEGINNING TESTS")
+        print ("========================\n")
+        
+        TESTS = build_tests(ser, device)
+
+        print ("Welcome to the Reliance Test Suite!\n")
+        if "tests" in config:
+            tests_todo = select_tests(TESTS, config["tests"])
+        elif headless:
+            tests_todo = list(TESTS.values())
+        else:
+            tests_todo = select_tests_interactive(TESTS)
 
+        repeat_failed = config.get("repeat_failed", 0 if headless else None)
+        checkpoint = Checkpoint(config.get("checkpoint", "checkpoint.json"), printer_id(SERIAL_PORT, device), device)
+        finished, tests_todo = checkpoint.resume(tests_todo)
+        scheduler = make_scheduler(config, device)
+        results = make_results(config, "results_" + stamp, port=SERIAL_PORT)
+        poller = make_poller(config, device)
+        tracer = make_tracer(config, ser, poller)
+        monitor = make_monitor(config, ser, device, poller)
+        try:
+            tests_completed = finished + run_tests(tests_todo, repeat_failed, scheduler, results, checkpoint, tracer,
+                                                   monitor)
+            checkpoint.finish()
+        finally:
+            if monitor is not None:
+                monitor.close()
+                monitor.report()
+            if tracer is not None:
+                close_tracer(tracer, f"trace_{stamp}.jsonl")
+            if poller is not None:
+                poller.stop()
+            results.close()
+            print(f"Step timings saved to {results.jsonl_path} and {results.junit_path}")
+            if scheduler is not None:
+                scheduler.close()
+            checkpoint.close()
+        write_results(tests_completed, config.get("results", "test_results.txt"))
 
+        if headless:
+            deferred_path = config.get("deferred", "deferred_verdicts.json")
+            prompts.current().save_deferred(deferred_path)
+            print(f"{len(prompts.current().deferred)} deferred verdict(s) saved to {deferred_path}")
+        mismatches = check_expectations(tests_completed, config.get("expect", {}))
+        return exit_code(tests_completed, config, mismatches)
+        
+    finally:
+        if ser.is_open:
+            ser.flush()
+            ser.report()
+        recorder.close()
+        print(f"\nTraffic capture saved to {recorder.path}")
+        if metrics.enabled:
+            print()
+            metrics.report()
+            metrics.dump(f"metrics_{stamp}.json")
+            print(f"Command metrics saved to metrics_{stamp}.json")
+        if ser.is_open:
+            ser.close()
+            print("\nSerial connection closed.")
+        try:
+            device.close()
+            print("USB HID device closed.\n")
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
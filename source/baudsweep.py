@@ -0,0 +1,181 @@
+"""
+Serial baud rate characterization.
+
+Steps the printer and the host port through the baud rates the firmware
+accepts (SET_SERIAL_CONFIG over HID, which does not depend on the serial
+settings). At each rate it prints `tickets` tickets of ESC/POS text that end
+in a CRC32 line of their own content, and checks automatically that:
+  - every ticket was printed and presented (status polling),
+  - no error flag came up.
+The printer does not send back what it printed, so corrupted bytes are not
+detected: the recommendation covers presentation and error flags only.
+Compare the printed CRC32 lines (by scanner, or the text by eye) before
+relying on a rate. Whether GET_SERIAL reports the new rate back is recorded
+too, but not required, as its layout is not documented.
+Sustained throughput is measured on the raw port, without SerialWriter's
+pacing, from the first byte of each ticket to the port draining it. The
+fastest rate that passed every check is recommended, per host serial
+adapter; results accumulate in baud_sweep.json so several adapters can be
+compared. The printer and port are set back to the rate the run started
+with at the end.
+
+Run with --baud-sweep; options come from the "baud_sweep" key of the run config:
+    "baud_sweep": {"rates": [19200, 38400, 57600, 115200], "tickets": 3, "lines": 30}
+Then run the suite at the recommended rate with "baudrate": <rate>.
+"""
+import datetime
+import json
+import os
+import time
+import zlib
+
+from serial.tools import list_ports
+
+from benchmark import TicketTimer
+from commands import BAUD_RATES, write_command
+from statusPoller import StatusPoller
+from waits import drain_serial, read_status, wait_until_ready
+
+DEFAULTS = {
+    "rates": list(BAUD_RATES),
+    "tickets": 3,
+    "lines": 30,
+    "poll_hz": 50,
+    "timeout": 30.0,
+}
+RESULTS_FILE = "baud_sweep.json"
+PRINTABLE = bytes(range(0x21, 0x7F))
+
+
+def adapter_name(port):
+    """Host adapter behind a serial port, e.g. 'USB-Serial Controller [067B:2303]'."""
+    for info in list_ports.comports():
+        if info.device == port:
+            ids = f" [{info.vid:04X}:{info.pid:04X}]" if info.vid is not None else ""
+            return f"{info.description}{ids}"
+    return port
+
+
+def payload(rate, index, lines):
+    """:return: ticket bytes ending in a CRC32 line over everything before it"""
+    body = bytearray(b"\x1b@\x1bE\x01" + f"BAUD {rate} TICKET {index + 1}".encode("ascii") + b"\x1bE\x00\n")
+    for line in range(lines):
+        # Every printable character, rotated per line so each line differs
+        shift = line % len(PRINTABLE)
+        body += f"{line + 1:03d} ".encode("ascii") + (PRINTABLE[shift:] + PRINTABLE[:shift])[:44] + b"\n"
+    return bytes(body) + f"CRC32 {zlib.crc32(body):08X} LEN {len(body)}\n".encode("ascii") + b"\x0c"
+
+
+def reported_rate(device, rate):
+    """:return: True/False if GET_SERIAL does/doesn't contain `rate`, None if it cannot be read"""
+    response = write_command(device, "GET_SERIAL")
+    if response == "NAK":
+        return None
+    return rate.to_bytes(4, "little") in bytes(response[1])
+
+
+def try_rate(ser, device, timer, rate, settings):
+    """:return: result dict for one rate"""
+    result = {"rate": rate, "supported": True, "reported": None, "tickets": settings["tickets"], "confirmed": 0,
+              "missed": 0, "errors": [], "bytes": 0, "Bps": None, "line_Bps": rate / 10}
+    if write_command(device, "SET_SERIAL_CONFIG", {"baud": rate}) == "NAK":
+        print(f"{rate}: printer refused the rate")
+        result["supported"] = False
+        return result
+    ser.set_baudrate(rate)
+    result["reported"] = reported_rate(device, rate)
+    if result["reported"] is False:
+        print(f"{rate}: GET_SERIAL does not show the new rate")
+
+    # Throughput is timed on the port itself; SerialWriter would pace it to the line rate
+    port = getattr(ser, "ser", ser)
+    wire_s = 0.0
+    wait_until_ready(device)
+    for index in range(settings["tickets"]):
+        data = payload(rate, index, settings["lines"])
+        drain_serial(ser)
+        timer.arm()
+        start = time.monotonic()
+        port.write(data)
+        port.flush()
+        wire_s += time.monotonic() - start
+        result["bytes"] += len(data)
+        timer.wait(settings["timeout"])
+        if timer.error is not None:
+            result["errors"].append(f"0x{timer.error.error_status:02X}")
+            print(f"{rate}: printer error on ticket {index + 1}: {timer.error}")
+            break
+        if timer.presented is None:
+            result["missed"] += 1
+        else:
+            result["confirmed"] += 1
+        wait_until_ready(device)
+
+    status = read_status(device)
+    if status is not None and status.error_status and not result["errors"]:
+        result["errors"].append(f"0x{status.error_status:02X}")
+    result["Bps"] = result["bytes"] / wire_s if wire_s > 0 else None
+    return result
+
+
+def passed(result):
+    return result["supported"] and not result["errors"] and result["confirmed"] == result["tickets"]
+
+
+def report(adapter, rows, best):
+    print(f"\nSerial rates, {adapter}:")
+    print(f"{'BAUD':>7}{'OK':>4}{'TICKETS':>9}{'ERRORS':>8}{'B/S':>8}{'% LINE':>8}")
+    for row in rows:
+        rate = f"{row['Bps']:>8.0f}{100 * row['Bps'] / row['line_Bps']:>7.0f}%" if row["Bps"] else f"{'-':>8}{'-':>8}"
+        print(f"{row['rate']:>7}{'yes' if passed(row) else 'no':>4}"
+              f"{row['confirmed']:>5}/{row['tickets']:<3}{len(row['errors']) + row['missed']:>8}{rate}")
+    if best is None:
+        print("No rate passed every check")
+    else:
+        print(f"Fastest rate with every ticket presented and no errors: {best} baud "
+              f"(set \"baudrate\": {best} in the run config once its CRC32 lines check out)")
+
+
+def save(adapter, rows, best, path=RESULTS_FILE):
+    """Adds this adapter's results to the results file, keeping other adapters'."""
+    saved = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+    saved[adapter] = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                      "recommended": best, "results": rows}
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(tmp, path)
+
+
+def run_sweep(ser, device, port, options=None):
+    """
+    :param options: overrides of DEFAULTS
+    :return: recommended baud rate, or None
+    """
+    settings = dict(DEFAULTS, **(options or {}))
+    for rate in settings["rates"]:
+        if rate not in BAUD_RATES:
+            raise ValueError(f"Unsupported baud rate {rate}, expected one of {', '.join(map(str, BAUD_RATES))}")
+    adapter = adapter_name(port)
+    original = ser.baudrate
+    print(f"Sweeping serial rates {settings['rates']} on {adapter}")
+    rows = []
+    with StatusPoller(device, rate_hz=settings["poll_hz"]) as poller:
+        timer = TicketTimer(poller)
+        try:
+            for rate in sorted(settings["rates"]):
+                rows.append(try_rate(ser, device, timer, rate, settings))
+        finally:
+            timer.close()
+            if write_command(device, "SET_SERIAL_CONFIG", {"baud": original}) == "NAK":
+                print(f"Could not set the printer back to {original} baud")
+            ser.set_baudrate(original)
+
+    best = max((row["rate"] for row in rows if passed(row)), default=None)
+    report(adapter, rows, best)
+    save(adapter, rows, best)
+    print(f"Results saved to {RESULTS_FILE}")
+    return best
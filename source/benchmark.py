@@ -0,0 +1,245 @@
+"""
+Print throughput benchmark.
+
+Sweeps print quality, print density, paper width and ticket length, prints
+`repeat` tickets per combination and times each one from the moment its last
+byte has left the serial port until the printer reports it Presented. Status
+comes from a StatusPoller, so the resolution is 1 / poll_hz seconds. Every
+combination is reported as tickets/min and mm/s (ticket length from the
+rendered ticket) with 95% confidence intervals, tagged with the firmware
+revision from GET_REVLEV, and saved to benchmark_<revision>_<time>.json.
+
+Run with --benchmark; the sweep comes from the "benchmark" key of the run config:
+    "benchmark": {"qualities": ["NORMAL", "HIGH_QUALITY", "HIGH_SPEED"],
+                  "densities": [100, 160], "papers": [80], "lines": [10, 40],
+                  "repeat": 5, "poll_hz": 50}
+Changing paper width asks the operator to load the paper.
+"""
+import datetime
+import itertools
+import json
+import math
+import threading
+import time
+from collections import namedtuple
+
+from commands import PAPER_SIZES, write_command
+from prompts import pause
+from render import DPI, Renderer
+from statusPoller import StatusPoller
+from waits import BUSY_STATES, drain_serial, wait_until_ready
+
+DEFAULTS = {
+    "qualities": ["NORMAL", "HIGH_QUALITY", "HIGH_SPEED"],
+    "densities": [100],
+    "papers": [80],
+    "lines": [10, 40],
+    "repeat": 5,
+    "poll_hz": 50,
+    "timeout": 30.0,
+}
+DEFAULT_DENSITY = 100
+DEFAULT_QUALITY = "NORMAL"
+DEFAULT_PAPER = 80
+
+# Two-sided 95% Student t critical values by degrees of freedom
+T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+       10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042, 60: 2.000}
+
+Condition = namedtuple("Condition", "paper quality density lines")
+
+
+def t95(df):
+    if df < 1:
+        return math.nan
+    return T95[max(k for k in T95 if k <= df)] if df <= 60 else 1.96
+
+
+def mean_ci(values):
+    """:return: (mean, half width of the 95% confidence interval) of a sample"""
+    n = len(values)
+    if not n:
+        return None, None
+    mean = sum(values) / n
+    if n < 2:
+        return mean, None
+    sd = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    return mean, t95(n - 1) * sd / math.sqrt(n)
+
+
+def ticket(lines, paper):
+    """:return: (ticket bytes, printed length in mm)"""
+    data = b"".join(f"BENCHMARK LINE {i + 1:03d} {'=' * 20}\n".encode("ascii") for i in range(lines)) + b"\x0c"
+    renderer = Renderer(paper)
+    renderer.feed(data)
+    return data, renderer.tickets[0].shape[0] * 25.4 / DPI
+
+
+class TicketTimer:
+    """Times tickets from their last serial byte to Presented, from StatusPoller samples."""
+    def __init__(self, poller):
+        self.poller = poller
+        self._done = threading.Event()
+        self._started = False
+        self.presented = None
+        self.error = None
+        poller.subscribe(self._on_status)
+
+    def arm(self):
+        self._started = False
+        self.presented = None
+        self.error = None
+        self._done.clear()
+
+    def _on_status(self, t, record):
+        if self._done.is_set():
+            return
+        if record.error_status:
+            self.error = record
+            self._done.set()
+        elif record.ticket_state in BUSY_STATES:
+            self._started = True
+        elif self._started and record.ticket_state == "Presented":
+            self.presented = t
+            self._done.set()
+
+    def wait(self, timeout):
+        """:return: monotonic time the ticket was presented, None on timeout or error"""
+        self._done.wait(timeout)
+        return self.presented
+
+    def close(self):
+        self.poller.unsubscribe(self._on_status)
+
+
+def firmware_revision(device):
+    response = write_command(device, "GET_REVLEV")
+    if response == "NAK":
+        return "unknown"
+    data = bytes(response[1]).rstrip(b"\x00")
+    if data and all(32 <= b < 127 for b in data):
+        return data.decode("ascii").strip()
+    return data.hex()
+
+
+def paper_size(device):
+    """:return: configured paper width in mm, DEFAULT_PAPER if the printer does not say"""
+    response = write_command(device, "GET_PAPER_SIZE")
+    if response == "NAK" or not response[1] or response[1][0] not in PAPER_SIZES.values():
+        return DEFAULT_PAPER
+    return response[1][0]
+
+
+def conditions(settings):
+    """All combinations, paper outermost so the operator swaps paper as rarely as possible."""
+    for paper, quality, density, lines in itertools.product(
+            settings["papers"], settings["qualities"], settings["densities"], settings["lines"]):
+        yield Condition(paper, quality.upper(), density, lines)
+
+
+def apply(device, condition, loaded):
+    """Sets up the printer for a condition. :return: False on NAK"""
+    if condition.paper != loaded:
+        pause(f">>LOAD {condition.paper}MM PAPER<<\nPress Enter when it is loaded...")
+        if write_command(device, "SET_PAPER_SIZE", f"{condition.paper}MM") == "NAK":
+            print(f"Failed to set paper size {condition.paper}MM")
+            return False
+    if write_command(device, f"SET_PRINT_QUALITY_{condition.quality}") == "NAK":
+        print(f"Failed to set print quality {condition.quality}")
+        return False
+    if write_command(device, "SET_PRINT_DENSITY", condition.density) == "NAK":
+        print(f"Failed to set print density {condition.density}")
+        return False
+    return True
+
+
+def measure(ser, device, timer, condition, repeat, timeout):
+    """Prints `repeat` tickets. :return: result dict for the condition"""
+    data, length_mm = ticket(condition.lines, condition.paper)
+    seconds = []
+    missed = 0
+    for _ in range(repeat):
+        wait_until_ready(device)
+        timer.arm()
+        ser.write(data)
+        drain_serial(ser)
+        sent = time.monotonic()
+        presented = timer.wait(timeout)
+        if timer.error is not None:
+            print(f"Printer error during benchmark: {timer.error}")
+            break
+        if presented is None:
+            missed += 1
+            continue
+        seconds.append(max(presented - sent, 1e-3))
+    per_min, per_min_ci = mean_ci([60 / s for s in seconds])
+    mm_s, mm_s_ci = mean_ci([length_mm / s for s in seconds])
+    return {
+        **condition._asdict(),
+        "length_mm": round(length_mm, 1),
+        "tickets": len(seconds),
+        "missed": missed,
+        "seconds": [round(s, 4) for s in seconds],
+        "tickets_per_min": per_min,
+        "tickets_per_min_ci95": per_min_ci,
+        "mm_per_s": mm_s,
+        "mm_per_s_ci95": mm_s_ci,
+    }
+
+
+def _cell(mean, ci):
+    if mean is None:
+        return f"{'-':>16}"
+    return f"{mean:>8.1f} ±{ci:>6.1f}" if ci is not None else f"{mean:>8.1f}        "
+
+
+def report(revision, rows):
+    print(f"\nThroughput, firmware {revision}:")
+    print(f"{'PAPER':>5} {'QUALITY':<13}{'DENSITY':>7}{'LINES':>6}{'MM':>7}{'N':>4}"
+          f"{'TICKETS/MIN':>17}{'MM/S':>17}")
+    for row in rows:
+        print(f"{row['paper']:>5} {row['quality']:<13}{row['density']:>7}{row['lines']:>6}{row['length_mm']:>7.1f}"
+              f"{row['tickets']:>4} {_cell(row['tickets_per_min'], row['tickets_per_min_ci95'])}"
+              f" {_cell(row['mm_per_s'], row['mm_per_s_ci95'])}")
+
+
+def run_benchmark(ser, device, options=None):
+    """
+    :param options: overrides of DEFAULTS
+    :return: path of the JSON result file
+    """
+    settings = dict(DEFAULTS, **(options or {}))
+    revision = firmware_revision(device)
+    print(f"Benchmarking firmware {revision}")
+    rows = []
+    start = paper_size(device)
+    loaded = start
+    with StatusPoller(device, rate_hz=settings["poll_hz"]) as poller:
+        timer = TicketTimer(poller)
+        try:
+            for condition in conditions(settings):
+                if not apply(device, condition, loaded):
+                    break
+                loaded = condition.paper
+                rows.append(measure(ser, device, timer, condition, settings["repeat"], settings["timeout"]))
+                last = rows[-1]
+                print(f"{condition}: {last['tickets']} ticket(s), "
+                      f"{_cell(last['tickets_per_min'], last['tickets_per_min_ci95']).strip()} tickets/min")
+        finally:
+            timer.close()
+            write_command(device, f"SET_PRINT_QUALITY_{DEFAULT_QUALITY}")
+            write_command(device, "SET_PRINT_DENSITY", DEFAULT_DENSITY)
+            if loaded != start:
+                pause(f">>LOAD {start}MM PAPER<<\nPress Enter when it is loaded...")
+                if write_command(device, "SET_PAPER_SIZE", f"{start}MM") == "NAK":
+                    print(f"Failed to restore paper size {start}MM")
+
+    report(revision, rows)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in revision)
+    path = f"benchmark_{safe}_{stamp}.json"
+    with open(path, "w") as f:
+        json.dump({"firmware": revision, "time": stamp, "settings": settings,
+                   "resolution_s": 1 / settings["poll_hz"], "results": rows}, f, indent=2)
+    print(f"Benchmark saved to {path}")
+    return path
@@ -0,0 +1,116 @@
+"""
+Content-addressed cache for generated artifacts (ESC/POS streams, logo bitmaps).
+
+Entries are keyed by the SHA-256 of a canonical JSON encoding of everything
+that determines the output: the spec, the namespace and the generator
+version. The same spec always maps to the same file, and bumping the
+version of a generator makes it stop serving bytes it would no longer
+produce. Files are written atomically through a unique temporary file, so
+concurrent runs and the threads of one (fleet mode) can share a cache folder.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get("RELIANCE_CACHE", os.path.join(os.getcwd(), "cache"))
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"hex": bytes(value).hex()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Cannot use {type(value).__name__} in a cache key")
+
+
+def digest(spec):
+    """:return: hex SHA-256 of the canonical JSON encoding of spec"""
+    text = json.dumps(spec, sort_keys=True, separators=(",", ":"), default=_encode)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ContentCache:
+    """
+    :param namespace: sub folder and part of every key, e.g. "escpos"
+    :param version: bump when the generator output changes
+    :param memory: entries kept in memory besides the files (least recently used dropped)
+    """
+    def __init__(self, namespace, version=1, root=None, suffix=".bin", memory=256):
+        self.namespace = namespace
+        self.version = version
+        self.folder = os.path.join(root or CACHE_DIR, namespace)
+        self.suffix = suffix
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()       # Guards _recent and the counters
+
+    def key(self, spec):
+        return digest({"namespace": self.namespace, "version": self.version, "spec": spec})
+
+    def path(self, key):
+        # Two level fan-out keeps folders small with thousands of entries
+        return os.path.join(self.folder, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """:return: cached bytes or None"""
+        with self._lock:
+            data = self._recent.get(key)
+            if data is not None:
+                self._recent.move_to_end(key)
+                return data
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(path) + ".", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._remember(key, bytes(data))
+        return path
+
+    def get_or_build(self, spec, build):
+        """:return: (bytes, path) for spec, calling build(spec) only on a miss"""
+        key = self.key(spec)
+        data = self.get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data, self.path(key)
+        with self._lock:
+            self.misses += 1
+        data = bytes(build(spec))
+        return data, self.put(key, data)
+
+    def _remember(self, key, data):
+        if not self.memory:
+            return
+        with self._lock:
+            self._recent[key] = data
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.memory:
+                self._recent.popitem(last=False)
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = f"{100 * self.hits / total:.0f}%" if total else "n/a"
+        print(f"Cache {self.namespace}: {self.hits} hit(s), {self.misses} miss(es), hit rate {rate} ({self.folder})")
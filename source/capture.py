@@ -0,0 +1,249 @@
+"""
+Binary capture of HID and serial traffic, and offline tools that work on it.
+
+File layout (little endian):
+    header: MAGIC (8 bytes), wall clock start time (float64)
+    record: t_ns since start (uint64), channel (uint8), direction (uint8),
+            length (uint16), data
+
+A timed out HID read is recorded as an RX record with no data.
+
+Usage:
+    python capture.py summary run.rtscap
+    python capture.py dump run.rtscap
+"""
+import struct
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+import transport
+from commands import COMMANDS
+
+MAGIC = b"RTSCAP\x01\x00"
+HEADER = struct.Struct('<8sd')
+RECORD = struct.Struct('<QBBH')
+
+HID = 0
+SERIAL = 1
+TX = 0
+RX = 1
+
+_KINDS = {
+    transport.HID_TX: (HID, TX),
+    transport.HID_RX: (HID, RX),
+    transport.SERIAL_TX: (SERIAL, TX),
+    transport.SERIAL_RX: (SERIAL, RX),
+}
+
+Record = namedtuple("Record", "t channel direction data")
+
+
+class CaptureRecorder:
+    """
+    Transport observer that appends every frame to a capture file.
+
+    with CaptureRecorder("run.rtscap"):
+        ...run tests...
+
+    :param sources: only record traffic of these hid devices / serial ports
+        (one capture per printer when several are driven at once)
+    """
+    def __init__(self, path, sources=None):
+        self.path = path
+        self._sources = None if sources is None else {id(source) for source in sources}
+        self._file = open(path, "wb", buffering=64 * 1024)
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic_ns()
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+
+    def __call__(self, kind, data, **info):
+        if self._sources is not None and id(info.get("device", info.get("port"))) not in self._sources:
+            return
+        if kind not in _KINDS:
+            return
+        channel, direction = _KINDS[kind]
+        t = time.monotonic_ns() - self._t0
+        with self._lock:
+            # Serial chunks can exceed the 16 bit length field, split them
+            for i in range(0, max(len(data), 1), 0xFFFF):
+                part = data[i:i + 0xFFFF]
+                self._file.write(RECORD.pack(t, channel, direction, len(part)))
+                self._file.write(part)
+
+    def start(self):
+        transport.subscribe(self)
+        return self
+
+    def close(self):
+        transport.unsubscribe(self)
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_capture(path):
+    """Yields Records with t in seconds since the start of the capture."""
+    with open(path, "rb") as f:
+        magic, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            t_ns, channel, direction, length = RECORD.unpack(head)
+            yield Record(t_ns / 1e9, channel, direction, f.read(length))
+
+
+# Longest header first so sub-commands (0x82 0x01 ...) win over their opcode alone
+_HEADERS = sorted(((bytes(cmd), name) for name, (cmd, _) in COMMANDS.items()),
+                  key=lambda item: -len(item[0]))
+
+
+def command_name(frame) -> str:
+    """Maps an outgoing HID frame [TX_ID, length, packet..., checksum] to its COMMANDS name."""
+    packet = bytes(frame[2:])
+    for header, name in _HEADERS:
+        if packet.startswith(header):
+            return name
+    return f"0x{packet[1]:02X}" if len(packet) > 1 else "?"
+
+
+def pair_exchanges(records):
+    """
+    Pairs HID frames with their responses. Pipelined transfers (flash, logos)
+    have several frames in flight, answered in order, so outstanding frames
+    are kept in a FIFO. After a timeout or a NAK the transport drains and
+    abandons whatever was still in flight, so the FIFO is emptied too.
+    Records carry no device, so a capture is assumed to hold one printer's
+    HID traffic (fleet captures are per printer).
+    :return: list of (tx Record, rx Record)
+    """
+    pairs = []
+    outstanding = deque()
+    for rec in records:
+        if rec.channel != HID:
+            continue
+        if rec.direction == TX:
+            outstanding.append(rec)
+        elif outstanding:
+            pairs.append((outstanding.popleft(), rec))
+            if len(rec.data) < 4 or rec.data[3] != transport.ACK_BYTE:
+                outstanding.clear()
+    return pairs
+
+
+def command_latencies(records):
+    """:return: {command: [seconds, ...]} of the answered HID frames"""
+    latencies = {}
+    for tx, rx in pair_exchanges(records):
+        if rx.data:
+            latencies.setdefault(command_name(tx.data), []).append(rx.t - tx.t)
+    return latencies
+
+
+def summarize(path):
+    latencies = command_latencies(read_capture(path))
+    print(f"{'COMMAND':<32}{'N':>6}{'MEAN ms':>10}{'P50 ms':>10}{'P95 ms':>10}{'MAX ms':>10}")
+    for name, samples in sorted(latencies.items(), key=lambda item: -sum(item[1])):
+        samples = sorted(samples)
+        n = len(samples)
+        p50 = samples[n // 2]
+        p95 = samples[min(n - 1, int(n * 0.95))]
+        print(f"{name:<32}{n:>6}{1000 * sum(samples) / n:>10.2f}{1000 * p50:>10.2f}"
+              f"{1000 * p95:>10.2f}{1000 * samples[-1]:>10.2f}")
+
+    serial = [r for r in read_capture(path) if r.channel == SERIAL and r.direction == TX]
+    if serial:
+        total = sum(len(r.data) for r in serial)
+        span = serial[-1].t - serial[0].t
+        rate = f", {total / span:.0f} B/s" if span > 0 else ""
+        print(f"\nSerial: {total} bytes in {len(serial)} writes{rate}")
+
+
+def dump(path):
+    for rec in read_capture(path):
+        channel = "HID" if rec.channel == HID else "SER"
+        direction = "->" if rec.direction == TX else "<-"
+        label = command_name(rec.data) if rec.channel == HID and rec.direction == TX else ""
+        data = rec.data.hex(' ') if rec.data else "(timeout)"
+        print(f"{rec.t:12.6f} {channel} {direction} {label:<24} {data}")
+
+
+class CaptureSimulator:
+    """
+    Stands in for a hid.device by answering each frame with the response that
+    was recorded for the same frame. Useful for replaying a failing run offline.
+    """
+    def __init__(self, path):
+        self.responses = {}
+        for tx, rx in pair_exchanges(read_capture(path)):
+            self.responses.setdefault(tx.data, []).append(list(rx.data))
+        self._written = deque()     # Frames written and not read yet, answered in order
+
+    def write(self, frame):
+        self._written.append(bytes(frame))
+        return len(frame)
+
+    def read(self, max_length, timeout_ms=0):
+        if not self._written:
+            return []
+        queue = self.responses.get(self._written.popleft())
+        if not queue:
+            return []
+        # Keep the last response around so repeated polls still get an answer
+        return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    def close(self):
+        pass
+
+
+def replay(path, device=None, ser=None, realtime=False):
+    """
+    Re-sends the TX side of a capture. HID frames go to `device` (a printer or a
+    CaptureSimulator) and their responses are compared with the recorded ones;
+    serial chunks go to `ser`. With realtime=True the original pacing is kept.
+    :return: list of (time, command, expected, actual) for mismatching responses
+    """
+    mismatches = []
+    records = list(read_capture(path))
+    answers = {id(tx): rx.data for tx, rx in pair_exchanges(records)}
+    start = time.monotonic()
+    for rec in records:
+        if rec.direction != TX:
+            continue
+        if realtime:
+            delay = rec.t - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if rec.channel == SERIAL:
+            if ser is not None:
+                ser.write(rec.data)
+            continue
+        if device is None:
+            continue
+        device.write(rec.data)
+        actual = bytes(device.read(transport.REPORT_SIZE, 1000))
+        expected = answers.get(id(rec), b'')
+        # Compare the ACK/NAK byte; payloads such as status legitimately change
+        if actual[3:4] != expected[3:4]:
+            mismatches.append((rec.t, command_name(rec.data), expected, actual))
+    return mismatches
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("summary", "dump"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "summary":
+        summarize(sys.argv[2])
+    else:
+        dump(sys.argv[2])
@@ -0,0 +1,105 @@
+"""
+Checkpoint and resume for long regression runs.
+
+After every test the run state is written to a JSON file: the verdict and
+duration of each finished test, and the printer settings the tests have set
+so far (from commands.config_mirror). A run started again on the same printer
+with the same checkpoint file skips the tests that passed (or were deferred),
+sends the recorded settings back to the printer, and carries on with the
+first test that has not run or failed.
+"""
+import datetime
+import json
+import os
+import time
+
+import transport
+from commands import config_mirror
+
+
+class Checkpoint:
+    """
+    :param path: checkpoint file; an unfinished one from the same printer is resumed
+    :param printer: identifies the printer (serial port / HID serial number)
+    """
+    def __init__(self, path, printer, device):
+        self.path = path
+        self.device = device
+        self.state = {"printer": printer, "started": datetime.datetime.now().isoformat(timespec="seconds"),
+                      "complete": False, "done": {}, "config": []}
+        self.resumed = False
+        self._t0 = None
+        config_mirror.acquire(device, skip=False)
+
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("complete"):
+                print(f"Previous run in {path} finished, starting a new one")
+            elif saved.get("printer") != printer:
+                print(f"Checkpoint {path} belongs to {saved.get('printer')}, starting a new run")
+            else:
+                self.state = saved
+                self.resumed = True
+
+    def resume(self, tests):
+        """
+        Restores verdicts of passed and deferred tests and the printer settings.
+        Failed tests are run again, like repeat_failed would have.
+        :return: (finished TestEntries, TestEntries still to run)
+        """
+        done = {name: entry for name, entry in self.state["done"].items() if entry["success"]}
+        finished = [entry for entry in tests if entry.name in done]
+        todo = [entry for entry in tests if entry.name not in done]
+        if not self.resumed:
+            return [], todo
+        for entry in finished:
+            entry.success = done[entry.name]["success"]
+            entry.deferred = done[entry.name]["deferred"]
+        failed = sum(1 for entry in todo if entry.name in self.state["done"])
+        print(f"Resuming run from {self.state['started']}: {len(finished)} test(s) already done, "
+              f"{failed} failed test(s) to run again, continuing with {todo[0].name if todo else 'nothing'}")
+        self.restore_config()
+        return finished, todo
+
+    def restore_config(self):
+        """Sends the settings recorded before the interruption back to the printer."""
+        settings = self.state["config"]
+        restored = []
+        for command, frame in settings:
+            if transport.exchange(self.device, command, bytes.fromhex(frame)) == "NAK":
+                print(f"Could not restore {command}")
+            else:
+                restored.append((command, frame))
+        config_mirror.restore(self.device, restored)
+        if settings:
+            print(f"Restored {len(restored)}/{len(settings)} printer setting(s)")
+
+    def begin(self, entry):
+        self._t0 = time.monotonic()
+
+    def end(self, entry):
+        self.state["done"][entry.name] = {
+            "verdict": entry.verdict,
+            "success": entry.success,
+            "deferred": entry.deferred,
+            "duration_s": round(time.monotonic() - self._t0, 3) if self._t0 is not None else None,
+            "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        self.save()
+
+    def save(self):
+        self.state["config"] = config_mirror.state(self.device)
+        # Write then rename, so an interruption never leaves a half written file
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def finish(self):
+        """Marks the run complete so the next start does not resume it."""
+        self.state["complete"] = True
+        self.save()
+
+    def close(self):
+        config_mirror.release(self.device, skip=False)
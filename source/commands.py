@@ -4,10 +4,6 @@
 # 0x63 (Set Friendly Name)
 # 0x64 (Get Friendly Name)
 # 0x73 (Configure RTC) (handled in QrTimeStampTest.py)
-# 0x56 (Get Flash Alignment)
-# 0x79 (Flash Request)
-# 0x55 (Flash Update)
-# 0x80 (Logo Bank)
 # 0x84 (Command Log)
 # 0x85 (Bezel Configuration)
 # 0x86 (Calibration)
@@ -17,13 +13,20 @@
 # 0x93 (Get Paper Moved)
 
 
+import numpy as np
+
 from printStatus import parse_printer_status
+import transport
+from schema import Bool, DateTime, Enum, Raw, SInt, Text, UInt, encode_fields, payload_width
+from transport import calculate_checksum
 
 COMMANDS = {
     "PING"                    : ([0x02, 0x75], False),  
 
     "SET_SERIAL"              : ([0x0A, 0x41, 0x00, 0x4B, 0x00, 0x00, 0x08, 0x00, 0x00, 0x00], False),
     "GET_SERIAL"              : ([0x02, 0x40], False),
+    # Same register as SET_SERIAL: baud (u32), data bits, parity, stop bits, handshake
+    "SET_SERIAL_CONFIG"       : ([0x0A, 0x41], True),
 
     "GET_PRINT_QUALITY"       : ([0x02, 0x42], False),
     "SET_PRINT_QUALITY_NORMAL": ([0x03, 0x43, 0x00], False),
@@ -58,7 +61,7 @@ COMMANDS = {
     "GET_NEW_TICKET_ACTION"    : ([0x02, 0x4E], False),
     
     #Takes 9 bytes of data
-    "SET_SERIAL_NUMBER"        : ([0x03, 0x51], True),
+    "SET_SERIAL_NUMBER"        : ([0x0B, 0x51], True),
     "GET_SERIAL_NUMBER"        : ([0x02, 0x50], False),
 
     "SAVE_CONFIG"              : ([0x02, 0x52], False),
@@ -80,6 +83,11 @@ COMMANDS = {
 
     "RESET_DEVICE"             : ([0x02, 0x25], False),
 
+    # Firmware update, see flash.py. Flash Update (0x55) frames carry a variable
+    # amount of image data, so flash.py builds them itself.
+    "GET_FLASH_ALIGNMENT"      : ([0x02, 0x56], False),
+    "FLASH_REQUEST"            : ([0x0A, 0x79], True),
+
     "GET_UNIQUE_ID"            : ([0x02, 0x66], False),
 
     "GET_BOOT_ID"              : ([0x03, 0x57, 0x10], False),
@@ -87,6 +95,11 @@ COMMANDS = {
     #Reference: https://docs.google.com/document/d/1NEIAjJgeixbisGXM3_TADLGlynWKKxfObY68pIGHccg/edit?tab=t.0#bookmark=kix.idk8vzblx7gf
     "GET_PRINTER_STATUS"       : ([0x02, 0x67], False),
 
+    # Logo bank, see logo.py: START (bank, width, height, size), data frames
+    # [length, 0x80, 0x01, offset u32, data] built by logo.py, COMMIT (bank, byte sum)
+    "LOGO_BANK_START"          : ([0x0C, 0x80, 0x00], True),
+    "LOGO_BANK_COMMIT"         : ([0x08, 0x80, 0x02], True),
+
     "PRINT_FONT_PAGE"          : ([0x02, 0x81], False),
 
     # 4 bytes set font settings
@@ -178,8 +191,93 @@ COMMANDS = {
 ENABLE = 0x01
 DISABLE = 0x00
 
+SENTRY_MODES = {"DISABLED": 0x00, "DEFAULT": 0x01, "KEYWORD": 0x02, "LINE": 0x03, "SKIP": 0x04}
+TICKET_ACTIONS = {"NONE": 0x00, "EJECT": 0x01, "RETRACT": 0x02, "QUEUE": 0x03}
+PAPER_SIZES = {"58MM": 58, "60MM": 60, "80MM": 80}
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200)
+# 0 is what SET_SERIAL sends (no parity, 1 stop bit, no handshaking)
+PARITIES = {"NONE": 0x00, "ODD": 0x01, "EVEN": 0x02}
+STOP_BITS = {"1": 0x00, "2": 0x01}
+HANDSHAKES = {"NONE": 0x00, "XONXOFF": 0x01, "RTSCTS": 0x02}
+
+# Typed payloads for commands that take a value. The first byte of every entry in
+# COMMANDS is the packet length, so the payload width the firmware expects is
+# always packet length - header length; SCHEMA has to agree with it (checked below).
+# Commands with a 1 byte value and no entry here default to a plain 0 - 255 byte.
+SCHEMA = {
+    "SET_RETRACT_ENABLE"     : (Bool("enable"),),
+    "SET_PRESENTER_LENGTH"   : (UInt("length"),),
+    "SET_CR_CFG"             : (Bool("enable"),),
+    "SET_TIMEOUT_ACTION"     : (Enum("action", {k: v for k, v in TICKET_ACTIONS.items() if v != 0x03}),),
+    "SET_NEW_TICKET_ACTION"  : (Enum("action", {k: v for k, v in TICKET_ACTIONS.items() if v != 0x00}),),
+    "SET_SERIAL_NUMBER"      : (Text("serial", 9, min_length=9),),
+    "SET_SERIAL_CONFIG"      : (UInt("baud", width=4, lo=min(BAUD_RATES), hi=max(BAUD_RATES)),
+                                UInt("data_bits", lo=7, hi=8, default=8), Enum("parity", PARITIES, default=0x00),
+                                Enum("stop_bits", STOP_BITS, default=0x00), Enum("handshake", HANDSHAKES, default=0x00)),
+    "SET_PRINT_DENSITY"      : (UInt("density", lo=0, hi=200),),
+    "Set_TIMEOUT_PERIOD"     : (UInt("seconds", lo=1, hi=255),),
+    "SET_FONT_SETTINGS"      : (UInt("cpi_mode", hi=2), Enum("font", {"A": ord('A'), "B": ord('B')}), UInt("codepage", width=2)),
+    "SET_SCALAR"             : (Enum("scalar", {"CLASSIC": 0x00, "MODERN": 0x01}),),
+    "SET_CUSTOM_CPI"         : (SInt("cpi", lo=-3, hi=7),),
+    "SET_PAPER_SIZE"         : (Enum("size", PAPER_SIZES),),
+    "SET_AUTOCUT_EN"         : (Bool("enable"),),
+    "SET_PAPER_SLACK_COMPENSATION": (Bool("enable"),),
+    "SET_STARTUP_TICKET_ENABLE": (Bool("enable"),),
+    "SET_TRUNCATE_WS"        : (Bool("enable"),),
+    "SET_SENTRY_CONFIG"      : (Enum("mode", SENTRY_MODES), Text("keyword", 20), Bool("case", default=False),
+                                UInt("skip", default=0), UInt("line", default=0)),
+    "SET_DUPLICATE_KEYWORD"  : (Text("keyword", 20),),
+    "SET_PRE_SENTRY_KEY"     : (Text("keyword", 20),),
+    "SET_PULL_TAB_MODE"      : (Bool("enable"),),
+    "SET_LF_CFG"             : (Bool("enable"),),
+    "SET_LOCK_CPI"           : (Bool("enable"),),
+    "GET_MULTI_DUPKEY"       : (UInt("index", hi=2),),
+    "SET_MULTI_DUPKEY"       : (UInt("index", hi=2), Text("keyword", 20)),
+    "SEN_QR_TS_CFG"          : (Bool("enable"),),
+    "SET_RTC"                : (DateTime("time"),),
+    "FLASH_REQUEST"          : (UInt("size", width=4), UInt("checksum", width=4)),
+    "LOGO_BANK_START"        : (UInt("bank"), UInt("width", width=2, lo=8), UInt("height", width=2, lo=1),
+                                UInt("size", width=4)),
+    "LOGO_BANK_COMMIT"       : (UInt("bank"), UInt("checksum", width=4)),
+}
+
+
+def get_schema(command_name):
+    """Returns the payload fields of a command, or () if it takes no value."""
+    command_bytes, requires_value = COMMANDS[command_name]
+    if not requires_value:
+        return ()
+    if command_name in SCHEMA:
+        return SCHEMA[command_name]
+    width = command_bytes[0] - len(command_bytes)
+    return (UInt("value"),) if width == 1 else (Raw("value", width),)
+
+
+for _name, (_bytes, _requires_value) in COMMANDS.items():
+    if _requires_value and payload_width(get_schema(_name)) != _bytes[0] - len(_bytes):
+        raise AssertionError(f"SCHEMA width for '{_name}' does not match its packet length")
+
+
+def encode_value(command_name, value) -> bytes:
+    """
+    Encodes a command value to its payload bytes, validating width and range.
+    Accepts a dict of field values, a single value for one-field commands,
+    or already encoded bytes / a list of ints.
+    """
+    fields = get_schema(command_name)
+    try:
+        if isinstance(value, dict):
+            return encode_fields(fields, value)
+        if isinstance(value, (list, tuple)) or len(fields) > 1:
+            # Pre-assembled payload: only the width and byte range can be checked
+            return Raw("value", payload_width(fields)).encode(value)
+        return encode_fields(fields, {fields[0].name: value})
+    except ValueError as e:
+        raise ValueError(f"Invalid value for '{command_name}': {e}") from None
+
+
 #Customizable commands
-def get_command(command_name, value = None):
+def get_command(command_name, value = None) -> bytes:
     if command_name not in COMMANDS:
         raise ValueError(f"Command '{command_name}' not found in COMMANDS")
     
@@ -191,29 +289,164 @@ def get_command(command_name, value = None):
     if not requires_value and value is not None:
         raise ValueError(f"Command '{command_name}' does not require a value but one was provided")
     
-    return command_bytes + (value if isinstance(value, list) else [value] if value is not None else [])
+    return bytes(command_bytes) + (encode_value(command_name, value) if value is not None else b'')
+
+def build_frame(command, value = None) -> bytes:
+    """Builds the complete HID report for a command: [TX_ID, length, packet..., checksum]."""
+    TX_ID = 1 # Transmit ID
+    command_bytes = get_command(command, value)  # Get the command bytes from the command name
+    hid_length_byte = bytes([len(command_bytes) + 1])
+    checksum = bytes([calculate_checksum(command_bytes)])
+    return bytes([TX_ID]) + hid_length_byte + command_bytes + checksum
+
+def max_chunk(header) -> int:
+    """Most data bytes a build_chunk_frames frame with this header can carry in one HID report."""
+    return transport.REPORT_SIZE - 3 - (1 + len(header) + 4)
+
+def byte_sum(data) -> int:
+    """32-bit sum of the bytes of a bulk transfer, for FLASH_REQUEST / LOGO_BANK_COMMIT."""
+    return int(np.frombuffer(bytes(data), dtype=np.uint8).sum(dtype=np.uint64)) & 0xFFFFFFFF
+
+def build_chunk_frames(header, data, chunk, base=0) -> np.ndarray:
+    """
+    Builds the frames of a bulk transfer (flash image, logo) at once:
+    packet [length, *header, address u32, chunk of data] in the usual
+    [TX_ID, length, packet..., checksum] frame, checksums computed for all rows together.
+    :param data: len(data) must be a multiple of chunk
+    :return: (frames, frame size) uint8 array
+    """
+    TX_ID = 1
+    rows = len(data) // chunk
+    start = 2 + len(header)                         # Address offset in the frame
+    length = 1 + len(header) + 4 + chunk            # Packet length byte counts itself
+    frames = np.empty((rows, length + 3), dtype=np.uint8)
+    frames[:, 0] = TX_ID
+    frames[:, 1] = length + 1
+    frames[:, 2] = length
+    frames[:, 3:start + 1] = list(header)
+    addresses = base + np.arange(rows, dtype=np.uint32) * chunk
+    frames[:, start + 1:start + 5] = addresses.astype("<u4").view(np.uint8).reshape(rows, 4)
+    frames[:, start + 5:-1] = np.frombuffer(bytes(data), dtype=np.uint8).reshape(rows, chunk)
+    frames[:, -1] = np.bitwise_xor.reduce(frames[:, 2:-1], axis=1)
+    return frames
+
+
+class ConfigMirror:
+    """
+    Last acknowledged frame of each SET_* register, per device. While enabled it
+    is kept up to date by write_command; with skip on, write_command also skips
+    a SET_* that would only repeat what the printer already holds, and answers
+    it with ("ACK", b"") itself.
+    Anything that can change the printer's settings behind our back (a reset,
+    another tool, a failed test) must call forget().
+    """
+    EXCLUDE = {"SET_RTC"}                       # The clock moves on by itself
+    FORGET_ON = {"RESET_DEVICE"}
+
+    def __init__(self):
+        self.enabled = False
+        self.skip = False
+        self.skipped = 0
+        self.saved_seconds = 0.0    # Round trips avoided, from the learned latencies
+        self._values = {}           # (id(device), register): (command, frame)
+        self._users = 0
+        self._skippers = 0
+
+    def acquire(self, device, skip=True):
+        """
+        Starts mirroring (several schedulers / checkpoints may share the mirror).
+        :param skip: also skip redundant SET_* commands
+        """
+        self._users += 1
+        self._skippers += bool(skip)
+        self.enabled = True
+        self.skip = self._skippers > 0
+
+    def release(self, device, skip=True):
+        self._users = max(0, self._users - 1)
+        self._skippers = max(0, self._skippers - bool(skip))
+        self.enabled = self._users > 0
+        self.skip = self._skippers > 0
+        if not self.enabled:
+            self.forget()
+
+    @staticmethod
+    def register(command) -> bytes:
+        # Fixed-value commands such as SET_PRINT_QUALITY_* share a register per opcode
+        header, takes_value = COMMANDS[command]
+        return bytes(header if takes_value else header[:2])
+
+    def tracks(self, command) -> bool:
+        return command.startswith("SET_") and command not in self.EXCLUDE
+
+    def holds(self, device, command, frame) -> bool:
+        held = self._values.get((id(device), self.register(command)))
+        return held is not None and held[1] == frame
+
+    def update(self, device, command, frame):
+        key = (id(device), self.register(command))
+        self._values.pop(key, None)         # Keep the dict in the order registers were last set
+        self._values[key] = (command, frame)
+
+    def discard(self, device, command):
+        self._values.pop((id(device), self.register(command)), None)
+
+    def forget(self, device=None):
+        if device is None:
+            self._values.clear()
+        else:
+            for key in [k for k in self._values if k[0] == id(device)]:
+                del self._values[key]
+
+    def state(self, device):
+        """:return: [(command, frame hex), ...] for the device, in the order they were set"""
+        return [(command, frame.hex()) for (dev, _), (command, frame) in self._values.items() if dev == id(device)]
+
+    def restore(self, device, state):
+        """Reloads a state() snapshot. The printer itself is not touched."""
+        for command, frame in state:
+            self.update(device, command, bytes.fromhex(frame))
+
+
+config_mirror = ConfigMirror()
+
 
 # Write command to the device and read the response
 # If simple command, return ACK or NAK
 # If complex command, return the entire response
+# Failures compare equal to "NAK"; response.reason says whether it was a
+# timeout, a corrupt frame or a firmware NAK (see transport.py)
 def write_command(device, command, *value):
-    TX_ID = 1 # Transmit ID
-    command_bytes = get_command(command, *value)  # Get the command bytes from the command name
-    hid_length_byte = [len(command_bytes) + 1] 
-    checksum = [calculate_checksum(command_bytes)] 
-    payload = hid_length_byte + command_bytes + checksum
-    device.write([TX_ID] + payload)
-    response = device.read(128)
-    if not response:
-        print("No response received")
-        return "NAK"
-
-    if response[3] != 0xAA:
-        print("NAK")
-        print("Response:", response) 
-        return "NAK"
-    else:
-        return "ACK", response[4:]  # Return the response data after the ACK byte
+    return send_frame(device, command, build_frame(command, *value))
+
+
+def send_frame(device, command, frame):
+    """write_command for a frame that was built ahead of time with build_frame."""
+    mirror = config_mirror
+    if mirror.enabled:
+        if mirror.tracks(command):
+            if mirror.skip and mirror.holds(device, command, frame):
+                mirror.skipped += 1
+                mirror.saved_seconds += transport.policy.estimator(device, command).srtt or 0.0
+                return "ACK", b""
+        elif command in mirror.FORGET_ON:
+            mirror.forget(device)
+    response = transport.exchange(device, command, frame)
+    if mirror.enabled and mirror.tracks(command):
+        if response == "NAK":
+            mirror.discard(device, command)     # The printer may or may not have applied it
+        else:
+            mirror.update(device, command, frame)
+    if response == "NAK":
+        if response.reason == transport.TIMEOUT:
+            print("No response received")
+        elif response.reason == transport.CHECKSUM:
+            print("Corrupt response (checksum mismatch)")
+            print("Response:", response.response)
+        else:
+            print("NAK")
+            print("Response:", response.response)
+    return response
 
 
 def getPrinterStatus(device):
@@ -222,12 +455,6 @@ def getPrinterStatus(device):
         print("Failed to get printer status")
         return "NAK"
     
-    status = parse_printer_status(response)
+    # response is ("ACK", data); the status fields start at the first data byte
+    status = parse_printer_status(bytes(response[1]))
     return status
-
-
-def calculate_checksum(data: bytes) -> int:
-    checksum = 0
-    for byte in data:
-        checksum ^= byte
-    return checksum
\ No newline at end of file
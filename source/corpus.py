@@ -0,0 +1,211 @@
+"""
+ESC/POS test stream generator.
+
+Builds the kind of streams main.bin and page_main.bin contain from a spec
+instead of by hand, so they can be varied by paper width, code page, CPI,
+font and so on:
+
+    generate({"kind": "codepages", "pages": [3, 17], "paper": 58})
+    generate({"kind": "fonts", "cpis": [15, 20]})
+    generate({"kind": "suite", "parts": [{"kind": "barcodes"}, {"kind": "page_mode"}]})
+
+Output is cached by content hash (see cache.py): the same spec returns the
+same bytes without rebuilding them, and stream_path() gives a file that
+escpos.stream_binary can send. variants() expands a spec over lists of
+values to produce large families of streams for fuzzing.
+
+    python corpus.py kinds
+    python corpus.py build '{"kind": "codepages", "pages": [17]}' out.bin
+"""
+import inspect
+import itertools
+import json
+import sys
+
+from cache import ContentCache
+
+# Bump when a builder's output changes so cached streams are rebuilt
+VERSION = 1
+
+ESC = b"\x1b"
+GS = b"\x1d"
+LF = b"\n"
+FF = b"\x0c"
+
+PRINT_WIDTH = {58: 384, 60: 432, 80: 576}   # Printable dots per paper width
+CPI = {11: 0, 15: 1, 20: 2}             # ESC 0xC1 n (Reliance)
+STYLES = {                              # ESC ! bits
+    "normal": 0x00,
+    "bold": 0x08,
+    "double_height": 0x10,
+    "double_width": 0x20,
+    "underline": 0x80,
+}
+BARCODES = {                            # GS k m, NUL terminated forms
+    "UPC-A": (0, "01234567890"),
+    "UPC-E": (1, "01234567890"),
+    "EAN13": (2, "012345678901"),
+    "EAN8": (3, "0123456"),
+    "CODE39": (4, "CODE 39"),
+    "ITF": (5, "0123456789"),
+    "CODABAR": (6, "A0123456789A"),
+}
+HRI = {"none": 0, "above": 1, "below": 2, "both": 3}
+SAMPLE = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789"
+
+cache = ContentCache("escpos", version=VERSION)
+BUILDERS = {}
+
+
+def builder(kind):
+    def register(fn):
+        BUILDERS[kind] = fn
+        return fn
+    return register
+
+
+def u16(value):
+    return bytes([value & 0xFF, (value >> 8) & 0xFF])
+
+
+def text(value):
+    return value.encode("latin-1") if isinstance(value, str) else bytes(value)
+
+
+def header(paper, title):
+    """Initialize, set the print area for the paper, print a title line."""
+    if paper not in PRINT_WIDTH:
+        raise ValueError(f"Unsupported paper width {paper}, expected one of {sorted(PRINT_WIDTH)}")
+    return ESC + b"@" + GS + b"W" + u16(PRINT_WIDTH[paper]) + text(title) + b" " + LF + LF
+
+
+@builder("codepages")
+def codepages(paper=80, pages=(3, 17, 255), first=0x20, feed=3):
+    """One ticket per code page: every character from `first` to 0xFF, 16 a line."""
+    tickets = []
+    for page in pages:
+        if not 0 <= page <= 255:
+            raise ValueError(f"Code page {page} out of range")
+        ticket = header(paper, f"Code page {page}") + ESC + b"t" + bytes([page])
+        for row in range(first, 0x100, 16):
+            ticket += bytes(range(row, min(row + 16, 0x100))) + LF
+        tickets.append(ticket + LF * feed + FF)
+    return tickets
+
+
+@builder("fonts")
+def fonts(paper=80, fonts=("A", "B"), cpis=(11, 15, 20), styles=tuple(STYLES), sample=SAMPLE, feed=3):
+    """One ticket per CPI, one line per font and style."""
+    tickets = []
+    for cpi in cpis:
+        if cpi not in CPI:
+            raise ValueError(f"Unsupported CPI {cpi}, expected one of {sorted(CPI)}")
+        ticket = header(paper, f"CPI {cpi}") + ESC + b"\xc1" + bytes([CPI[cpi]])
+        for font in fonts:
+            for style in styles:
+                mode = STYLES[style] | (0x01 if font == "B" else 0x00)
+                ticket += ESC + b"!" + bytes([mode]) + text(f"Font {font} {style} ") + LF + text(sample) + LF
+        tickets.append(ticket + ESC + b"!\x00" + LF * feed + FF)
+    return tickets
+
+
+@builder("page_mode")
+def page_mode(paper=80, sizes=(1, 2, 3, 4), label="Page mode", feed=10):
+    """One page per character size, each printed with ESC FF."""
+    ticket = header(paper, label)
+    for size in sizes:
+        if not 1 <= size <= 8:
+            raise ValueError(f"Character size {size} out of range 1-8")
+        n = size - 1
+        ticket += ESC + b"L" + text(f"Character size {size}x ") + ESC + b"J" + bytes([feed])
+        for name, scale in (("W", n << 4), ("H", n), ("WH", (n << 4) | n)):
+            ticket += GS + b"!" + bytes([scale]) + text(f"{size}x{name} ") + LF
+        ticket += GS + b"!\x00" + ESC + b"\x0c" + ESC + b"S"
+    return [ticket + FF]
+
+
+@builder("barcodes")
+def barcodes(paper=80, symbologies=tuple(BARCODES), height=80, width=2, hri="below", data=None, feed=3):
+    """One ticket with every symbology; `data` overrides the sample content."""
+    if hri not in HRI:
+        raise ValueError(f"Unknown HRI position '{hri}', expected one of {', '.join(HRI)}")
+    ticket = header(paper, "Barcodes") + GS + b"H" + bytes([HRI[hri]]) + GS + b"h" + bytes([height]) \
+        + GS + b"w" + bytes([width]) + ESC + b"a\x01"
+    for name in symbologies:
+        if name not in BARCODES:
+            raise ValueError(f"Unknown symbology '{name}', expected one of {', '.join(BARCODES)}")
+        m, sample = BARCODES[name]
+        ticket += text(name) + LF + GS + b"k" + bytes([m]) + text(data if data is not None else sample) + b"\x00" \
+            + LF * feed
+    return [ticket + ESC + b"a\x00" + FF]
+
+
+@builder("text")
+def plain(paper=80, lines=("Hello",), repeat=1, feed=3):
+    """Arbitrary text lines, e.g. for line-rate and buffer tests."""
+    body = b"".join(text(line) + LF for line in lines) * repeat
+    return [header(paper, "Text") + body + LF * feed + FF]
+
+
+def normalize(spec):
+    """
+    :return: spec with every default filled in and lists as lists, so equal
+        streams get equal cache keys; raises ValueError for unknown kinds or keys
+    """
+    if spec.get("kind") == "suite":
+        return {"kind": "suite", "parts": [normalize(part) for part in spec.get("parts", [])]}
+    if spec.get("kind") not in BUILDERS:
+        raise ValueError(f"Unknown stream kind '{spec.get('kind')}', expected one of suite, {', '.join(BUILDERS)}")
+    params = inspect.signature(BUILDERS[spec["kind"]]).parameters
+    unknown = set(spec) - set(params) - {"kind"}
+    if unknown:
+        raise ValueError(f"{spec['kind']}: unknown option(s) {', '.join(sorted(unknown))}")
+    full = {"kind": spec["kind"]}
+    for name, param in params.items():
+        value = spec.get(name, param.default)
+        full[name] = list(value) if isinstance(value, tuple) else value
+    return full
+
+
+def build(spec):
+    """Builds a normalized spec without the cache."""
+    if spec["kind"] == "suite":
+        return b"".join(build(part) for part in spec["parts"])
+    options = {k: v for k, v in spec.items() if k != "kind"}
+    return b"".join(BUILDERS[spec["kind"]](**options))
+
+
+def generate(spec):
+    """:return: the ESC/POS bytes for spec, from the cache when possible"""
+    data, _ = cache.get_or_build(normalize(spec), build)
+    return data
+
+
+def stream_path(spec):
+    """:return: path of a file holding the stream for spec, for escpos.stream_binary"""
+    _, path = cache.get_or_build(normalize(spec), build)
+    return path
+
+
+def variants(spec, **axes):
+    """
+    Yields a copy of spec for every combination of the axis values:
+        variants({"kind": "codepages"}, paper=[58, 80], pages=[[n] for n in range(256)])
+    """
+    names = list(axes)
+    for values in itertools.product(*(axes[name] for name in names)):
+        yield dict(spec, **dict(zip(names, values)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "kinds":
+        for kind, fn in BUILDERS.items():
+            print(f"{kind:<12}{inspect.signature(fn)}\n{'':<12}{fn.__doc__}")
+    elif len(sys.argv) == 4 and sys.argv[1] == "build":
+        data = generate(json.loads(sys.argv[2]))
+        with open(sys.argv[3], "wb") as f:
+            f.write(data)
+        print(f"Wrote {len(data)} bytes to {sys.argv[3]}")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,441 @@
+"""
+ESC/POS binary streaming for the ESC_POS tests.
+
+The binary is tokenized into commands, text runs and control bytes, and
+indexed into sections: every ticket (up to a form feed or cut) and every
+code page block (from an ESC t switch to the next). Any section can be run
+on its own, or a stream resumed from an offset; the settings in force at
+that point are sent first so it prints as it would in the full run.
+
+The binary is memory-mapped and written in chunks that end on command
+boundaries, paced to the serial line rate: the host stays at most `window`
+bytes ahead of what the wire can have carried. Printer status is checked
+every `status_every` bytes and adjusts the pacing: the status has no buffer
+fill level, so the ticket state stands in for it. While the printer is
+Printing it drains its buffer at print speed, so the host may only run half
+the window ahead; while a ticket is Unpresented the stream holds until it is
+taken. The stream stops on an error flag.
+
+    python escpos.py index main.bin
+    python escpos.py stream main.bin "codepage 17" COM3 [resume offset]
+"""
+import mmap
+import os
+import sys
+import time
+from collections import namedtuple
+
+from prompts import ask, current, OperatorRequired
+from results import sleep
+from waits import read_status, wait_until_ready
+
+CHUNK = 1024
+
+
+ESC = 0x1B
+GS = 0x1D
+FS = 0x1C
+LF = 0x0A
+CR = 0x0D
+FF = 0x0C
+HT = 0x09
+
+TEXT = "text"
+CONTROL = "control"
+COMMAND = "command"
+
+Token = namedtuple("Token", "offset length kind name")
+Section = namedtuple("Section", "kind name start end title")
+
+
+def _gs_k(data, i):
+    # GS k m: m 0-6 data ends with NUL, m 65-73 length byte follows
+    if i + 2 >= len(data):
+        return len(data) - i + 1
+    m = data[i + 2]
+    if m <= 6:
+        end = data.find(b"\x00", i + 3)
+        return (end + 1 if end >= 0 else len(data) + 1) - i
+    return 4 + (data[i + 3] if i + 3 < len(data) else 0)
+
+
+def _gs_v(data, i):
+    # GS V m [n]: partial/full cut, m 65/66 take a feed amount
+    return 4 if i + 2 < len(data) and data[i + 2] in (65, 66) else 3
+
+
+def _gs_paren(data, i):
+    # GS ( x pL pH ...: 5 header bytes + p parameter bytes
+    if i + 4 >= len(data):
+        return len(data) - i + 1
+    return 5 + data[i + 3] + 256 * data[i + 4]
+
+
+def _gs_v0(data, i):
+    # GS v 0 m xL xH yL yH: raster image, (x bytes * y rows)
+    if i + 7 >= len(data):
+        return len(data) - i + 1
+    return 8 + (data[i + 4] + 256 * data[i + 5]) * (data[i + 6] + 256 * data[i + 7])
+
+
+def _esc_d_tabs(data, i):
+    # ESC D n1 ... NUL: horizontal tab positions
+    end = data.find(b"\x00", i + 2)
+    return (end + 1 if end >= 0 else len(data) + 1) - i
+
+
+def _esc_star(data, i):
+    # ESC * m nL nH: bit image, 8 dot modes take 1 byte per column, 24 dot modes 3
+    if i + 4 >= len(data):
+        return len(data) - i + 1
+    columns = data[i + 3] + 256 * data[i + 4]
+    return 5 + columns * (3 if data[i + 2] in (32, 33) else 1)
+
+
+# Total length of each ESC/GS/FS command in bytes, or fn(data, i) -> length.
+# The functions return more than the bytes left when the command is cut short.
+# 0xC1 (ESC) and 'e' (GS) are Reliance extensions used by the test binaries.
+COMMAND_LENGTHS = {
+    ESC: {
+        0x0C: 2, ord(' '): 3, ord('!'): 3, ord('$'): 4, ord('%'): 3, ord('-'): 3, ord('2'): 2,
+        ord('3'): 3, ord('4'): 3, ord('='): 3, ord('?'): 3, ord('@'): 2, ord('D'): _esc_d_tabs, ord('E'): 3,
+        ord('G'): 3, ord('J'): 3, ord('L'): 2, ord('M'): 3, ord('R'): 3, ord('S'): 2, ord('T'): 3,
+        ord('V'): 3, ord('W'): 10, ord('\\'): 4, ord('a'): 3, ord('c'): 4, ord('d'): 3, ord('i'): 2,
+        ord('m'): 2, ord('p'): 5, ord('t'): 3, ord('{'): 3, ord('*'): _esc_star, 0xC1: 3,
+    },
+    GS: {
+        ord('!'): 3, ord('$'): 4, ord('('): _gs_paren, ord('/'): 3, ord('B'): 3, ord('H'): 3,
+        ord('L'): 4, ord('P'): 4, ord('V'): _gs_v, ord('W'): 4, ord('\\'): 4, ord('a'): 3,
+        ord('e'): 3, ord('f'): 3, ord('h'): 3, ord('k'): _gs_k, ord('v'): _gs_v0, ord('w'): 3,
+    },
+    FS: {ord('&'): 2, ord('.'): 2, ord('p'): 4},
+}
+PREFIX_NAMES = {ESC: "ESC", GS: "GS", FS: "FS"}
+
+# Commands that print or move paper rather than change settings
+PRINTING = {"ESC J", "ESC d", "ESC FF", "GS k", "GS V", "GS v", "ESC *"}
+
+
+def command_name(prefix, code):
+    if code == FF:
+        return f"{PREFIX_NAMES[prefix]} FF"
+    return f"{PREFIX_NAMES[prefix]} {chr(code) if 32 < code < 127 else f'0x{code:02X}'}"
+
+
+def tokenize(data, partial=False):
+    """
+    Splits an ESC/POS byte stream into Tokens: runs of text, single control
+    bytes (LF, CR, FF, HT) and whole commands. Unknown commands are taken as
+    prefix + code byte so the rest of the stream still lines up.
+    :param partial: data may end in the middle of a command (a live stream);
+        return (tokens, offset of the incomplete command or len(data)) instead
+    """
+    tokens = []
+    i, n = 0, len(data)
+    text_start = None
+    while i < n:
+        b = data[i]
+        if b in COMMAND_LENGTHS or b in (LF, CR, FF, HT):
+            if text_start is not None:
+                tokens.append(Token(text_start, i - text_start, TEXT, None))
+                text_start = None
+            if b in COMMAND_LENGTHS:
+                code = data[i + 1] if i + 1 < n else None
+                length = COMMAND_LENGTHS[b].get(code, 2) if code is not None else 2
+                if callable(length):
+                    length = length(data, i)
+                if partial and length > n - i:
+                    return tokens, i
+                length = min(length, n - i)
+                name = command_name(b, code) if code is not None else PREFIX_NAMES[b]
+                tokens.append(Token(i, length, COMMAND, name))
+                i += length
+            else:
+                tokens.append(Token(i, 1, CONTROL, {LF: "LF", CR: "CR", FF: "FF", HT: "HT"}[b]))
+                i += 1
+            continue
+        if text_start is None:
+            text_start = i
+        i += 1
+    if text_start is not None:
+        tokens.append(Token(text_start, n - text_start, TEXT, None))
+    return (tokens, n) if partial else tokens
+
+
+def _title(data, tokens, k):
+    # First run of text from token k on, as a label
+    for token in tokens[k:k + 40]:
+        if token.kind == TEXT:
+            return bytes(data[token.offset:token.offset + token.length]).decode("latin-1").strip()[:40]
+    return ""
+
+
+def index_sections(data, tokens=None):
+    """
+    Builds the section index of a stream:
+      "ticket N"     everything up to and including the N-th form feed or cut
+      "codepage n"   from the title line before an ESC t n to the next code page
+                     switch, ESC @ or the end of the ticket ("codepage n#2" if n repeats)
+    :return: list of Sections, tickets first, ordered by start
+    """
+    tokens = tokenize(data) if tokens is None else tokens
+    sections = []
+
+    start, first = 0, 0
+    for k, token in enumerate(tokens):
+        if (token.kind == CONTROL and token.name == "FF") or token.name == "GS V":
+            end = token.offset + token.length
+            if sections and not any(t.kind == TEXT for t in tokens[first:k]):
+                # A blank feed belongs to the ticket before it
+                sections[-1] = sections[-1]._replace(end=end)
+            else:
+                sections.append(Section("ticket", f"ticket {len(sections) + 1}", start, end,
+                                        _title(data, tokens, first)))
+            start, first = end, k + 1
+    if start < len(data) and any(t.kind == TEXT for t in tokens[first:]):
+        sections.append(Section("ticket", f"ticket {len(sections) + 1}", start, len(data), _title(data, tokens, first)))
+    ticket_ends = [s.end for s in sections]
+
+    seen = {}
+    pages = []
+    for k, token in enumerate(tokens):
+        if token.name != "ESC t":
+            continue
+        # Include the title line printed just before the switch
+        j = k
+        if j > 0 and tokens[j - 1].name == "LF":
+            j -= 1
+        while j > 0 and tokens[j - 1].kind == TEXT:
+            j -= 1
+        page = data[token.offset + 2] if token.length > 2 else 0
+        seen[page] = seen.get(page, 0) + 1
+        name = f"codepage {page}" + (f"#{seen[page]}" if seen[page] > 1 else "")
+        pages.append([name, tokens[j].offset, k, _title(data, tokens, j)])
+    for p, (name, begin, k, title) in enumerate(pages):
+        end = next((e for e in ticket_ends if e > begin), len(data))
+        if p + 1 < len(pages):
+            end = min(end, pages[p + 1][1])
+        reset = next((t.offset for t in tokens[k + 1:] if t.name == "ESC @" and t.offset < end), None)
+        sections.append(Section("codepage", name, begin, reset if reset is not None else end, title))
+    return sections
+
+
+def find_section(sections, name):
+    for section in sections:
+        if section.name == name:
+            return section
+    raise ValueError(f"No section '{name}'. Sections: {', '.join(s.name for s in sections)}")
+
+
+def preamble(data, tokens, offset):
+    """
+    Settings in force at `offset`: the last ESC @ before it and the latest
+    value of every setting command after that, without text or printing
+    commands. Sent before a section that is run on its own so it prints as it
+    would in the full stream.
+    """
+    settings = {}
+    for token in tokens:
+        if token.offset >= offset:
+            break
+        if token.name == "ESC @":
+            settings.clear()
+        if token.kind == COMMAND and token.name not in PRINTING:
+            settings.pop(token.name, None)
+            settings[token.name] = data[token.offset:token.offset + token.length]
+    return b"".join(settings.values())
+
+
+def boundaries(tokens, start, end, chunk):
+    """
+    Yields (begin, end) pieces of at most `chunk` bytes between start and end
+    that never cut through a command. Text runs may be split anywhere; a
+    command longer than `chunk` is a piece of its own.
+    """
+    begin = start
+    for token in tokens:
+        t_start = max(token.offset, start)
+        t_end = min(token.offset + token.length, end)
+        if t_end <= begin:
+            continue
+        if t_start >= end:
+            break
+        if token.kind == TEXT:
+            while t_end - begin > chunk:
+                # Cut inside the text, never before its start
+                cut = max(begin + chunk, t_start)
+                yield begin, cut
+                begin = cut
+        elif t_end - begin > chunk:
+            if t_start > begin:
+                yield begin, t_start
+                begin = t_start
+            if t_end - begin > chunk:
+                yield begin, t_end
+                begin = t_end
+    if begin < end:
+        yield begin, end
+
+
+def binary_dirs():
+    """Where the ESC/POS binaries can be: the bundle, next to the scripts, the repo folder."""
+    if getattr(sys, 'frozen', False):
+        # Running in a bundle (e.g., PyInstaller)
+        return [sys._MEIPASS]
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [here, os.path.join(os.path.dirname(here), "escpos_binaries"), os.getcwd()]
+
+
+def locate_binary(name):
+    """:return: path of the binary; asks the operator if it is not in binary_dirs()"""
+    for folder in binary_dirs():
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            return path
+    key = name.replace(".", "_")
+    while True:
+        print(f"Could not find {name}. Please enter the path to {name}\n (should be in the same folder as this exe)")
+        path = ask(key, f"Enter the full path to {name}: ").strip()
+        if os.path.isfile(path):
+            return path
+        print(f"Error reading the provided file path: {path}")
+        if current().headless:
+            raise OperatorRequired(key)
+
+
+_index_cache = {}
+
+
+def load_index(path):
+    """:return: (tokens, sections) of a binary, cached per path and modification time"""
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in _index_cache:
+        with open(path, "rb") as f:
+            data = f.read()
+        tokens = tokenize(data)
+        _index_cache[key] = (tokens, index_sections(data, tokens))
+    return _index_cache[key]
+
+
+def sections_at(sections, position):
+    """:return: names of the sections containing byte `position`"""
+    return [s.name for s in sections if s.start <= position < s.end]
+
+
+class StreamResult:
+    def __init__(self, size, offset=0):
+        self.size = size
+        self.offset = offset
+        self.position = offset  # End of the data written so far; resume from here
+        self.sent = 0
+        self.elapsed = 0.0
+        self.error = None       # StatusRecord that stopped the stream
+
+    @property
+    def Bps(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else None
+
+    def report(self, line_Bps):
+        rate = self.Bps
+        achieved = f"{rate:.0f} B/s ({100 * rate / line_Bps:.0f}% of line rate)" if rate else "n/a"
+        print(f"Streamed {self.sent}/{self.size} bytes in {self.elapsed:.1f}s, {achieved}")
+
+
+def stream_binary(ser, device, path, baudrate=19200, offset=0, end=None, chunk=CHUNK, window=2048,
+                  status_every=4096, prefix=b"", hold_timeout=30.0):
+    """
+    Writes path[offset:end] to the serial port, split only at command boundaries.
+    :param window: bytes the host may run ahead of the line rate (the printer and
+        driver buffers absorb that much), halved while the printer is printing
+    :param status_every: bytes between status checks, 0 to never check (and to
+        pace by the line rate only)
+    :param prefix: sent first, e.g. the preamble() of a section run on its own
+    :param hold_timeout: longest hold for an Unpresented ticket
+    :return: StreamResult
+    """
+    line_Bps = baudrate / 10
+    tokens, _ = load_index(path)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        end = len(data) if end is None else min(end, len(data))
+        result = StreamResult(end - offset, offset)
+        start = time.monotonic()
+        next_check = status_every
+        allowance = window
+        paced_from = start      # Moved on by holds, which the wire spends idle
+        if prefix:
+            ser.write(prefix)
+        for begin, stop in boundaries(tokens, offset, end, chunk):
+            ser.write(data[begin:stop])
+            result.position = stop
+            result.sent += stop - begin
+
+            # Wait until the wire could have carried all but `allowance` bytes
+            ahead = result.sent + len(prefix) - (time.monotonic() - paced_from) * line_Bps
+            if ahead > allowance:
+                sleep((ahead - allowance) / line_Bps)
+
+            if status_every and result.sent >= next_check:
+                next_check += status_every
+                status = read_status(device)
+                if status is not None and status.error_status:
+                    result.error = status
+                    print(f"Printer error after {result.sent} bytes, stopping stream: {status}")
+                    break
+                if status is not None and status.ticket_state == "Unpresented":
+                    # Hold while a ticket waits to be taken; the wire is idle meanwhile
+                    held = time.monotonic()
+                    wait_until_ready(device, timeout=hold_timeout)
+                    paced_from += time.monotonic() - held
+                allowance = window // 2 if status is not None and status.ticket_state == "Printing" else window
+        ser.flush()
+        result.elapsed = time.monotonic() - start
+    result.report(line_Bps)
+    return result
+
+
+def stream_section(ser, device, path, name, baudrate=19200, resume_from=None, **kwargs):
+    """
+    Runs one section of a binary on its own, preceded by the settings in force
+    where it starts. With resume_from (a StreamResult.position inside the
+    section) only the rest of it is sent.
+    :return: StreamResult
+    """
+    tokens, sections = load_index(path)
+    section = find_section(sections, name)
+    offset = section.start if resume_from is None else max(section.start, min(resume_from, section.end))
+    # Never start inside a command
+    offset = next((t.offset for t in tokens if t.kind == COMMAND and t.offset < offset < t.offset + t.length),
+                  offset)
+    with open(path, "rb") as f:
+        data = f.read(offset)
+    print(f"Streaming {section.name} ({section.title!r}, bytes {offset}-{section.end})")
+    return stream_binary(ser, device, path, baudrate, offset=offset, end=section.end,
+                         prefix=preamble(data, tokens, offset), **kwargs)
+
+
+def print_index(path):
+    tokens, sections = load_index(path)
+    commands = sum(1 for t in tokens if t.kind == COMMAND)
+    print(f"{path}: {os.path.getsize(path)} bytes, {commands} commands, {len(sections)} sections")
+    print(f"{'SECTION':<18}{'START':>8}{'END':>8}  TITLE")
+    for s in sorted(sections, key=lambda s: (s.start, s.kind)):
+        print(f"{s.name:<18}{s.start:>8}{s.end:>8}  {s.title}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "index":
+        print_index(sys.argv[2])
+    elif len(sys.argv) in (5, 6) and sys.argv[1] == "stream":
+        from RelianceTestSuite import baudrate, open_devices
+        ser, device = open_devices(sys.argv[4])
+        try:
+            result = stream_section(ser, device, sys.argv[2], sys.argv[3], baudrate,
+                                    resume_from=int(sys.argv[5]) if len(sys.argv) == 6 else None)
+            if result.error is not None:
+                print(f"Stopped at byte {result.position}; resume with that offset")
+        finally:
+            ser.close()
+            device.close()
+    else:
+        print(__doc__)
+        sys.exit(1)
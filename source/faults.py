@@ -0,0 +1,163 @@
+"""
+Continuous fault monitor.
+
+Watches the error flags of every status sample, from a StatusPoller and from
+the test's own status reads, while a monitored test (TestEntry.monitored, the
+jam tests) prints. On a fault (jam, overheat, cutter
+error, head voltage, platen open) it:
+  - aborts the serial stream, so no more tickets queue up behind the jam:
+    buffered data is dropped and the test's next write raises StreamAborted,
+  - records the ticket the printer was on and a snapshot of its sensors,
+  - marks the test failed, whatever the operator answers afterwards.
+Faults only count once the test has sent its first ticket, so opening the
+platen to load paper at the start of a test is not one.
+Without a shared poller (the tracer's) the monitor polls only while a
+monitored test runs, so other tests keep the command channel to themselves.
+
+    monitor = FaultMonitor(None, ser, device)
+    run_tests(..., monitor=monitor)
+    monitor.report()
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+import transport
+from printStatus import ERROR_FLAGS, StatusRecord
+from statusPoller import StatusPoller
+from waits import BUSY_STATES
+
+FORM_FEED = 0x0C
+FAULT_FLAGS = ("Jammed", "Overheated", "Cutter Error", "Voltage High", "Voltage Low", "Platen Open")
+FAULT_MASK = sum(1 << ERROR_FLAGS.index(name) for name in FAULT_FLAGS)
+
+
+@dataclass
+class Fault:
+    test: str
+    ticket: int         # Ticket of the test the printer was on (1-based)
+    sent: int           # Tickets the test had sent by then
+    flags: list
+    status: dict        # StatusRecord.to_dict() of the sample that showed the fault
+    t: float
+
+    def __str__(self):
+        return f"{self.test}: {', '.join(self.flags)} on ticket {self.ticket} ({self.sent} sent)"
+
+
+class FaultMonitor:
+    """
+    :param poller: running statusPoller.StatusPoller, or None to poll `device`
+        at `rate_hz` only while a monitored test runs
+    :param ser: SerialWriter (or port) the tests print through; aborted on a fault
+    :param device: the printer's HID device; only its status reads are checked
+    """
+    def __init__(self, poller, ser, device=None, rate_hz=20):
+        self.poller = poller
+        self.ser = ser
+        self.device = device if device is not None else getattr(poller, "device", None)
+        self.rate_hz = rate_hz
+        self._own = None        # Poller of the running monitored test, when there is no shared one
+        self.port = getattr(ser, "ser", ser)     # The ObservedSerial under a SerialWriter
+        self.faults = []
+        self.fault = None       # Fault of the running test
+        self._entry = None
+        self._sent = 0
+        self._done = 0          # Tickets of the running test that finished printing
+        self._busy = False
+        self._lock = threading.Lock()
+        transport.subscribe(self._on_frame)
+        if poller is not None:
+            poller.subscribe(self._on_status)
+
+    # run_tests hooks
+
+    def begin(self, entry):
+        with self._lock:
+            self._entry = entry if entry.monitored else None
+            self.fault = None
+            self._sent = self._done = 0
+            self._busy = False
+        if entry.monitored and self.poller is None and self._own is None:
+            self._own = StatusPoller(self.device, rate_hz=self.rate_hz)
+            self._own.subscribe(self._on_status)
+            self._own.start()
+
+    def end(self, entry):
+        self._stop_own()
+        with self._lock:
+            fault = self.fault if self._entry is entry else None
+            self._entry = None
+        if hasattr(self.ser, "resume"):
+            self.ser.resume()
+        if fault is not None:
+            print(f"{entry.name} - Test failed: printer fault {', '.join(fault.flags)} on ticket {fault.ticket}")
+            entry.deferred = False
+            entry.success = False
+
+    def clear(self):
+        """Forgets the fault and resumes the stream, for runs that carry on after one (soak.py)."""
+        with self._lock:
+            self.fault = None
+            self._sent = self._done = 0
+            self._busy = False
+        if hasattr(self.ser, "resume"):
+            self.ser.resume()
+
+    def close(self):
+        self._stop_own()
+        transport.unsubscribe(self._on_frame)
+        if self.poller is not None:
+            self.poller.unsubscribe(self._on_status)
+
+    def _stop_own(self):
+        if self._own is not None:
+            self._own.stop()
+            self._own.unsubscribe(self._on_status)
+            self._own = None
+
+    # observers
+
+    def _on_frame(self, kind, data, **info):
+        if kind == transport.HID_RX and info.get("command") == "GET_PRINTER_STATUS" \
+                and (self.device is None or info.get("device") is self.device):
+            # The test's own status reads (waits.py) are checked too, in its thread,
+            # so a wait that ends on the fault never gets to send the next ticket
+            if len(data) > 3 and data[3] == transport.ACK_BYTE:
+                try:
+                    record = StatusRecord.from_bytes(data, 4)
+                except ValueError:
+                    return
+                self._on_status(time.monotonic(), record)
+        elif kind == transport.SERIAL_TX and FORM_FEED in data and info.get("port") is self.port:
+            with self._lock:
+                if self._entry is not None:
+                    self._sent += data.count(FORM_FEED)
+
+    def _on_status(self, t, record):
+        with self._lock:
+            if self._entry is None or self.fault is not None:
+                return
+            busy = record.ticket_state in BUSY_STATES
+            if self._busy and not busy:
+                self._done += 1
+            self._busy = busy
+            if not self._sent or not record.error_status & FAULT_MASK:
+                return
+            self.fault = Fault(self._entry.name, min(self._done + 1, self._sent), self._sent,
+                               [name for name in FAULT_FLAGS if record.error(name)], record.to_dict(), t)
+            self.faults.append(self.fault)
+        if hasattr(self.ser, "abort"):
+            self.ser.abort(str(self.fault))
+        print(f"\nPRINTER FAULT - {self.fault}; serial stream stopped")
+
+    # results
+
+    def report(self):
+        if not self.faults:
+            return
+        print(f"\n{len(self.faults)} printer fault(s):")
+        for fault in self.faults:
+            sensors = ", ".join(name for name, on in fault.status["Sensor Status"].items() if on) or "none"
+            print(f"  {fault}\n    sensors on: {sensors}; head {fault.status['Head Temp (°C)']}C "
+                  f"{fault.status['Head Voltage']}")
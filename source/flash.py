@@ -0,0 +1,150 @@
+"""
+Firmware flash update over HID.
+
+    1. GET_FLASH_ALIGNMENT: the flash write size; the image is padded with
+       0xFF to a multiple of it and sent in chunks of it (split further if it
+       does not fit a HID report).
+    2. FLASH_REQUEST: image size and 32-bit byte sum, computed in one NumPy
+       pass; the firmware prepares to receive.
+    3. FLASH_UPDATE (0x55) frames [length, 0x55, address u32, data], built for
+       the whole image at once (frame checksums included), sent with up to
+       `window` frames in flight. A failed frame is resent with half the
+       window, so the transfer settles at what the firmware keeps up with.
+    4. The printer restarts into the new firmware; the HID device is reopened
+       and the new revision read back.
+
+Progress and throughput are printed as it goes. Run from the suite with
+--flash FILE (then the tests given by --tests / the config run on the new
+firmware), or from a script:
+
+    python flash.py firmware.bin
+"""
+import sys
+import time
+
+import transport
+from benchmark import firmware_revision
+from commands import build_chunk_frames, byte_sum, config_mirror, max_chunk, write_command
+
+FLASH_UPDATE = 0x55
+MAX_CHUNK = max_chunk([FLASH_UPDATE])
+PAD = 0xFF                              # Erased flash
+
+DEFAULTS = {
+    "window": 8,            # Frames in flight at the start
+    "batch": 256,           # Frames per pipelined exchange (progress is reported between batches)
+    "retries": 5,
+    "reboot_s": 5.0,        # Wait before reopening the device
+    "reopen_timeout": 30.0,
+}
+
+
+class FlashError(transport.TransferError):
+    """The printer refused or stopped acknowledging the update."""
+
+
+def chunk_size(alignment):
+    """Largest chunk that is `alignment` or divides it and fits a HID report."""
+    chunk = alignment
+    while chunk > MAX_CHUNK:
+        if chunk % 2:
+            raise ValueError(f"Flash alignment {alignment} cannot be split into HID reports")
+        chunk //= 2
+    return chunk
+
+
+def pad(image, alignment):
+    return image + bytes([PAD]) * (-len(image) % alignment)
+
+
+def read_alignment(device):
+    response = write_command(device, "GET_FLASH_ALIGNMENT")
+    if response == "NAK":
+        raise FlashError("Printer did not report its flash alignment")
+    alignment = int.from_bytes(bytes(response[1][:2]), "little")
+    if not alignment:
+        raise FlashError("Printer reported a flash alignment of 0")
+    return alignment
+
+
+def send_image(device, frames, chunk, settings):
+    """:return: bytes/s"""
+    total = len(frames) * chunk
+    start = time.monotonic()
+
+    def progress(done, _):
+        elapsed = time.monotonic() - start
+        rate = done * chunk / elapsed if elapsed > 0 else 0
+        eta = f", {(total - done * chunk) / rate:.0f}s left" if rate and done * chunk < total else ""
+        print(f"Flashing: {done * chunk}/{total} bytes ({100 * done * chunk / total:.0f}%), "
+              f"{rate / 1024:.1f} KiB/s{eta}")
+
+    transport.send_chunks(device, "FLASH_UPDATE", frames, settings["window"], settings["batch"],
+                          settings["retries"], progress)
+    return total / max(time.monotonic() - start, 1e-6)
+
+
+def reopen_device(reopen, settings):
+    """Waits for the printer to come back after its restart. :return: the new device"""
+    time.sleep(settings["reboot_s"])
+    deadline = time.monotonic() + settings["reopen_timeout"]
+    while True:
+        try:
+            device = reopen()
+            if write_command(device, "PING") != "NAK":
+                return device
+            device.close()
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                raise FlashError(f"Printer did not come back after the update: {e}") from None
+        if time.monotonic() >= deadline:
+            raise FlashError("Printer did not come back after the update")
+        time.sleep(1.0)
+
+
+def flash_firmware(device, path, options=None, reopen=None):
+    """
+    :param reopen: callable returning a newly opened HID device, used after the
+        printer restarts; without it the old device is returned as is
+    :return: the device to use from now on
+    """
+    settings = dict(DEFAULTS, **(options or {}))
+    with open(path, "rb") as f:
+        raw = f.read()
+    if not raw:
+        raise ValueError(f"Firmware image {path} is empty")
+    before = firmware_revision(device)
+    alignment = read_alignment(device)
+    chunk = chunk_size(alignment)
+    image = pad(raw, alignment)
+    print(f"Firmware {before} -> {path}: {len(raw)} bytes, alignment {alignment}, {chunk} byte chunks")
+
+    frames = build_chunk_frames([FLASH_UPDATE], image, chunk)
+    if write_command(device, "FLASH_REQUEST", {"size": len(image), "checksum": byte_sum(image)}) == "NAK":
+        raise FlashError("Printer refused the flash request")
+    rate = send_image(device, frames, chunk, settings)
+    print(f"Image sent at {rate / 1024:.1f} KiB/s")
+
+    # Settings and latencies learned from the old firmware no longer hold
+    transport.policy.forget(device)
+    config_mirror.forget(device)
+    if reopen is not None:
+        try:
+            device.close()
+        except Exception:
+            pass
+        device = reopen_device(reopen, settings)
+        print(f"Printer restarted with firmware {firmware_revision(device)} (was {before})")
+    return device
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    from RelianceTestSuite import open_hid
+    try:
+        flash_firmware(open_hid(), sys.argv[1], reopen=open_hid).close()
+    except (transport.TransferError, ValueError) as e:
+        print(f"Flash update failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,194 @@
+"""
+Runs the suite on several printers at once.
+
+Every attached printer (HID VENDOR_ID/PRODUCT_ID) is paired with its serial
+port and driven from its own thread with its own headless prompter, traffic
+capture and result files. A merged summary table is written at the end.
+
+Pairing:
+  1. "fleet" in the run config: [{"port": "COM3", "hid_serial": "..."} or {"port": ..., "hid_path": ...}]
+  2. Only one printer and one "port": they belong together
+hidapi paths (/dev/hidrawN, bbbb:dddd:ii, \\?\HID#...) carry no USB port
+chain, so printers are not matched to adapters by location.
+
+Per printer <label>_results.txt, .jsonl/.xml step timings, _deferred.json,
+_checkpoint.json and .rtscap are written to "fleet_dir"; rerunning with the
+same "fleet_dir" resumes interrupted printers.
+"""
+import datetime
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import List
+
+import hid
+
+import metrics
+import prompts
+from capture import CaptureRecorder
+from checkpoint import Checkpoint
+from RelianceTestSuite import (VENDOR_ID, PRODUCT_ID, baudrate, build_tests, exit_code, make_monitor,
+                               make_results, make_scheduler, open_devices, port_name, prepare_printer,
+                               printer_id, run_tests, select_tests, write_results)
+
+
+@dataclass
+class Printer:
+    port: str
+    hid_path: bytes
+    label: str
+    tests_completed: list = field(default_factory=list)
+    deferred: list = field(default_factory=list)
+    error: str = None
+
+
+def _hid_path(path):
+    return path.encode() if isinstance(path, str) else path
+
+
+def _label(info, port):
+    serial_number = info.get("serial_number") or ""
+    return serial_number.strip() or port_name(port)
+
+
+def pair_printers(config) -> List[Printer]:
+    """Pairs each attached printer with a serial port. Raises ValueError if that is not possible."""
+    attached = sorted(hid.enumerate(VENDOR_ID, PRODUCT_ID), key=lambda info: info["path"])
+    if not attached:
+        raise ValueError("No printers found on USB")
+
+    if "fleet" in config:
+        printers = []
+        for entry in config["fleet"]:
+            if "hid_path" in entry:
+                matches = [info for info in attached if info["path"] == _hid_path(entry["hid_path"])]
+            elif "hid_serial" in entry:
+                matches = [info for info in attached if info.get("serial_number") == entry["hid_serial"]]
+            else:
+                raise ValueError(f"Fleet entry {entry} needs \"hid_path\" or \"hid_serial\"")
+            if not matches:
+                raise ValueError(f"Printer for {entry} is not attached")
+            info = matches[0]
+            printers.append(Printer(port_name(entry["port"]), info["path"],
+                                    entry.get("label") or _label(info, entry["port"])))
+        return printers
+
+    if len(attached) == 1 and "port" in config:
+        return [Printer(port_name(config["port"]), attached[0]["path"], _label(attached[0], config["port"]))]
+    raise ValueError(f"Cannot tell which serial port belongs to which of the {len(attached)} printers; "
+                     "list them under \"fleet\" in the run config")
+
+
+def run_printer(printer: Printer, config, out_dir):
+    """Thread body: the single printer flow of RelianceTestSuite.main, unattended."""
+    prompter = prompts.use_headless(config.get("answers"), thread_local=True)
+    base = os.path.join(out_dir, printer.label)
+    try:
+        ser, device = open_devices(printer.port, printer.hid_path, config.get("baudrate", baudrate))
+    except Exception as e:
+        printer.error = f"cannot open {printer.port} / {printer.hid_path!r}: {e}"
+        print(f"[{printer.label}] {printer.error}")
+        return
+
+    recorder = CaptureRecorder(base + ".rtscap", sources=(device, ser)).start()
+    try:
+        if not prepare_printer(device, config.get("baudrate", baudrate)):
+            printer.error = "printer not responding"
+            return
+        if config.get("logo"):
+            import logo
+            if not logo.upload_config(device, config["logo"]):
+                printer.error = "logo upload failed"
+                return
+        TESTS = build_tests(ser, device)
+        tests_todo = select_tests(TESTS, config["tests"]) if "tests" in config else list(TESTS.values())
+        checkpoint = Checkpoint(base + "_checkpoint.json", printer_id(printer.port, device), device)
+        finished, tests_todo = checkpoint.resume(tests_todo)
+        scheduler = make_scheduler(config, device)
+        results = make_results({}, base, port=printer.port, printer=printer.label)
+        monitor = make_monitor(config, ser, device)
+        try:
+            printer.tests_completed = finished + run_tests(tests_todo, config.get("repeat_failed", 0),
+                                                           scheduler, results, checkpoint, monitor=monitor)
+            checkpoint.finish()
+        finally:
+            if monitor is not None:
+                monitor.close()
+                monitor.report()
+            results.close()
+            if scheduler is not None:
+                scheduler.close()
+            checkpoint.close()
+        write_results(printer.tests_completed, base + "_results.txt")
+        printer.deferred = prompter.deferred
+        prompter.save_deferred(base + "_deferred.json")
+    except Exception as e:
+        printer.error = str(e)
+        print(f"[{printer.label}] Run aborted: {e}")
+    finally:
+        recorder.close()
+        ser.close()
+        try:
+            device.close()
+        except Exception:
+            pass
+
+
+def write_summary(printers, path):
+    """Test x printer table of verdicts."""
+    names = []
+    for printer in printers:
+        for entry in printer.tests_completed:
+            if entry.name not in names:
+                names.append(entry.name)
+    width = max([len(name) for name in names] + [len("TEST")]) + 2
+    column = max([len(p.label) for p in printers] + [len("DEFERRED")]) + 2
+
+    lines = ["    RELIANCE FIRMWARE\n   FLEET TEST RESULTS\n",
+             "TEST".ljust(width) + "".join(p.label.ljust(column) for p in printers)]
+    for name in names:
+        row = name.ljust(width)
+        for printer in printers:
+            verdict = next((e.verdict for e in printer.tests_completed if e.name == name), "-")
+            row += verdict.ljust(column)
+        lines.append(row)
+    for printer in printers:
+        if printer.error:
+            lines.append(f"\n{printer.label} ({printer.port}): {printer.error}")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+    print(f"\nFleet summary saved to {path}")
+
+
+def run_fleet(config):
+    """:return: exit code, 0 when every printer passed every test (see RelianceTestSuite.exit_code)"""
+    try:
+        printers = pair_printers(config)
+    except ValueError as e:
+        print(e)
+        return 2
+    if "tests" in config:
+        select_tests(build_tests(None, None), config["tests"])  # Fail before any printer starts
+
+    out_dir = config.get("fleet_dir", datetime.datetime.now().strftime("fleet_%Y%m%d_%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"Running on {len(printers)} printer(s):")
+    for printer in printers:
+        print(f"- {printer.label}: {printer.port}")
+
+    threads = [threading.Thread(target=run_printer, args=(printer, config, out_dir), name=printer.label)
+               for printer in printers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    write_summary(printers, os.path.join(out_dir, "fleet_summary.txt"))
+    if metrics.enabled:
+        metrics.report()
+        metrics.dump(os.path.join(out_dir, "metrics.json"))
+    if any(p.error for p in printers):
+        return 1
+    codes = [exit_code(p.tests_completed, config) for p in printers]
+    return 1 if 1 in codes else max(codes, default=0)
@@ -0,0 +1,200 @@
+"""
+Logo bank upload.
+
+Turns an image into the printer's logo format and stores it in a logo bank:
+  1. grayscale, from an image file (needs Pillow), a PIL image or a NumPy
+     array (2D gray, RGB or RGBA; integers 0-255 or floats 0.0-1.0, white
+     high; bool arrays are dots),
+  2. scaled to the printable width of the paper (58/60/80mm) with bilinear
+     interpolation,
+  3. dithered with an 8x8 Bayer matrix, or thresholded,
+  4. packed 8 dots a byte, rows padded to whole bytes, MSB first, 1 = black
+     (np.packbits),
+  5. sent as LOGO_BANK_START, pipelined data frames and LOGO_BANK_COMMIT
+     with the byte sum.
+Steps 1-4 run as whole-array NumPy operations. The packed result is cached
+by content hash of the pixels and settings (see cache.py), so rolling one
+logo out to a fleet processes it once.
+
+    upload_logo(device, "logo.png", bank=0, paper=80)
+
+Or for every printer a run touches, with "logo" in the run config:
+    "logo": {"image": "logo.png", "bank": 0, "paper": 80, "dither": "bayer"}
+
+    python logo.py preview logo.png out.pbm [paper]
+    python logo.py upload logo.png [bank] [paper]
+"""
+import hashlib
+import struct
+import sys
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import transport
+from cache import ContentCache
+from commands import build_chunk_frames, byte_sum, max_chunk, write_command
+from corpus import PRINT_WIDTH
+
+# Bump when the processing changes so cached logos are rebuilt
+VERSION = 1
+
+LOGO_DATA = (0x80, 0x01)
+CHUNK = max_chunk(LOGO_DATA)
+DITHERS = ("bayer", "threshold")
+BAYER = np.array([[0, 32, 8, 40, 2, 34, 10, 42],
+                  [48, 16, 56, 24, 50, 18, 58, 26],
+                  [12, 44, 4, 36, 14, 46, 6, 38],
+                  [60, 28, 52, 20, 62, 30, 54, 22],
+                  [3, 35, 11, 43, 1, 33, 9, 41],
+                  [51, 19, 59, 27, 49, 17, 57, 25],
+                  [15, 47, 7, 39, 13, 45, 5, 37],
+                  [63, 31, 55, 23, 61, 29, 53, 21]], dtype=np.float32)
+BAYER = (BAYER + 0.5) / 64
+HEADER = struct.Struct("<HH")           # Cached entries: width, height, then the packed rows
+
+cache = ContentCache("logos", version=VERSION)
+
+
+def to_gray(source) -> np.ndarray:
+    """:return: float32 array, 0.0 black to 1.0 white"""
+    if isinstance(source, str):
+        if Image is None:
+            raise ValueError("Loading image files needs Pillow (pip install pillow); pass a NumPy array instead")
+        with Image.open(source) as image:
+            return to_gray(image)
+    if Image is not None and isinstance(source, Image.Image):
+        source = np.asarray(source.convert("LA"))
+    pixels = np.asarray(source)
+    if pixels.dtype == bool:
+        return np.where(pixels, 0.0, 1.0).astype(np.float32)        # True: a dot
+    full = 255 if np.issubdtype(pixels.dtype, np.integer) else 1.0
+    pixels = pixels.astype(np.float32) / full
+    if pixels.ndim == 3:
+        if pixels.shape[2] in (2, 4):
+            # Transparent pixels print as paper
+            alpha = pixels[..., -1:]
+            pixels = pixels[..., :-1] * alpha + (1 - alpha)
+        if pixels.shape[2] == 3:
+            pixels = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        else:
+            pixels = pixels[..., 0]
+    if pixels.ndim != 2 or not pixels.size:
+        raise ValueError(f"Expected a 2D gray, RGB or RGBA image, got shape {np.shape(source)}")
+    return pixels
+
+
+def scale(gray, width) -> np.ndarray:
+    """Bilinear resize to `width` dots, keeping the aspect ratio."""
+    rows, cols = gray.shape
+    height = max(1, round(rows * width / cols))
+    y = np.clip((np.arange(height) + 0.5) * rows / height - 0.5, 0, rows - 1)
+    x = np.clip((np.arange(width) + 0.5) * cols / width - 0.5, 0, cols - 1)
+    y0 = np.floor(y).astype(int)
+    x0 = np.floor(x).astype(int)
+    y1 = np.minimum(y0 + 1, rows - 1)
+    x1 = np.minimum(x0 + 1, cols - 1)
+    fy = (y - y0)[:, None]
+    fx = (x - x0)[None, :]
+    top = gray[y0][:, x0] * (1 - fx) + gray[y0][:, x1] * fx
+    bottom = gray[y1][:, x0] * (1 - fx) + gray[y1][:, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def dither(gray, method="bayer", threshold=0.5) -> np.ndarray:
+    """:return: bool array, True where a dot is printed"""
+    if method == "bayer":
+        rows, cols = gray.shape
+        matrix = np.tile(BAYER, (rows // 8 + 1, cols // 8 + 1))[:rows, :cols]
+        return gray < matrix
+    if method == "threshold":
+        return gray < threshold
+    raise ValueError(f"Unknown dither '{method}', expected one of {', '.join(DITHERS)}")
+
+
+def pack(dots) -> bytes:
+    return np.packbits(dots, axis=1).tobytes()
+
+
+def unpack(data):
+    """:return: bool dots of a prepared logo"""
+    width, height = HEADER.unpack_from(data)
+    packed = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size).reshape(height, -1)
+    return np.unpackbits(packed, axis=1)[:, :width].astype(bool)
+
+
+def fingerprint(gray):
+    return hashlib.sha256(np.ascontiguousarray(gray).tobytes() + str(gray.shape).encode()).hexdigest()
+
+
+def prepare(source, paper=80, width=None, dither_method="bayer", threshold=0.5):
+    """
+    :param width: dots, default the printable width of the paper
+    :return: (width, height, packed rows), from the cache when possible
+    """
+    if width is None:
+        if paper not in PRINT_WIDTH:
+            raise ValueError(f"Unsupported paper width {paper}, expected one of {sorted(PRINT_WIDTH)}")
+        width = PRINT_WIDTH[paper]
+    if dither_method not in DITHERS:
+        raise ValueError(f"Unknown dither '{dither_method}', expected one of {', '.join(DITHERS)}")
+    gray = to_gray(source)
+    spec = {"pixels": fingerprint(gray), "width": width, "dither": dither_method, "threshold": threshold}
+
+    def build(_):
+        dots = dither(scale(gray, width), dither_method, threshold)
+        return HEADER.pack(width, dots.shape[0]) + pack(dots)
+
+    data, _ = cache.get_or_build(spec, build)
+    width, height = HEADER.unpack_from(data)
+    return width, height, data[HEADER.size:]
+
+
+def upload_logo(device, source, bank=0, paper=80, width=None, dither="bayer", threshold=0.5, window=8):
+    """:return: True if the printer accepted the logo"""
+    width, height, packed = prepare(source, paper, width, dither, threshold)
+    data = packed + bytes(-len(packed) % CHUNK)
+    if write_command(device, "LOGO_BANK_START", {"bank": bank, "width": width, "height": height,
+                                                 "size": len(packed)}) == "NAK":
+        print(f"Printer refused logo bank {bank}")
+        return False
+    try:
+        transport.send_chunks(device, "LOGO_BANK_DATA", build_chunk_frames(LOGO_DATA, data, CHUNK), window)
+    except transport.TransferError as e:
+        print(f"Logo upload failed: {e}")
+        return False
+    if write_command(device, "LOGO_BANK_COMMIT", {"bank": bank, "checksum": byte_sum(packed)}) == "NAK":
+        print(f"Printer did not accept logo bank {bank}")
+        return False
+    print(f"Logo bank {bank}: {width}x{height} dots, {len(packed)} bytes")
+    return True
+
+
+def upload_config(device, options):
+    """Uploads the logo described by the "logo" key of a run config."""
+    options = dict(options)
+    return upload_logo(device, options.pop("image"), **options)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "preview":
+        import render
+        w, h, rows = prepare(sys.argv[2], int(sys.argv[4]) if len(sys.argv) == 5 else 80)
+        render.write_pbm(sys.argv[3], unpack(HEADER.pack(w, h) + rows))
+        print(f"{w}x{h} dots written to {sys.argv[3]}")
+    elif len(sys.argv) in (3, 4, 5) and sys.argv[1] == "upload":
+        from RelianceTestSuite import open_hid
+        hid_device = open_hid()
+        try:
+            ok = upload_logo(hid_device, sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 0,
+                             int(sys.argv[4]) if len(sys.argv) > 4 else 80)
+        finally:
+            hid_device.close()
+        sys.exit(0 if ok else 1)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,157 @@
+"""
+Per-command HID latency histograms and outcome counters.
+
+Off by default; when disabled, transport pays one attribute check per
+exchange. Turn on with metrics.enable() (or --metrics), query at any time:
+
+    metrics.stats["SAVE_CONFIG"].latency.quantile(0.95)
+    metrics.report()
+    metrics.dump("metrics.json")
+"""
+import json
+import math
+import threading
+
+import transport
+
+
+class LogHistogram:
+    """
+    Fixed-size histogram with logarithmically spaced buckets: constant time
+    add, bounded memory and a relative error of about 10**(1/per_decade) - 1
+    (7% by default) on any quantile.
+    """
+    def __init__(self, lo=1e-5, hi=1e3, per_decade=32):
+        self.lo = lo
+        self.hi = hi
+        self.per_decade = per_decade
+        self._log_lo = math.log10(lo)
+        self.counts = [0] * (int(math.ceil(math.log10(hi / lo) * per_decade)) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, value):
+        if value <= self.lo:
+            return 0
+        return min(len(self.counts) - 1, int((math.log10(value) - self._log_lo) * self.per_decade))
+
+    def _value(self, bucket):
+        # Geometric middle of the bucket
+        return 10 ** (self._log_lo + (bucket + 0.5) / self.per_decade)
+
+    def add(self, value):
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if (other.lo, other.hi, other.per_decade) != (self.lo, self.hi, self.per_decade):
+            raise ValueError("Histograms have different buckets")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen > rank:
+                return min(self.max, max(self.min, self._value(bucket)))
+        return self.max
+
+    def to_dict(self):
+        """Non-empty buckets as {upper bound: count}, plus the summary."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {f"{10 ** (self._log_lo + (b + 1) / self.per_decade):.6g}": n
+                        for b, n in enumerate(self.counts) if n},
+        }
+
+
+class CommandStats:
+    __slots__ = ("latency", "ack", "nak", "timeout", "checksum")
+
+    def __init__(self):
+        self.latency = LogHistogram()
+        self.ack = 0
+        self.nak = 0            # Firmware answered with something other than ACK
+        self.timeout = 0
+        self.checksum = 0
+
+    def to_dict(self):
+        return {"ack": self.ack, "nak": self.nak, "timeout": self.timeout,
+                "checksum": self.checksum, "latency_s": self.latency.to_dict()}
+
+
+enabled = False
+stats = {}              # command name: CommandStats
+_lock = threading.Lock()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        stats.clear()
+
+
+def record(command, rtt, result):
+    """Called by transport.exchange_once for every exchange while enabled."""
+    entry = stats.get(command)
+    if entry is None:
+        with _lock:
+            entry = stats.setdefault(command, CommandStats())
+    if result != "NAK":
+        entry.ack += 1
+        entry.latency.add(rtt)
+    elif result.reason == transport.TIMEOUT:
+        entry.timeout += 1
+    elif result.reason == transport.CHECKSUM:
+        entry.checksum += 1
+        entry.latency.add(rtt)
+    else:
+        entry.nak += 1
+        entry.latency.add(rtt)
+
+
+def report():
+    print(f"{'COMMAND':<32}{'ACK':>6}{'NAK':>5}{'T/O':>5}{'P50 ms':>9}{'P95 ms':>9}{'P99 ms':>9}{'MAX ms':>9}")
+    for name, entry in sorted(stats.items(), key=lambda item: -item[1].latency.total):
+        h = entry.latency
+        cells = [f"{1000 * v:>9.2f}" if v is not None else f"{'-':>9}"
+                 for v in (h.quantile(0.5), h.quantile(0.95), h.quantile(0.99), h.max if h.count else None)]
+        print(f"{name:<32}{entry.ack:>6}{entry.nak + entry.checksum:>5}{entry.timeout:>5}" + "".join(cells))
+
+
+def dump(path):
+    with open(path, "w") as f:
+        json.dump({name: entry.to_dict() for name, entry in stats.items()}, f, indent=2)
@@ -1,5 +1,87 @@
 import struct
 
+import numpy as np
+
+STATUS_STRUCT = struct.Struct('<5sBBHHHHHBB')  # 19 byte Get Printer Status payload
+STATUS_SIZE = STATUS_STRUCT.size
+
+# Same layout as STATUS_STRUCT, for decoding many frames at once
+STATUS_FIELDS = ("head_voltage", "head_temp", "sensor_status", "presenter_raw", "path_raw",
+                 "paper_raw", "notch_raw", "arm_raw", "ticket_status", "error_status")
+STATUS_FORMATS = ("S5", "u1", "u1", "<u2", "<u2", "<u2", "<u2", "<u2", "u1", "u1")
+STATUS_DTYPE = np.dtype({"names": STATUS_FIELDS, "formats": STATUS_FORMATS})
+
+TICKET_STATES = {
+    0: "Idle",
+    1: "Printing",
+    2: "Unpresented",
+    3: "Presented",
+}
+
+# Bit n of the bit field is the n-th name
+SENSOR_FLAGS = ("Platen", "Cutter Home", "Tach Status", "Presenter Paper",
+                "Path Paper", "Paper Sensor", "Notch Sensor", "Arm Sensor")
+ERROR_FLAGS = ("Jammed", "Overheated", "Cutter Error", "Voltage High",
+               "Voltage Low", "Platen Open", "Reserved", "Unknown Error")
+
+FLAG_MASKS = (1 << np.arange(8)).astype(np.uint8)
+
+
+class StatusRecord:
+    """One decoded status sample. Bit fields stay packed until asked for."""
+    __slots__ = STATUS_FIELDS
+
+    def __init__(self, head_voltage, head_temp, sensor_status, presenter_raw, path_raw,
+                 paper_raw, notch_raw, arm_raw, ticket_status, error_status):
+        self.head_voltage = head_voltage
+        self.head_temp = head_temp
+        self.sensor_status = sensor_status
+        self.presenter_raw = presenter_raw
+        self.path_raw = path_raw
+        self.paper_raw = paper_raw
+        self.notch_raw = notch_raw
+        self.arm_raw = arm_raw
+        self.ticket_status = ticket_status
+        self.error_status = error_status
+
+    @classmethod
+    def from_bytes(cls, response: bytes, offset=0):
+        if len(response) - offset < STATUS_SIZE:
+            raise ValueError("Response is too short to be valid")
+        return cls(*STATUS_STRUCT.unpack_from(response, offset))
+
+    def __iter__(self):
+        return (getattr(self, name) for name in STATUS_FIELDS)
+
+    def __repr__(self):
+        return f"StatusRecord({self.ticket_state}, {self.head_temp}C, errors=0x{self.error_status:02X})"
+
+    @property
+    def ticket_state(self) -> str:
+        return TICKET_STATES.get(self.ticket_status, "Unknown")
+
+    def sensor(self, name) -> bool:
+        return bool(self.sensor_status & (1 << SENSOR_FLAGS.index(name)))
+
+    def error(self, name) -> bool:
+        return bool(self.error_status & (1 << ERROR_FLAGS.index(name)))
+
+    def to_dict(self):
+        """The nested display dictionary returned by parse_printer_status."""
+        return {
+            "Head Voltage": self.head_voltage.decode('ascii'),
+            "Head Temp (°C)": self.head_temp,
+            "Sensor Status": {name: bool(self.sensor_status & (1 << bit)) for bit, name in enumerate(SENSOR_FLAGS)},
+            "Presenter Sensor Raw": self.presenter_raw,
+            "Path Sensor Raw": self.path_raw,
+            "Paper Sensor Raw": self.paper_raw,
+            "Notch Sensor Raw": self.notch_raw,
+            "Arm Sensor Raw": self.arm_raw,
+            "Ticket Status": self.ticket_state,
+            "Error Status": {name: bool(self.error_status & (1 << bit)) for bit, name in enumerate(ERROR_FLAGS)},
+        }
+
+
 def parse_printer_status(response: bytes):
     """
     Parses the Get Printer Status response.
@@ -7,60 +89,37 @@ def parse_printer_status(response: bytes):
     :param response: A bytes object containing the printer status data.
     :return: A dictionary with parsed values.
     """
-    if len(response) < 16:  # Ensure minimum valid length
-        raise ValueError("Response is too short to be valid")
-
-    # Extract fields from the response
-    head_voltage = response[:5].decode('ascii')  # 5-byte ASCII string
-    head_temp = response[5]  # 1 byte integer
-    sensor_status = response[6]  # 1 byte bit field
-    presenter_sensor_raw = struct.unpack_from('<H', response, 7)[0]  # uint16_t
-    path_sensor_raw = struct.unpack_from('<H', response, 9)[0]
-    paper_sensor_raw = struct.unpack_from('<H', response, 11)[0]
-    notch_sensor_raw = struct.unpack_from('<H', response, 13)[0]
-    arm_sensor_raw = struct.unpack_from('<H', response, 15)[0]
-    ticket_status = response[17]  # 1 byte
-    error_status = response[18]  # 1 byte bit field
-
-    # Decode bit fields
-    sensor_flags = {
-        "Platen": bool(sensor_status & 0b00000001),
-        "Cutter Home": bool(sensor_status & 0b00000010),
-        "Tach Status": bool(sensor_status & 0b00000100),
-        "Presenter Paper": bool(sensor_status & 0b00001000),
-        "Path Paper": bool(sensor_status & 0b00010000),
-        "Paper Sensor": bool(sensor_status & 0b00100000),
-        "Notch Sensor": bool(sensor_status & 0b01000000),
-        "Arm Sensor": bool(sensor_status & 0b10000000),
-    }
-
-    error_flags = {
-        "Jammed": bool(error_status & 0b00000001),
-        "Overheated": bool(error_status & 0b00000010),
-        "Cutter Error": bool(error_status & 0b00000100),
-        "Voltage High": bool(error_status & 0b00001000),
-        "Voltage Low": bool(error_status & 0b00010000),
-        "Platen Open": bool(error_status & 0b00100000),
-        "Reserved": bool(error_status & 0b01000000),
-        "Unknown Error": bool(error_status & 0b10000000),
-    }
-
-    ticket_status_meaning = {
-        0: "Idle",
-        1: "Printing",
-        2: "Unpresented",
-        3: "Presented",
-    }
-
-    return {
-        "Head Voltage": head_voltage,
-        "Head Temp (°C)": head_temp,
-        "Sensor Status": sensor_flags,
-        "Presenter Sensor Raw": presenter_sensor_raw,
-        "Path Sensor Raw": path_sensor_raw,
-        "Paper Sensor Raw": paper_sensor_raw,
-        "Notch Sensor Raw": notch_sensor_raw,
-        "Arm Sensor Raw": arm_sensor_raw,
-        "Ticket Status": ticket_status_meaning.get(ticket_status, "Unknown"),
-        "Error Status": error_flags,
-    }
+    return StatusRecord.from_bytes(response).to_dict()
+
+
+def parse_printer_status_batch(buffer, stride=STATUS_SIZE) -> np.ndarray:
+    """
+    Decodes N concatenated status frames with a single np.frombuffer call.
+
+    :param buffer: bytes-like holding the frames back to back
+    :param stride: distance between frames, if each is padded (e.g. whole HID reports)
+    :return: structured array with STATUS_DTYPE fields
+    """
+    if stride < STATUS_SIZE:
+        raise ValueError(f"stride must be at least {STATUS_SIZE}")
+    dtype = STATUS_DTYPE
+    if stride != STATUS_SIZE:
+        dtype = np.dtype({"names": STATUS_FIELDS, "formats": STATUS_FORMATS,
+                          "offsets": [STATUS_DTYPE.fields[name][1] for name in STATUS_FIELDS],
+                          "itemsize": stride})
+    return np.frombuffer(buffer, dtype=dtype, count=len(buffer) // stride)
+
+
+def decode_flags(bitfield) -> np.ndarray:
+    """Expands a uint8 array of bit fields into an (N, 8) bool array, column n = bit n."""
+    return (np.asarray(bitfield, dtype=np.uint8)[..., None] & FLAG_MASKS) != 0
+
+
+def sensor_flags(batch) -> np.ndarray:
+    """(N, 8) bool array of sensor flags, columns ordered as SENSOR_FLAGS."""
+    return decode_flags(batch["sensor_status"])
+
+
+def error_flags(batch) -> np.ndarray:
+    """(N, 8) bool array of error flags, columns ordered as ERROR_FLAGS."""
+    return decode_flags(batch["error_status"])
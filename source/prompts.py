@@ -0,0 +1,140 @@
+"""
+Operator interaction for the tests.
+
+Interactive runs go through input() exactly as before. In headless mode
+instructions are only printed, values come from the run config, and pass/fail
+questions are answered by an automatic check when the test has one, or
+recorded as a deferred verdict for someone to review against the printed
+tickets later.
+"""
+import datetime
+import json
+import threading
+
+from results import timed
+
+PASSED = "PASSED"
+FAILED = "FAILED"
+DEFERRED = "DEFERRED"
+
+
+class OperatorRequired(Exception):
+    """Raised in headless mode when a test needs a value nobody provided."""
+    def __init__(self, key):
+        super().__init__(f"needs operator input '{key}'")
+        self.key = key
+
+
+class Prompter:
+    """Interactive operator: blocks on input()."""
+    headless = False
+
+    def __init__(self):
+        self.test = None            # Name of the running test
+        self.instructions = {}      # Last instructions shown per test
+        self.deferred = []          # Deferred verdicts (headless only)
+
+    def begin(self, test_name):
+        self.test = test_name
+
+    def pause(self, message, until=None):
+        self.instructions.setdefault(self.test, message)
+        with timed("operator"):
+            input(message)
+
+    def ask(self, key, message, default=None):
+        with timed("operator"):
+            return input(message)
+
+    def confirm(self, test_name, auto=None):
+        """:return: True/False, or None if the verdict is deferred"""
+        while True:
+            with timed("operator"):
+                status = input(f"Pass? (y/n): ").strip().lower()
+            if status in ['y', 'n']:
+                return status == 'y'
+            print("Invalid input. Please enter 'y' or 'n'.")
+
+
+class HeadlessPrompter(Prompter):
+    """
+    Unattended operator.
+
+    :param answers: {"TEST_NAME": {"key": value or [values...]}, "key": value}
+        Lists are handed out one element per ask(), e.g. scanned redemption codes.
+    """
+    headless = True
+
+    def __init__(self, answers=None):
+        super().__init__()
+        self.answers = answers or {}
+        self._used = {}
+
+    def pause(self, message, until=None):
+        self.instructions.setdefault(self.test, message)
+        print(message.replace("Press Enter to continue...", "").replace("Press Enter to begin...", "").rstrip())
+        if until is not None:
+            until()
+
+    def ask(self, key, message, default=None):
+        scoped = self.answers.get(self.test, {})
+        value = scoped.get(key, self.answers.get(key, default))
+        if isinstance(value, list):
+            i = self._used.get((self.test, key), 0)
+            self._used[(self.test, key)] = i + 1
+            value = value[i] if i < len(value) else None
+        if value is None:
+            raise OperatorRequired(key)
+        print(f"{message}{value}")
+        return str(value)
+
+    def confirm(self, test_name, auto=None):
+        if auto is not None:
+            print(f"Automatic check: {'pass' if auto else 'fail'}")
+            return bool(auto)
+        self.defer(self.test or test_name, "ticket inspection")
+        return None
+
+    def defer(self, test_name, reason):
+        self.deferred.append({
+            "test": test_name,
+            "reason": reason,
+            "instructions": self.instructions.get(self.test, ""),
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        })
+        print(f"{test_name} - verdict deferred ({reason})")
+
+    def save_deferred(self, path):
+        with open(path, "w") as f:
+            json.dump(self.deferred, f, indent=2)
+
+
+_default = Prompter()
+_local = threading.local()
+
+
+def current() -> Prompter:
+    """The prompter for this thread (fleet runs give each printer thread its own)."""
+    return getattr(_local, "prompter", None) or _default
+
+
+def use_headless(answers=None, thread_local=False):
+    global _default
+    prompter = HeadlessPrompter(answers)
+    if thread_local:
+        _local.prompter = prompter
+    else:
+        _default = prompter
+    return prompter
+
+
+def pause(message, until=None):
+    """
+    Shows instructions and waits for Enter. In headless mode `until` (e.g. a
+    status wait) is run instead, so the test still waits for the printer.
+    """
+    current().pause(message, until)
+
+
+def ask(key, message, default=None):
+    return current().ask(key, message, default)
@@ -0,0 +1,462 @@
+"""
+Offline ESC/POS renderer and golden image checks.
+
+TicketRecorder listens to the bytes a test writes to the serial port and to
+the CR/LF/truncate-whitespace/CPI-lock settings the printer acknowledges
+over HID, and renders every ticket into a NumPy bitmap (one byte per dot,
+1 = black) the way the printer lays it out:
+
+  - characters in cells sized by CPI, font, ESC !/GS ! scaling and ESC SP
+    spacing, with bold, underline, reverse and upside down, positioned by
+    ESC $/ESC \ and wrapped at the print area width,
+  - CR and LF starting a new line only while enabled in the printer config,
+  - line spacing, ESC J/ESC d feeds, alignment, left margin, barcodes,
+  - a ticket ending at a form feed or GS V cut, with trailing blank paper
+    removed while truncate whitespace is on.
+
+Glyphs are placeholder patterns, one per character code, not the printer's
+fonts: the bitmaps check layout (what lands on which line, widths, spacing,
+feeds, cuts), not typography.
+
+Goldens compares the tickets of a test with stored images (PBM files,
+viewable in most image tools). The first run of a test records them; check
+those once by eye. Later runs match if no ticket differs in more than
+`tolerance` of its dots, and write .actual/.diff images when one does.
+The images are rendered from the bytes the suite sent and the settings it
+believes were acked, so goldens are a regression check on the sent stream:
+a mismatch fails a test, a match does not replace the operator's look at
+the paper.
+
+    python render.py main.bin [out_dir]       render a binary to PBM files
+"""
+import hashlib
+import os
+import sys
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+
+import transport
+from commands import config_mirror
+from corpus import CPI, PRINT_WIDTH
+from escpos import CONTROL, TEXT, tokenize
+
+DPI = 203
+FONT_HEIGHT = {"A": 24, "B": 17}
+LINE_SPACING = 30                       # ESC 2
+BARCODE_HEIGHT = 80                     # GS h default
+SETTINGS = {                            # HID command: printer setting the renderer follows
+    "SET_CR_CFG": "cr",
+    "SET_LF_CFG": "lf",
+    "SET_TRUNCATE_WS": "truncate_ws",
+    "SET_LOCK_CPI": "lock_cpi",
+}
+# Assumed printer state when nothing was set in this run
+DEFAULTS = {"cr": False, "lf": True, "truncate_ws": False, "lock_cpi": False}
+CPI_CODES = {code: cpi for cpi, code in CPI.items()}
+
+goldens = None                          # Goldens when golden image checks are on
+
+
+def _glyph_bits(code):
+    return np.unpackbits(np.frombuffer(hashlib.sha256(bytes([code])).digest(), dtype=np.uint8))
+
+
+_glyphs = {}
+
+
+def glyph(code, width, height):
+    """Placeholder glyph for a character code: a fixed dot pattern with a blank border."""
+    key = (code, width, height)
+    if key not in _glyphs:
+        cell = np.zeros((height, width), dtype=np.uint8)
+        if code > 0x20 and width > 2 and height > 2:
+            bits = _glyph_bits(code)
+            inner = (height - 2) * (width - 2)
+            cell[1:-1, 1:-1] = np.resize(bits, inner).reshape(height - 2, width - 2)
+        _glyphs[key] = cell
+    return _glyphs[key]
+
+
+class Renderer:
+    """
+    Feed it bytes with feed() and settings with set(); finished tickets
+    collect in .tickets, unknown commands are counted in .ignored.
+    """
+    def __init__(self, paper=80, **settings):
+        self.paper = paper
+        self.settings = dict(DEFAULTS, **settings)
+        self.tickets = []
+        self.ignored = Counter()
+        self._pending = b""
+        self._rows = []             # Bitmaps of finished lines and feeds of the current ticket
+        self._line = []             # (x, cell) of the line being built
+        self._x = 0
+        self.reset()
+
+    def reset(self):
+        """ESC @: formatting back to defaults (the printer config is kept)."""
+        self.width = PRINT_WIDTH[self.paper]
+        self.margin = 0
+        self.font = "A"
+        self.cpi = 11
+        self.bold = self.underline = self.reverse = self.upside_down = False
+        self.char_spacing = 0
+        self.scale_w = self.scale_h = 1
+        self.align = 0
+        self.spacing = LINE_SPACING
+        self.barcode_height = BARCODE_HEIGHT
+        self.barcode_module = 2
+        self.hri = 0
+
+    def set(self, name, value):
+        self.settings[name] = value
+
+    # Input
+
+    def feed(self, data):
+        """Renders data; a command split across feed() calls is kept until it is complete."""
+        data = self._pending + bytes(data)
+        tokens, complete = tokenize(data, partial=True)
+        self._pending = data[complete:]
+        for token in tokens:
+            chunk = data[token.offset:token.offset + token.length]
+            if token.kind == TEXT:
+                for code in chunk:
+                    self._char(code)
+            elif token.kind == CONTROL:
+                self._control(token.name)
+            else:
+                self._command(token.name, chunk)
+
+    def _control(self, name):
+        if name == "LF":
+            if self.settings["lf"]:
+                self._newline()
+        elif name == "CR":
+            if self.settings["cr"]:
+                self._newline()
+        elif name == "FF":
+            self.cut()
+        elif name == "HT":
+            self._x += 8 * self._cell_width()
+
+    def _command(self, name, chunk):
+        n = chunk[2] if len(chunk) > 2 else 0
+        if name == "ESC @":
+            self._end_line()
+            self.reset()
+        elif name == "ESC !":
+            self.font = "B" if n & 0x01 else "A"
+            self.bold = bool(n & 0x08)
+            self.scale_h = 2 if n & 0x10 else 1
+            self.scale_w = 2 if n & 0x20 else 1
+            self.underline = bool(n & 0x80)
+        elif name == "ESC E":
+            self.bold = bool(n & 1)
+        elif name == "ESC -":
+            self.underline = n in (1, 2, 0x31, 0x32)
+        elif name == "ESC M":
+            self.font = "B" if n in (1, 0x31) else "A"
+        elif name == "GS !":
+            self.scale_w, self.scale_h = (n >> 4) + 1, (n & 0x07) + 1
+        elif name == "GS B":
+            self.reverse = bool(n & 1)
+        elif name == "ESC 0xC1":
+            if not self.settings["lock_cpi"]:
+                self.cpi = CPI_CODES.get(n, self.cpi)
+        elif name == "ESC 0x20":
+            self.char_spacing = n
+        elif name == "ESC $":
+            self._x = chunk[2] + 256 * chunk[3]
+        elif name == "ESC \\":
+            self._x = max(0, self._x + int.from_bytes(chunk[2:4], "little", signed=True))
+        elif name == "ESC {":
+            self.upside_down = bool(n & 1)
+        elif name == "ESC a":
+            self.align = n % 0x30 if n >= 0x30 else n
+        elif name == "ESC 2":
+            self.spacing = LINE_SPACING
+        elif name == "ESC 3":
+            self.spacing = n
+        elif name == "ESC J":
+            self._end_line()
+            self._blank(n)
+        elif name == "ESC d":
+            self._end_line()
+            self._blank(n * self.spacing)
+        elif name == "GS L":
+            self.margin = min(chunk[2] + 256 * chunk[3], PRINT_WIDTH[self.paper] - 1)
+        elif name == "GS W":
+            self.width = max(1, min(chunk[2] + 256 * chunk[3], PRINT_WIDTH[self.paper]))
+        elif name == "GS h":
+            self.barcode_height = n
+        elif name == "GS w":
+            self.barcode_module = max(1, n)
+        elif name == "GS H":
+            self.hri = n % 0x30 if n >= 0x30 else n
+        elif name == "GS k":
+            self._barcode(chunk)
+        elif name == "GS V":
+            self.cut()
+        elif name == "ESC FF":
+            # Page mode: print what is buffered, the ticket carries on
+            self._end_line()
+        elif name in ("ESC t", "ESC L", "ESC S", "ESC 4", "ESC V", "GS e", "GS f", "GS P"):
+            # Glyphs are per byte and not the printer's (code page, italic, rotation),
+            # page mode lays out like standard mode here
+            pass
+        else:
+            self.ignored[name] += 1
+
+    # Layout
+
+    def _cell_width(self):
+        width = round(DPI / self.cpi)
+        return (width * 3 // 4 if self.font == "B" else width) * self.scale_w + self.char_spacing
+
+    def _char(self, code):
+        width = self._cell_width()
+        height = FONT_HEIGHT[self.font] * self.scale_h
+        if self.margin + self._x + width > self.width and self._line:
+            self._newline()
+        cell = glyph(code, (width - self.char_spacing) // self.scale_w, height // self.scale_h)
+        if self.scale_w > 1 or self.scale_h > 1:
+            cell = np.repeat(np.repeat(cell, self.scale_h, axis=0), self.scale_w, axis=1)
+        if self.bold:
+            cell = cell.copy()
+            cell[:, 1:] |= cell[:, :-1]
+        if self.underline:
+            cell = cell.copy()
+            cell[-1, :] = 1
+        if self.reverse:
+            cell = 1 - cell
+        self._line.append((self._x, cell))
+        self._x += width
+
+    def _barcode(self, chunk):
+        data = chunk[3:-1] if chunk[2] <= 6 else chunk[4:]
+        if not data:
+            return
+        self._end_line()
+        modules = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+        bars = np.repeat(modules, self.barcode_module)[:self.width]
+        image = np.tile(bars, (self.barcode_height, 1)).astype(np.uint8)
+        if self.hri in (1, 3):
+            self._text_line(data)
+        self._place(image)
+        if self.hri in (2, 3):
+            self._text_line(data)
+
+    def _text_line(self, data):
+        for code in data:
+            self._char(code)
+        self._end_line()
+
+    def _place(self, image):
+        """Adds a finished line, aligned within the print area."""
+        row = np.zeros((image.shape[0], PRINT_WIDTH[self.paper]), dtype=np.uint8)
+        area = self.width - self.margin
+        used = min(image.shape[1], area)
+        offset = self.margin + (0, (area - used) // 2, area - used)[min(self.align, 2)]
+        row[:, offset:offset + used] = image[:, :used]
+        self._rows.append(row)
+
+    def _blank(self, dots):
+        if dots > 0:
+            self._rows.append(np.zeros((dots, PRINT_WIDTH[self.paper]), dtype=np.uint8))
+
+    def _end_line(self):
+        """Prints the characters on the current line without feeding past it."""
+        if not self._line:
+            return
+        height = max(cell.shape[0] for _, cell in self._line)
+        width = max(x + cell.shape[1] for x, cell in self._line)
+        image = np.zeros((height, width), dtype=np.uint8)
+        for x, cell in self._line:
+            image[height - cell.shape[0]:, x:x + cell.shape[1]] = cell
+        self._place(image[::-1, ::-1] if self.upside_down else image)
+        self._line = []
+        self._x = 0
+
+    def _newline(self):
+        height = max((cell.shape[0] for _, cell in self._line), default=0)
+        self._end_line()
+        self._blank(max(self.spacing - height, 0) if height else self.spacing)
+
+    def cut(self):
+        """Ends the current ticket (form feed or cutter)."""
+        self._end_line()
+        ticket = np.vstack(self._rows) if self._rows else np.zeros((0, PRINT_WIDTH[self.paper]), dtype=np.uint8)
+        if self.settings["truncate_ws"]:
+            inked = np.flatnonzero(ticket.any(axis=1))
+            ticket = ticket[:inked[-1] + 1] if inked.size else ticket[:0]
+        self.tickets.append(ticket)
+        self._rows = []
+
+
+def _serial_port(ser):
+    # The ObservedSerial under a SerialWriter, so only this test's bytes are rendered
+    while ser is not None and not isinstance(ser, transport.ObservedSerial):
+        ser = vars(ser).get("ser")
+    return ser
+
+
+class TicketRecorder:
+    """Renders what is sent to one printer while subscribed to transport."""
+    def __init__(self, ser, device, paper=80):
+        self.device = device
+        self.port = _serial_port(ser)
+        self.renderer = Renderer(paper)
+        self._sent = {}
+        # Settings the printer already holds from earlier in the run
+        for command, frame in config_mirror.state(device):
+            if command in SETTINGS:
+                self.renderer.set(SETTINGS[command], bool(bytes.fromhex(frame)[-2]))
+
+    def __call__(self, kind, data, **info):
+        if kind == transport.SERIAL_TX:
+            if self.port is None or info.get("port") is self.port:
+                self.renderer.feed(data)
+        elif info.get("device") is self.device and info.get("command") in SETTINGS:
+            # Apply a setting once the printer acknowledged it
+            if kind == transport.HID_TX:
+                self._sent[info["command"]] = bool(data[-2])
+            elif kind == transport.HID_RX and len(data) > 3 and data[3] == 0xAA:
+                self.renderer.set(SETTINGS[info["command"]], self._sent.pop(info["command"], True))
+
+    def tickets(self):
+        return self.renderer.tickets
+
+
+@contextmanager
+def recording(ser, device, paper=80):
+    """Yields a TicketRecorder while golden image checks are on, else None."""
+    if goldens is None:
+        yield None
+        return
+    recorder = TicketRecorder(ser, device, paper)
+    transport.subscribe(recorder)
+    try:
+        yield recorder
+        ser.flush()
+    finally:
+        transport.unsubscribe(recorder)
+
+
+# Golden images
+
+def write_pbm(path, bitmap):
+    height, width = bitmap.shape
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(f"P4\n{width} {height}\n".encode("ascii"))
+        f.write(np.packbits(bitmap.astype(bool), axis=1).tobytes())
+    os.replace(tmp, path)
+
+
+def read_pbm(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    fields = []
+    i = 0
+    while len(fields) < 3:
+        while data[i:i + 1].isspace():
+            i += 1
+        if data[i:i + 1] == b"#":
+            i = data.index(b"\n", i)
+            continue
+        start = i
+        while not data[i:i + 1].isspace():
+            i += 1
+        fields.append(data[start:i])
+    if fields[0] != b"P4":
+        raise ValueError(f"{path} is not a binary PBM file")
+    width, height = int(fields[1]), int(fields[2])
+    packed = np.frombuffer(data[i + 1:], dtype=np.uint8).reshape(height, (width + 7) // 8)
+    return np.unpackbits(packed, axis=1)[:, :width]
+
+
+def stack(bitmaps, shape):
+    """Bitmaps zero-padded to a common shape, as one (n, height, width) array."""
+    out = np.zeros((len(bitmaps),) + shape, dtype=np.uint8)
+    for i, bitmap in enumerate(bitmaps):
+        out[i, :bitmap.shape[0], :bitmap.shape[1]] = bitmap
+    return out
+
+
+class Goldens:
+    """
+    :param folder: where <test>_<ticket>.pbm golden images live
+    :param tolerance: fraction of differing dots a ticket may have and still pass
+    """
+    def __init__(self, folder, tolerance=0.001):
+        self.folder = folder
+        self.tolerance = tolerance
+
+    def path(self, name, index, kind=""):
+        return os.path.join(self.folder, f"{name}_{index + 1}{kind}.pbm")
+
+    def load(self, name):
+        images = []
+        while os.path.exists(self.path(name, len(images))):
+            images.append(read_pbm(self.path(name, len(images))))
+        return images
+
+    def record(self, name, tickets):
+        os.makedirs(self.folder, exist_ok=True)
+        for i, ticket in enumerate(tickets):
+            write_pbm(self.path(name, i), ticket)
+
+    def check(self, name, tickets):
+        """
+        :return: True if every ticket matches its golden image, False if any
+            differs (or the ticket count does), None when the goldens were just recorded
+        """
+        golden = self.load(name)
+        if not golden:
+            self.record(name, tickets)
+            print(f"Recorded {len(tickets)} golden image(s) for {name} in {self.folder}; check them once by eye")
+            return None
+        if len(golden) != len(tickets):
+            print(f"{name}: {len(tickets)} ticket(s) rendered, {len(golden)} golden image(s)")
+            return False
+        shape = (max(b.shape[0] for b in golden + tickets), max(b.shape[1] for b in golden + tickets))
+        expected, actual = stack(golden, shape), stack(tickets, shape)
+        diff = expected ^ actual
+        fractions = np.count_nonzero(diff, axis=(1, 2)) / (shape[0] * shape[1] or 1)
+        failed = np.flatnonzero(fractions > self.tolerance)
+        for i in failed:
+            print(f"{name} ticket {i + 1}: {100 * fractions[i]:.2f}% of dots differ from the golden image")
+            write_pbm(self.path(name, i, ".actual"), tickets[i])
+            write_pbm(self.path(name, i, ".diff"), diff[i])
+        if failed.size:
+            return False
+        print(f"{name}: {len(tickets)} ticket(s) match the golden images")
+        return True
+
+
+def render_file(path, paper=80, **settings):
+    """:return: Renderer that has rendered a whole binary"""
+    renderer = Renderer(paper, **settings)
+    with open(path, "rb") as f:
+        renderer.feed(f.read())
+    if renderer._rows or renderer._line:
+        renderer.cut()
+    return renderer
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(__doc__)
+        sys.exit(1)
+    renderer = render_file(sys.argv[1])
+    out = sys.argv[2] if len(sys.argv) == 3 else "."
+    os.makedirs(out, exist_ok=True)
+    base = os.path.splitext(os.path.basename(sys.argv[1]))[0]
+    for i, ticket in enumerate(renderer.tickets):
+        write_pbm(os.path.join(out, f"{base}_{i + 1}.pbm"), ticket)
+    print(f"Rendered {len(renderer.tickets)} ticket(s) to {out}")
+    if renderer.ignored:
+        print("Not rendered: " + ", ".join(f"{name} x{n}" for name, n in renderer.ignored.most_common()))
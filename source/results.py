@@ -0,0 +1,222 @@
+"""
+Structured, crash-safe test results.
+
+Every test run is a step. While a step is open, the thread running it
+collects HID command latencies, serial bytes, fixed sleeps, status-driven
+waits, operator time and printer status snapshots. Events are appended to a
+JSONL file as they happen (flushed per line), and the JUnit XML file is
+rewritten after every test, so a crash only loses the test in progress.
+
+    writer = ResultsWriter("run.jsonl", "run.xml").start()
+    step = writer.begin("CRLF")
+    ...run the test...
+    writer.end(step, success=True)
+    writer.close()
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+
+import transport
+
+_local = threading.local()
+
+
+class Step:
+    """Metrics of one test run, filled in by the thread running the test."""
+    def __init__(self, writer, name, attempt):
+        self.writer = writer
+        self.name = name
+        self.attempt = attempt
+        self.started = datetime.datetime.now().isoformat(timespec="milliseconds")
+        self.t0 = time.monotonic()
+        self.duration = None
+        self.commands = {}          # command: [count, total_s, max_s, naks]
+        self.serial_bytes = 0
+        self.serial_writes = 0
+        self.serial_first = None
+        self.serial_last = None
+        self.sleep_s = 0.0          # Fixed time.sleep delays
+        self.printer_wait_s = 0.0   # Status-driven waits for the printer
+        self.operator_s = 0.0       # Blocked on input()
+        self.status = []
+        self.success = None
+        self.deferred = False
+        self.verdict = None
+
+    def command(self, name, rtt, ok):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = [0, 0.0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += rtt
+        stats[2] = max(stats[2], rtt)
+        stats[3] += not ok
+
+    def serial(self, size):
+        now = time.monotonic()
+        if self.serial_first is None:
+            self.serial_first = now
+        self.serial_last = now
+        self.serial_bytes += size
+        self.serial_writes += 1
+
+    def summary(self):
+        span = (self.serial_last - self.serial_first) if self.serial_writes > 1 else 0
+        hid_s = sum(stats[1] for stats in self.commands.values())
+        return {
+            "duration_s": round(self.duration, 3),
+            "hid_s": round(hid_s, 3),
+            "sleep_s": round(self.sleep_s, 3),
+            "printer_wait_s": round(self.printer_wait_s, 3),
+            "operator_s": round(self.operator_s, 3),
+            "serial_bytes": self.serial_bytes,
+            "serial_writes": self.serial_writes,
+            "serial_Bps": round(self.serial_bytes / span) if span > 0 else None,
+            "commands": {name: {"count": count, "mean_ms": round(1000 * total / count, 2),
+                                "max_ms": round(1000 * peak, 2), "naks": naks}
+                         for name, (count, total, peak, naks) in self.commands.items()},
+            "status_samples": len(self.status),
+        }
+
+
+def current():
+    """The step open in this thread, or None."""
+    return getattr(_local, "step", None)
+
+
+def sleep(seconds):
+    """time.sleep that is accounted to the current step."""
+    time.sleep(seconds)
+    step = current()
+    if step is not None:
+        step.sleep_s += seconds
+
+
+@contextmanager
+def timed(kind):
+    """Accounts the time spent in the block to the current step ("operator" or "printer_wait")."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        step = current()
+        if step is not None:
+            setattr(step, kind + "_s", getattr(step, kind + "_s") + time.monotonic() - start)
+
+
+def record_status(record):
+    """Adds a StatusRecord snapshot to the current step and streams it, if anything but the time changed."""
+    step = current()
+    if step is None:
+        return
+    snapshot = {"ticket": record.ticket_state, "head_temp": record.head_temp,
+                "sensors": record.sensor_status, "errors": record.error_status}
+    if step.status and all(step.status[-1][key] == value for key, value in snapshot.items()):
+        return
+    snapshot["t"] = round(time.monotonic() - step.t0, 3)
+    step.status.append(snapshot)
+    step.writer.event("status", step.name, **snapshot)
+
+
+class ResultsWriter:
+    """
+    :param jsonl_path: event stream, one JSON object per line
+    :param junit_path: JUnit XML, rewritten after every test (None to skip)
+    """
+    def __init__(self, jsonl_path, junit_path=None, suite="RelianceRegression", properties=None):
+        self.jsonl_path = jsonl_path
+        self.junit_path = junit_path
+        self.suite = suite
+        self.properties = properties or {}
+        self.cases = {}             # test name: latest finished Step, with its verdict
+        self._attempts = {}
+        self._buffered = set()      # Ports under a SerialWriter, counted by SERIAL_WRITE
+        self._lock = threading.Lock()
+        self._file = open(jsonl_path, "a", encoding="utf-8")
+
+    def start(self):
+        self.event("run_start", None, **self.properties)
+        transport.subscribe(self)
+        return self
+
+    def close(self):
+        transport.unsubscribe(self)
+        self.event("run_end", None)
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def event(self, kind, test, **data):
+        line = json.dumps({"event": kind, "test": test, "time": round(time.time(), 3), **data})
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def __call__(self, kind, data, **info):
+        # Transport observer, runs in the thread that sent the frame
+        step = current()
+        if step is None or step.writer is not self:
+            return
+        if kind == transport.HID_RX:
+            ok = len(data) > 3 and data[3] == transport.ACK_BYTE
+            step.command(info["command"], info["rtt"], ok)
+            self.event("command", step.name, command=info["command"],
+                       rtt_ms=round(1000 * info["rtt"], 2), ok=ok)
+        elif kind == transport.SERIAL_WRITE:
+            self._buffered.add(id(info.get("port")))
+            step.serial(len(data))
+        elif kind == transport.SERIAL_TX and id(info.get("port")) not in self._buffered:
+            step.serial(len(data))
+
+    def begin(self, name) -> Step:
+        self._attempts[name] = self._attempts.get(name, 0) + 1
+        step = Step(self, name, self._attempts[name])
+        _local.step = step
+        self.event("test_start", name, attempt=step.attempt)
+        return step
+
+    def end(self, step: Step, success, deferred=False, verdict=None):
+        _local.step = None
+        step.duration = time.monotonic() - step.t0
+        step.success = success
+        step.deferred = deferred
+        step.verdict = verdict or ("PASSED" if success else "FAILED")
+        self.event("test_end", step.name, attempt=step.attempt, verdict=step.verdict, **step.summary())
+        self.cases[step.name] = step
+        if self.junit_path:
+            self.write_junit()
+
+    def write_junit(self):
+        steps = list(self.cases.values())
+        suite = ET.Element("testsuite", name=self.suite, tests=str(len(steps)),
+                           failures=str(sum(not s.success for s in steps)),
+                           skipped=str(sum(s.deferred for s in steps)),
+                           time=f"{sum(s.duration for s in steps):.3f}")
+        if self.properties:
+            props = ET.SubElement(suite, "properties")
+            for key, value in self.properties.items():
+                ET.SubElement(props, "property", name=str(key), value=str(value))
+        for step in steps:
+            case = ET.SubElement(suite, "testcase", name=step.name, classname=self.suite,
+                                 time=f"{step.duration:.3f}")
+            if not step.success:
+                ET.SubElement(case, "failure", message=f"{step.name} failed (attempt {step.attempt})")
+            elif step.deferred:
+                ET.SubElement(case, "skipped", message="verdict deferred to operator review")
+            ET.SubElement(case, "system-out").text = json.dumps(step.summary(), indent=1)
+        # Write then rename, so a crash never leaves a half written file
+        tmp = self.junit_path + ".tmp"
+        ET.ElementTree(suite).write(tmp, encoding="utf-8", xml_declaration=True)
+        os.replace(tmp, self.junit_path)
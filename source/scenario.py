@@ -0,0 +1,163 @@
+"""
+Declarative test scenarios.
+
+A scenario is a list of steps:
+    Set("SET_CR_CFG", EN)                   HID config command; a NAK ends the scenario
+    Text(b"AUTOCUT ENABLED\\n", repeat=10)   ticket text for the serial port (bytes or str)
+    Control(CR_CMD, repeat=5)               control bytes for the serial port
+    Wait("ticket", start_timeout=15)        status-driven wait, see WAITS
+    Pause("Observe ticket!\\n", until="ticket")   operator instructions (headless: the wait)
+    Say("Testing line feed (0x0A)\\n")       console message
+    Expect(faultCheck)                      automatic check fn(device) -> True/False/None
+
+Scenario(...).compile() turns the steps into a Plan once, at import time:
+adjacent serial steps are joined into a single buffer and every HID frame is
+built up front, so running it costs one ser.write per burst and no encoding.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, List
+
+from commands import build_frame, send_frame
+from prompts import pause
+from waits import wait_for_ticket, wait_until_ready
+
+WAITS = {
+    "ticket": wait_for_ticket,
+    "ready": wait_until_ready,
+}
+
+# Plan operations
+SERIAL = "serial"
+HID = "hid"
+WAIT = "wait"
+PAUSE = "pause"
+SAY = "say"
+EXPECT = "expect"
+
+
+@dataclass
+class Set:
+    command: str
+    value: Any = None
+    failure: str = None     # Printed on NAK, default "Failed to <command>"
+
+
+@dataclass
+class Text:
+    data: Any
+    repeat: int = 1
+
+
+@dataclass
+class Control:
+    data: bytes
+    repeat: int = 1
+
+
+class Wait:
+    def __init__(self, kind, **kwargs):
+        if kind not in WAITS:
+            raise ValueError(f"Unknown wait '{kind}', expected one of {', '.join(WAITS)}")
+        self.kind = kind
+        self.kwargs = kwargs
+
+
+class Pause:
+    """:param until: a Wait, or a WAITS kind with its keyword arguments"""
+    def __init__(self, message, until=None, **kwargs):
+        self.message = message
+        self.until = Wait(until, **kwargs) if isinstance(until, str) else until
+
+
+@dataclass
+class Say:
+    message: str
+
+
+@dataclass
+class Expect:
+    check: Callable
+
+
+@dataclass
+class Scenario:
+    name: str
+    steps: List[Any]
+    intro: str = None       # Shown to the operator before the first step
+
+    def compile(self) -> "Plan":
+        ops = []
+        burst = bytearray()
+
+        def flush():
+            if burst:
+                ops.append((SERIAL, bytes(burst), None))
+                burst.clear()
+
+        if self.intro:
+            ops.append((PAUSE, self.intro, None))
+        for step in self.steps:
+            if isinstance(step, (Text, Control)):
+                data = step.data.encode("ascii") if isinstance(step.data, str) else bytes(step.data)
+                burst += data * step.repeat
+                continue
+            flush()
+            if isinstance(step, Set):
+                frame = build_frame(step.command, step.value)
+                failure = step.failure or f"Failed to {step.command.lower().replace('_', ' ')}"
+                ops.append((HID, step.command, (frame, failure)))
+            elif isinstance(step, Wait):
+                ops.append((WAIT, WAITS[step.kind], step.kwargs))
+            elif isinstance(step, Pause):
+                until = (WAITS[step.until.kind], step.until.kwargs) if step.until else None
+                ops.append((PAUSE, step.message, until))
+            elif isinstance(step, Say):
+                ops.append((SAY, step.message, None))
+            elif isinstance(step, Expect):
+                ops.append((EXPECT, step.check, None))
+            else:
+                raise ValueError(f"{self.name}: unknown step {step!r}")
+        flush()
+        return Plan(self.name, tuple(ops))
+
+
+class Plan:
+    """A compiled scenario: a flat tuple of (operation, argument, extra) ops."""
+    def __init__(self, name, ops):
+        self.name = name
+        self.ops = ops
+
+    @property
+    def serial_bytes(self):
+        return sum(len(arg) for op, arg, _ in self.ops if op == SERIAL)
+
+    def run(self, ser, device):
+        """
+        :return: (completed, auto) - completed is False if a HID command was NAKed;
+                 auto combines the Expect checks: False if any failed, True if all
+                 passed, None if any could not decide
+        """
+        checks = []
+        for op, arg, extra in self.ops:
+            if op == SERIAL:
+                ser.write(arg)
+            elif op == HID:
+                frame, failure = extra
+                if send_frame(device, arg, frame) == "NAK":
+                    print(failure)
+                    return False, None
+            elif op == WAIT:
+                arg(device, **extra)
+            elif op == PAUSE:
+                if extra is None:
+                    pause(arg)
+                else:
+                    wait, kwargs = extra
+                    pause(arg, until=lambda: wait(device, **kwargs))
+            elif op == SAY:
+                print(arg)
+            elif op == EXPECT:
+                checks.append(arg(device))
+        if False in checks:
+            return True, False
+        return True, (True if checks and None not in checks else None)
@@ -0,0 +1,125 @@
+"""
+Orders tests so the operator swaps paper and pairs the printer as few times
+as possible, and turns on the config mirror so repeated SET_* commands with
+an unchanged value are not sent again.
+
+Each TestEntry declares its preconditions (paper, paired) and whether it
+unpairs the printer. Tests are grouped by those and the groups are tried in
+every order; the cheapest plan wins, ties keep the order of the TESTS dict.
+"""
+import itertools
+from dataclasses import dataclass
+
+from commands import config_mirror
+from prompts import pause
+
+PAPER_SWAP_SECONDS = 45.0   # Operator time to change the paper roll
+PAIRING_SECONDS = 60.0      # Operator time to pair the printer with SENTRY
+UNPAIR_COST = 1e6           # A test that needs an unpaired printer cannot follow SENTRY tests
+
+
+@dataclass
+class PrinterSetup:
+    paper: int = 58         # The setup instructions start with 56/58mm paper loaded
+    paired: bool = False
+
+
+def step_cost(setup: PrinterSetup, entry, swap_seconds=PAPER_SWAP_SECONDS, pairing_seconds=PAIRING_SECONDS):
+    """:return: (seconds, setup after the operator prepared the printer for entry)"""
+    cost = 0.0
+    paper, paired = setup.paper, setup.paired
+    if entry.paper is not None and entry.paper != paper:
+        cost += swap_seconds
+        paper = entry.paper
+    if entry.paired and not paired:
+        cost += pairing_seconds
+        paired = True
+    elif entry.paired is False and paired:
+        cost += UNPAIR_COST
+    if entry.unpairs:
+        paired = False
+    return cost, PrinterSetup(paper, paired)
+
+
+def plan_cost(order, setup: PrinterSetup, **costs):
+    """:return: (seconds, paper swaps, pairings) for running the tests in this order"""
+    total, swaps, pairings = 0.0, 0, 0
+    for entry in order:
+        cost, after = step_cost(setup, entry, **costs)
+        total += cost
+        swaps += after.paper != setup.paper
+        pairings += after.paired and not setup.paired
+        setup = after
+    return total, swaps, pairings
+
+
+def schedule(tests, setup: PrinterSetup, **costs):
+    """:return: the tests reordered to minimise plan_cost"""
+    groups = {}
+    for entry in tests:
+        groups.setdefault((entry.paper, entry.paired, entry.unpairs), []).append(entry)
+    best, best_cost = list(tests), plan_cost(tests, setup, **costs)[0]
+    # permutations() yields the original group order first, so ties keep it
+    for keys in itertools.permutations(groups):
+        order = [entry for key in keys for entry in groups[key]]
+        cost = plan_cost(order, setup, **costs)[0]
+        if cost < best_cost:
+            best, best_cost = order, cost
+    return best
+
+
+class Scheduler:
+    """
+    Plugs into run_tests: order() before each pass, before()/after() around each test.
+    :param paper: paper width loaded when the run starts
+    """
+    def __init__(self, device, paper=58, paired=False,
+                 swap_seconds=PAPER_SWAP_SECONDS, pairing_seconds=PAIRING_SECONDS):
+        self.device = device
+        self.setup = PrinterSetup(paper, paired)
+        self.costs = {"swap_seconds": swap_seconds, "pairing_seconds": pairing_seconds}
+        self.saved_seconds = 0.0
+        self.saved_swaps = 0
+        self.saved_pairings = 0
+        self._skipped = config_mirror.skipped
+        self._skipped_seconds = config_mirror.saved_seconds
+        config_mirror.acquire(device)
+
+    def order(self, tests):
+        planned = schedule(tests, self.setup, **self.costs)
+        before = plan_cost(tests, self.setup, **self.costs)
+        after = plan_cost(planned, self.setup, **self.costs)
+        if planned != list(tests):
+            swaps, pairings = before[1] - after[1], before[2] - after[2]
+            self.saved_swaps += swaps
+            self.saved_pairings += pairings
+            self.saved_seconds += swaps * self.costs["swap_seconds"] + pairings * self.costs["pairing_seconds"]
+            print("Test order: " + ", ".join(entry.name for entry in planned))
+        return planned
+
+    def before(self, entry):
+        if entry.paper is not None and entry.paper != self.setup.paper:
+            pause(f">>LOAD {entry.paper}MM PAPER<< for {entry.name}\nPress Enter to continue...\n")
+            self.setup.paper = entry.paper
+        if entry.paired and not self.setup.paired:
+            pause(f">>PAIR PRINTER<< for {entry.name}\nPress Enter to continue...\n")
+            self.setup.paired = True
+        if entry.external_config:
+            config_mirror.forget(self.device)
+
+    def after(self, entry):
+        if entry.unpairs:
+            # Whatever it did, SENTRY tests after it need the printer paired again
+            self.setup.paired = False
+        # A failed test may have stopped half way through its settings
+        if not entry.success or entry.external_config:
+            config_mirror.forget(self.device)
+
+    def report(self):
+        print(f"Scheduling saved {self.saved_swaps} paper swap(s) and {self.saved_pairings} pairing(s) "
+              f"(~{self.saved_seconds:.0f}s of operator time)")
+        print(f"Config mirror skipped {config_mirror.skipped - self._skipped} redundant SET command(s) "
+              f"(~{1000 * (config_mirror.saved_seconds - self._skipped_seconds):.0f}ms of HID round trips)")
+
+    def close(self):
+        config_mirror.release(self.device)
@@ -0,0 +1,145 @@
+"""
+Typed value fields for command payloads.
+
+Each field knows its width on the wire and how to turn a Python value into
+bytes, so a bad payload is rejected before anything is sent to the printer.
+"""
+import datetime
+
+
+class Field:
+    width = 1
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+
+    def encode(self, value) -> bytes:
+        raise NotImplementedError
+
+    def _fail(self, value, why):
+        raise ValueError(f"{self.name}={value!r}: {why}")
+
+
+class UInt(Field):
+    """Little-endian unsigned integer of `width` bytes, optionally range limited."""
+    def __init__(self, name, width=1, lo=0, hi=None, default=None):
+        super().__init__(name, default)
+        self.width = width
+        self.lo = lo
+        self.hi = (1 << (8 * width)) - 1 if hi is None else hi
+
+    def _check(self, value):
+        if isinstance(value, bool) or not isinstance(value, int):
+            self._fail(value, "expected an int")
+        if not self.lo <= value <= self.hi:
+            self._fail(value, f"out of range {self.lo}..{self.hi}")
+
+    def encode(self, value) -> bytes:
+        self._check(value)
+        return value.to_bytes(self.width, 'little')
+
+
+class SInt(UInt):
+    """Two's complement signed integer."""
+    def __init__(self, name, width=1, lo=None, hi=None, default=None):
+        bits = 8 * width
+        super().__init__(name, width,
+                         -(1 << (bits - 1)) if lo is None else lo,
+                         (1 << (bits - 1)) - 1 if hi is None else hi,
+                         default)
+
+    def encode(self, value) -> bytes:
+        self._check(value)
+        return value.to_bytes(self.width, 'little', signed=True)
+
+
+class Bool(Field):
+    def encode(self, value) -> bytes:
+        if value not in (0, 1):  # True/False compare equal to 1/0
+            self._fail(value, "expected a bool or 0/1")
+        return bytes([int(value)])
+
+
+class Enum(Field):
+    """One byte chosen from named options. Accepts the name or the raw code."""
+    def __init__(self, name, options, default=None):
+        super().__init__(name, default)
+        self.options = options
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, str):
+            key = value.upper()
+            matches = [code for label, code in self.options.items() if label.upper() == key]
+            if not matches:
+                self._fail(value, f"expected one of {', '.join(self.options)}")
+            return bytes([matches[0]])
+        if value in self.options.values() and not isinstance(value, bool):
+            return bytes([value])
+        self._fail(value, f"expected one of {', '.join(self.options)}")
+
+
+class Text(Field):
+    """Fixed-width ASCII string padded with `pad` up to `width` bytes."""
+    def __init__(self, name, width, pad=0x00, min_length=0, default=None):
+        super().__init__(name, default)
+        self.width = width
+        self.pad = pad
+        self.min_length = min_length
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, str):
+            try:
+                value = value.encode('ascii')
+            except UnicodeEncodeError:
+                self._fail(value, "must be ASCII")
+        if not isinstance(value, (bytes, bytearray)):
+            self._fail(value, "expected a str or bytes")
+        if not self.min_length <= len(value) <= self.width:
+            self._fail(value, f"length {len(value)} not in {self.min_length}..{self.width}")
+        return bytes(value) + bytes([self.pad]) * (self.width - len(value))
+
+
+class Raw(Field):
+    """Exactly `width` bytes, given as bytes or a list of ints."""
+    def __init__(self, name, width, default=None):
+        super().__init__(name, default)
+        self.width = width
+
+    def encode(self, value) -> bytes:
+        try:
+            data = bytes(value)
+        except (TypeError, ValueError):
+            self._fail(value, "expected bytes or a list of ints 0..255")
+        if len(data) != self.width:
+            self._fail(value, f"expected {self.width} bytes, got {len(data)}")
+        return data
+
+
+class DateTime(Field):
+    """Year (uint16), month, day, hour, minute, second."""
+    width = 7
+
+    def encode(self, value) -> bytes:
+        if not isinstance(value, datetime.datetime):
+            self._fail(value, "expected a datetime")
+        return (value.year.to_bytes(2, 'little')
+                + bytes([value.month, value.day, value.hour, value.minute, value.second]))
+
+
+def payload_width(fields) -> int:
+    return sum(f.width for f in fields)
+
+
+def encode_fields(fields, values: dict) -> bytes:
+    """Encodes a dict of field values in schema order. Unknown names are rejected."""
+    unknown = set(values) - {f.name for f in fields}
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    out = bytearray()
+    for f in fields:
+        value = values.get(f.name, f.default)
+        if value is None:
+            raise ValueError(f"Missing value for field '{f.name}'")
+        out += f.encode(value)
+    return bytes(out)
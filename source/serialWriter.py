@@ -0,0 +1,260 @@
+"""
+Coalescing, flow-controlled writer for the serial print channel.
+
+Tests write ticket data a line or a control byte at a time. SerialWriter
+collects those writes and sends them as larger frames:
+  - as soon as FRAME_SIZE bytes are waiting, or a form feed ends a ticket,
+  - before every HID frame the writing thread sends to the printer, so config
+    commands and ticket data still reach it in the order the test issued
+    them (a status poller's frames in other threads do not flush),
+  - `linger` seconds after the first buffered byte otherwise, so nothing is
+    left behind.
+Written bytes are published as SERIAL_WRITE in the writing thread, so per-test
+counts (results.py) do not depend on which thread sends them.
+Before each frame it honours CTS (when the port uses RTS/CTS) and XOFF/XON
+from the printer, keeps the driver's output queue short, and optionally
+models the printer's receive buffer. Achieved throughput is compared with
+the line rate (baud / 10 for 8N1).
+"""
+import threading
+import time
+
+import transport
+
+FRAME_SIZE = 256
+FORM_FEED = 0x0C
+XON = 0x11
+XOFF = 0x13
+
+
+class FlowControlTimeout(IOError):
+    """The printer held off (CTS low or XOFF) for longer than flow_timeout."""
+
+
+class StreamAborted(IOError):
+    """The stream was stopped with abort(), e.g. by faults.FaultMonitor on a printer fault."""
+
+
+class SerialWriter:
+    """
+    :param ser: open pyserial port (or ObservedSerial); everything but write and
+        flush is passed through
+    :param baudrate: line rate used for pacing and the throughput report
+    :param device: only HID frames to this printer flush the buffer (None: any)
+    :param xonxoff: watch incoming bytes for XOFF/XON
+    :param printer_buffer: printer receive buffer size in bytes, with printer_Bps
+        its drain rate; when both are given the writer never lets its estimate of
+        the buffer fill overflow it
+    """
+    IDLE_GAP = 0.5
+
+    def __init__(self, ser, baudrate=19200, device=None, frame_size=FRAME_SIZE, linger=0.01,
+                 xonxoff=False, printer_buffer=None, printer_Bps=None, flow_timeout=10.0):
+        self.ser = ser
+        self.baudrate = baudrate
+        self.line_Bps = baudrate / 10           # start + 8 data + stop bits
+        self.device = device
+        self.frame_size = frame_size
+        self.linger = linger
+        self.xonxoff = xonxoff
+        self.printer_buffer = printer_buffer
+        self.printer_Bps = printer_Bps
+        self.flow_timeout = flow_timeout
+
+        self.bytes_sent = 0
+        self.frames = 0
+        self.writes = 0             # write() calls coalesced into those frames
+        self.held_s = 0.0           # Time spent waiting on flow control / pacing
+        self.active_s = 0.0         # Finished bursts, see _account
+        self._burst_start = None
+        self._wire_end = 0.0
+        self._fill = 0.0            # Estimated bytes in the printer buffer
+        self._fill_t = time.monotonic()
+        self._xoff = False
+        self.aborted = None         # Reason given to abort()
+
+        self._buffer = bytearray()
+        self._first = None          # When the oldest buffered byte was written
+        self._owner = None          # Thread of the last write()
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher = threading.Thread(target=self._linger_loop, name="SerialWriter", daemon=True)
+        self._flusher.start()
+        transport.subscribe(self._on_frame)
+
+    # pyserial surface
+
+    def write(self, data):
+        data = bytes(data)      # pyserial also takes lists of ints
+        if self.aborted is not None:
+            raise StreamAborted(self.aborted)
+        transport.publish(transport.SERIAL_WRITE, data, port=self.ser)
+        with self._lock:
+            self._owner = threading.get_ident()
+            if not self._buffer:
+                self._first = time.monotonic()
+                self._wake.notify()         # Starts the linger deadline
+            self._buffer += data
+            self.writes += 1
+            if len(self._buffer) >= self.frame_size or FORM_FEED in data:
+                self._send()
+        return len(data)
+
+    def flush(self):
+        """Sends everything buffered and waits until the port has transmitted it."""
+        with self._lock:
+            self._send()
+            self.ser.flush()
+
+    def set_baudrate(self, baudrate):
+        """Sends what is buffered at the old rate, then switches the port and the pacing."""
+        with self._lock:
+            self.flush()
+            self.ser.baudrate = baudrate
+            self.baudrate = baudrate
+            self.line_Bps = baudrate / 10
+
+    def abort(self, reason):
+        """
+        Stops the stream: drops buffered data and what the driver has not sent
+        yet, and makes every write raise StreamAborted until resume().
+        May be called from any thread.
+        """
+        self.aborted = reason
+        with self._lock:
+            self._buffer.clear()
+            self._first = None
+            if hasattr(self.ser, "reset_output_buffer"):
+                self.ser.reset_output_buffer()
+
+    def resume(self):
+        self.aborted = None
+
+    def close(self):
+        if self._closed:
+            return
+        transport.unsubscribe(self._on_frame)
+        try:
+            if self.ser.is_open:
+                self.flush()
+        finally:
+            with self._lock:
+                self._closed = True
+                self._wake.notify()
+            self.ser.close()
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    # statistics
+
+    @property
+    def achieved_Bps(self):
+        """
+        Bytes per second while streaming. Pauses longer than IDLE_GAP (waiting
+        for a ticket, the operator) are not counted; shorter gaps between frames
+        are, so they show up as a rate below the line rate.
+        """
+        if self._burst_start is None:
+            return None
+        active = self.active_s + self._wire_end - self._burst_start
+        return self.bytes_sent / active if active > 0 else None
+
+    def report(self):
+        rate = self.achieved_Bps
+        achieved = f"{rate:.0f} B/s ({100 * rate / self.line_Bps:.0f}% of {self.line_Bps:.0f} B/s line rate)" \
+            if rate else "n/a"
+        print(f"Serial: {self.bytes_sent} bytes in {self.frames} frames from {self.writes} writes, "
+              f"{achieved}, held {self.held_s:.2f}s by flow control")
+
+    # internals
+
+    def _on_frame(self, kind, data, **info):
+        # Ticket data written before a HID command must reach the printer first.
+        # Only the writing thread's commands count: a poller's status reads do
+        # not need to wait for ticket data, and run holding the device lock
+        if kind == transport.HID_TX and self._buffer and threading.get_ident() == self._owner \
+                and (self.device is None or info.get("device") is self.device):
+            with self._lock:
+                self._send()
+
+    def _linger_loop(self):
+        with self._lock:
+            while not self._closed:
+                if not self._buffer:
+                    self._wake.wait()
+                    continue
+                # Give the test until `linger` after its first buffered byte to add more
+                remaining = self._first + self.linger - time.monotonic()
+                if remaining > 0:
+                    self._wake.wait(remaining)
+                elif not self._closed:
+                    self._send()
+
+    def _send(self):
+        while self._buffer and self.aborted is None:
+            frame = bytes(self._buffer[:self.frame_size])
+            del self._buffer[:len(frame)]
+            self._hold(len(frame))
+            if self.aborted is not None:
+                break
+            self._account(len(frame))
+            self.ser.write(frame)
+            self.bytes_sent += len(frame)
+            self.frames += 1
+            if self.printer_buffer:
+                self._fill += len(frame)
+        if not self._buffer:
+            self._first = None
+
+    def _account(self, size):
+        # The wire is busy until _wire_end at the latest; a frame written after a
+        # longer pause than IDLE_GAP starts a new burst
+        now = time.monotonic()
+        if self._burst_start is None or now - self._wire_end > self.IDLE_GAP:
+            if self._burst_start is not None:
+                self.active_s += self._wire_end - self._burst_start
+            self._burst_start = now
+        self._wire_end = max(now, self._wire_end) + size / self.line_Bps
+
+    def _hold(self, size):
+        """Blocks until the printer and the port can take `size` more bytes."""
+        start = time.monotonic()
+        deadline = start + self.flow_timeout
+        while True:
+            wait = self._wait_needed(size)
+            if wait <= 0 or self.aborted is not None:
+                break
+            if time.monotonic() >= deadline:
+                raise FlowControlTimeout(f"printer held off the serial port for {self.flow_timeout}s")
+            time.sleep(min(wait, 0.05))
+        self.held_s += time.monotonic() - start
+
+    def _wait_needed(self, size):
+        ser = self.ser
+        if getattr(ser, "rtscts", False) and not ser.cts:
+            return 0.01
+        if self.xonxoff:
+            waiting = ser.in_waiting
+            if waiting:
+                data = ser.read(waiting)
+                for byte in data:
+                    if byte == XOFF:
+                        self._xoff = True
+                    elif byte == XON:
+                        self._xoff = False
+            if self._xoff:
+                return 0.01
+        # Keep at most one frame queued in the driver so pacing stays honest
+        queued = getattr(ser, "out_waiting", 0) or 0
+        if queued > self.frame_size:
+            return (queued - self.frame_size) / self.line_Bps
+        if self.printer_buffer and self.printer_Bps:
+            now = time.monotonic()
+            self._fill = max(0.0, self._fill - (now - self._fill_t) * self.printer_Bps)
+            self._fill_t = now
+            overflow = self._fill + size - self.printer_buffer
+            if overflow > 0:
+                return overflow / self.printer_Bps
+        return 0
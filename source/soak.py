@@ -0,0 +1,340 @@
+"""
+Endurance soak test.
+
+Prints tickets until `tickets` have been printed (or forever, until Ctrl+C),
+cycling through every combination of mode (retract / continuous), paper width
+and print density, `per_condition` tickets at a time. Memory stays constant
+however long it runs: every figure is a streaming statistic.
+  - jam rate and fault counts per error flag,
+  - head temperature: running mean/min/max, and drift of a moving average
+    from the first `baseline` samples,
+  - per-ticket latency (last byte sent -> Presented) quantiles from a
+    metrics.LogHistogram, per condition and overall,
+  - HID NAK and timeout rate over every exchange, status polls included.
+A snapshot of the statistics is appended to soak_<revision>_<time>.jsonl
+every `report_every` tickets and on every fault. The file rolls over at
+`max_bytes`, keeping `keep` old files, so multi-day runs stay small.
+
+Run with --soak; options come from the "soak" key of the run config:
+    "soak": {"modes": ["retract", "continuous"], "papers": [80], "densities": [100, 160],
+             "tickets": 10000, "per_condition": 100, "lines": 10}
+On a fault (see faults.FaultMonitor) the serial stream is stopped so the
+rest of the ticket does not queue up behind it, and the run waits (up to
+`fault_wait` seconds) for it to be cleared.
+"""
+import datetime
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import transport
+from benchmark import TicketTimer, firmware_revision
+from commands import write_command
+from faults import FaultMonitor
+from metrics import LogHistogram
+from printStatus import ERROR_FLAGS
+from prompts import pause
+from serialWriter import StreamAborted
+from statusPoller import StatusPoller
+from waits import drain_serial, wait_for_status, wait_until_ready
+
+DEFAULTS = {
+    "modes": ["continuous"],
+    "papers": [80],
+    "densities": [100],
+    "tickets": None,            # None: until Ctrl+C
+    "per_condition": 100,
+    "lines": 10,
+    "poll_hz": 20,
+    "timeout": 30.0,
+    "fault_wait": 600.0,
+    "baseline": 100,            # Temperature samples averaged for the drift baseline
+    "report_every": 100,
+    "max_bytes": 5 * 1024 * 1024,
+    "keep": 3,
+}
+MODES = {                       # SET_RETRACT_ENABLE, SET_NEW_TICKET_ACTION
+    "retract": (0x01, 0x02),
+    "continuous": (0x00, 0x01),
+}
+
+
+class RunningStats:
+    """Count, mean, variance (Welford), min and max of a stream in constant memory."""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def stdev(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else None
+
+    def to_dict(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.mean, "stdev": self.stdev, "min": self.min, "max": self.max}
+
+
+class TemperatureDrift:
+    """Head temperature stream: overall stats, baseline of the first samples and a moving average."""
+    def __init__(self, baseline=100, alpha=0.01):
+        self.stats = RunningStats()
+        self.baseline = RunningStats()
+        self.baseline_size = baseline
+        self.alpha = alpha
+        self.ewma = None
+
+    def add(self, value):
+        self.stats.add(value)
+        if self.baseline.count < self.baseline_size:
+            self.baseline.add(value)
+        self.ewma = value if self.ewma is None else self.ewma + self.alpha * (value - self.ewma)
+
+    @property
+    def drift(self):
+        return self.ewma - self.baseline.mean if self.baseline.count else None
+
+    def to_dict(self):
+        return {**self.stats.to_dict(), "baseline": self.baseline.mean if self.baseline.count else None,
+                "current": self.ewma, "drift": self.drift}
+
+
+class ExchangeCounter:
+    """HID exchanges, NAKs and timeouts, counted from the transport observers."""
+    def __init__(self):
+        self.exchanges = 0
+        self.nak = 0
+        self.timeout = 0
+        self._lock = threading.Lock()     # Frames arrive from the poller and the main thread
+        transport.subscribe(self._on_frame)
+
+    def _on_frame(self, kind, data, **info):
+        if kind != transport.HID_RX:
+            return
+        with self._lock:
+            self.exchanges += 1
+            if not data:
+                self.timeout += 1
+            elif len(data) < 4 or data[3] != transport.ACK_BYTE:
+                self.nak += 1
+
+    def close(self):
+        transport.unsubscribe(self._on_frame)
+
+    def to_dict(self):
+        with self._lock:
+            exchanges, nak, timeout = self.exchanges, self.nak, self.timeout
+        rate = (nak + timeout) / exchanges if exchanges else None
+        return {"exchanges": exchanges, "nak": nak, "timeout": timeout, "nak_rate": rate}
+
+
+class RollingFile:
+    """Appends JSON lines to path, moving it to path.1 (path.2, ...) when it reaches max_bytes."""
+    def __init__(self, path, max_bytes, keep):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+
+    def write(self, record):
+        line = json.dumps(record) + "\n"
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+            for n in range(self.keep - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            if self.keep:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+class SoakStats:
+    def __init__(self, baseline):
+        self.start = time.monotonic()
+        self.tickets = 0
+        self.missed = 0
+        self.jams = 0
+        self.faults = {name: 0 for name in ERROR_FLAGS}
+        self.latency = LogHistogram()
+        self.latency_by_condition = {}
+        self.temperature = TemperatureDrift(baseline)
+        self.exchanges = ExchangeCounter()
+        self._lock = threading.Lock()
+
+    def on_status(self, t, record):
+        with self._lock:
+            self.temperature.add(record.head_temp)
+
+    def ticket(self, condition, seconds):
+        """Counts a ticket; seconds is its latency, None if it was never presented."""
+        self.tickets += 1
+        if seconds is None:
+            self.missed += 1
+            return
+        self.latency.add(seconds)
+        self.latency_by_condition.setdefault(condition, LogHistogram()).add(seconds)
+
+    def fault(self, record):
+        self.tickets += 1
+        for name in ERROR_FLAGS:
+            if record.error(name):
+                self.faults[name] += 1
+        if record.error("Jammed"):
+            self.jams += 1
+
+    def to_dict(self):
+        with self._lock:
+            temperature = self.temperature.to_dict()
+        return {
+            "elapsed_s": round(time.monotonic() - self.start, 1),
+            "tickets": self.tickets,
+            "missed": self.missed,
+            "jams": self.jams,
+            "jam_rate": self.jams / self.tickets if self.tickets else None,
+            "faults": {name: n for name, n in self.faults.items() if n},
+            "latency_s": _summary(self.latency),
+            "latency_by_condition_s": {name: _summary(h) for name, h in self.latency_by_condition.items()},
+            "head_temp_c": temperature,
+            "hid": self.exchanges.to_dict(),
+        }
+
+
+def _summary(histogram):
+    return {key: histogram.to_dict()[key] for key in ("count", "p50", "p95", "p99", "max")}
+
+
+def conditions(settings):
+    """Every (paper, mode, density), paper outermost, forever."""
+    for mode in settings["modes"]:
+        if mode not in MODES:
+            raise ValueError(f"Unknown soak mode '{mode}', expected one of {', '.join(MODES)}")
+    return itertools.cycle(itertools.product(settings["papers"], settings["modes"], settings["densities"]))
+
+
+def apply(device, paper, mode, density, loaded):
+    """Sets up the printer for a condition. :return: False on NAK"""
+    if paper != loaded:
+        pause(f">>LOAD {paper}MM PAPER<<\nPress Enter when it is loaded...")
+        if write_command(device, "SET_PAPER_SIZE", f"{paper}MM") == "NAK":
+            print(f"Failed to set paper size {paper}MM")
+            return False
+    retract, action = MODES[mode]
+    if write_command(device, "SET_RETRACT_ENABLE", retract) == "NAK" \
+            or write_command(device, "SET_NEW_TICKET_ACTION", action) == "NAK":
+        print(f"Failed to set {mode} mode")
+        return False
+    if write_command(device, "SET_PRINT_DENSITY", density) == "NAK":
+        print(f"Failed to set print density {density}")
+        return False
+    return True
+
+
+def report(stats):
+    s = stats.to_dict()
+    latency = s["latency_s"]
+    temp = s["head_temp_c"]
+    p50 = f"{latency['p50']:.2f}s" if latency["p50"] is not None else "-"
+    p95 = f"{latency['p95']:.2f}s" if latency["p95"] is not None else "-"
+    drift = f"{temp['drift']:+.1f}C" if temp.get("drift") is not None else "-"
+    nak_rate = f"{100 * s['hid']['nak_rate']:.3f}%" if s["hid"]["nak_rate"] is not None else "-"
+    print(f"[soak {s['elapsed_s']:.0f}s] {s['tickets']} tickets, {s['jams']} jams, latency p50 {p50} p95 {p95}, "
+          f"head temp drift {drift}, NAK rate {nak_rate}")
+
+
+def soak_ticket(ser, device, timer, monitor, stats, out, data, condition, settings):
+    """Prints one ticket. :return: False if a fault was not cleared in time"""
+    wait_until_ready(device)
+    timer.arm()
+    try:
+        ser.write(data)
+        drain_serial(ser)
+    except StreamAborted:
+        pass            # The monitor saw a fault mid-ticket; timer.error has it too
+    sent = time.monotonic()
+    presented = timer.wait(settings["timeout"])
+    if timer.error is not None:
+        stats.fault(timer.error)
+        out.write({"event": "fault", "ticket": stats.tickets, "condition": condition,
+                   "status": timer.error.to_dict(), "stats": stats.to_dict()})
+        print(f"Printer fault on ticket {stats.tickets} ({condition}): {timer.error}\n"
+              f"Clear it to continue (waiting up to {settings['fault_wait']:.0f}s)...")
+        if wait_for_status(device, lambda s: not s.error_status, settings["fault_wait"], 0.5) is None:
+            print("Fault not cleared, stopping")
+            return False
+        monitor.clear()
+        return True
+    stats.ticket(condition, max(presented - sent, 1e-3) if presented is not None else None)
+    if stats.tickets % settings["report_every"] == 0:
+        out.write({"event": "stats", "stats": stats.to_dict()})
+        report(stats)
+    return True
+
+
+def run_soak(ser, device, options=None):
+    """
+    :param options: overrides of DEFAULTS
+    :return: path of the rolling result file
+    """
+    settings = dict(DEFAULTS, **(options or {}))
+    revision = firmware_revision(device)
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in revision)
+    out = RollingFile(f"soak_{safe}_{stamp}.jsonl", settings["max_bytes"], settings["keep"])
+    out.write({"event": "start", "firmware": revision, "time": stamp, "settings": settings})
+    data = b"".join(f"SOAK LINE {i + 1:03d} {'=' * 20}\n".encode("ascii") for i in range(settings["lines"])) + b"\x0c"
+
+    stats = SoakStats(settings["baseline"])
+    limit = settings["tickets"]
+    print(f"Soak test on firmware {revision}: {limit or 'unlimited'} tickets (Ctrl+C to stop)")
+    loaded = None
+    with StatusPoller(device, rate_hz=settings["poll_hz"]) as poller:
+        poller.subscribe(stats.on_status)
+        timer = TicketTimer(poller)
+        monitor = FaultMonitor(poller, ser, device)
+        monitor.begin(SimpleNamespace(name="SOAK", monitored=True))
+        try:
+            for paper, mode, density in conditions(settings):
+                if not apply(device, paper, mode, density, loaded):
+                    break
+                loaded = paper
+                condition = f"{paper}mm {mode} {density}%"
+                count = settings["per_condition"]
+                if limit:
+                    count = min(count, limit - stats.tickets)
+                if not all(soak_ticket(ser, device, timer, monitor, stats, out, data, condition, settings)
+                           for _ in range(count)):
+                    break
+                if limit and stats.tickets >= limit:
+                    break
+        except KeyboardInterrupt:
+            print("\nSoak test stopped")
+        finally:
+            monitor.close()
+            if hasattr(ser, "resume"):
+                ser.resume()
+            timer.close()
+            poller.unsubscribe(stats.on_status)
+            stats.exchanges.close()
+            out.write({"event": "end", "stats": stats.to_dict()})
+            report(stats)
+            write_command(device, "SET_RETRACT_ENABLE", MODES["continuous"][0])
+            write_command(device, "SET_NEW_TICKET_ACTION", MODES["continuous"][1])
+            write_command(device, "SET_PRINT_DENSITY", 100)
+    print(f"Soak results saved to {out.path}")
+    return out.path
@@ -0,0 +1,132 @@
+"""
+Background printer status sampling.
+
+A StatusPoller thread issues GET_PRINTER_STATUS at a fixed rate over HID and
+keeps the decoded samples in preallocated NumPy ring buffers. It never touches
+the serial port, so the print path is not slowed down.
+
+    with StatusPoller(device, rate_hz=20) as poller:
+        ...print tickets...
+    poller.save("jam_test_status.npy")
+"""
+import threading
+import time
+
+import numpy as np
+
+import transport
+from commands import build_frame
+from printStatus import STATUS_DTYPE, STATUS_STRUCT, StatusRecord
+
+SENSORS = ("presenter", "path", "paper", "notch", "arm")
+
+# One ring slot: poll time followed by the status fields as the printer sent them
+SAMPLE_DTYPE = np.dtype([("t", "<f8")] + [(name, STATUS_DTYPE.fields[name][0]) for name in STATUS_DTYPE.names])
+
+
+class StatusPoller(threading.Thread):
+    """
+    :param device: open hid.device, shared with the test thread (transport locks it per exchange)
+    :param rate_hz: polling rate
+    :param capacity: number of samples kept; older samples are overwritten
+    """
+    COMMAND = "GET_PRINTER_STATUS"
+
+    def __init__(self, device, rate_hz=10.0, capacity=4096):
+        super().__init__(name="StatusPoller", daemon=True)
+        self.device = device
+        self.interval = 1.0 / rate_hz
+        self.capacity = capacity
+        self.frame = build_frame(self.COMMAND)
+
+        self.samples = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        # Column views into the ring, in write order (see _order for time order)
+        self.t = self.samples["t"]
+        self.head_temp = self.samples["head_temp"]
+        self.sensor_status = self.samples["sensor_status"]
+        self.ticket_status = self.samples["ticket_status"]
+        self.error_status = self.samples["error_status"]
+
+        self.count = 0          # Samples taken since start, also the next write position
+        self.failures = 0       # Polls that timed out or were NAKed
+        self.last = None        # Most recent StatusRecord
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @property
+    def sensor_raw(self) -> np.ndarray:
+        """(capacity, 5) raw sensor values, columns ordered as SENSORS."""
+        return np.stack([self.samples[f"{name}_raw"] for name in SENSORS], axis=1)
+
+    def subscribe(self, fn):
+        """fn(t, record) is called from the poller thread for every new StatusRecord."""
+        self._subscribers.append(fn)
+        return fn
+
+    def unsubscribe(self, fn):
+        if fn in self._subscribers:
+            self._subscribers.remove(fn)
+
+    def poll_once(self):
+        response = transport.exchange(self.device, self.COMMAND, self.frame)
+        t = time.monotonic()
+        if response == "NAK":
+            self.failures += 1
+            return None
+        data = bytes(response[1])
+        if len(data) < STATUS_STRUCT.size:
+            self.failures += 1
+            return None
+        fields = STATUS_STRUCT.unpack_from(data)
+        record = StatusRecord(*fields)
+        with self._lock:
+            self.samples[self.count % self.capacity] = (t,) + fields
+            self.count += 1
+            self.last = record
+        for fn in self._subscribers:
+            fn(t, record)
+        return record
+
+    def run(self):
+        next_poll = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.failures += 1
+                print(f"Status poll failed: {e}")
+            next_poll += self.interval
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                # Fell behind (slow response); don't try to catch up with a burst
+                next_poll = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _order(self):
+        """Indices of the stored samples, oldest first."""
+        n = min(self.count, self.capacity)
+        start = self.count - n
+        return (np.arange(start, start + n) % self.capacity)
+
+    def snapshot(self) -> np.ndarray:
+        """Copy of the stored samples in time order as a SAMPLE_DTYPE structured array."""
+        with self._lock:
+            return self.samples[self._order()]
+
+    def save(self, path):
+        """Exports the stored samples to a .npy file (load with np.load)."""
+        np.save(path, self.snapshot())
@@ -1,12 +1,16 @@
 from commands import write_command
-import time
+from waits import wait_for_ticket, wait_until_ready, drain_serial, printer_ok
+import prompts
+from prompts import pause, ask, OperatorRequired
+from results import sleep
+from escpos import load_index, locate_binary, sections_at, stream_binary
+from scenario import Scenario, Set, Text, Control, Wait, Pause, Say, Expect
+import render
 from dataclasses import dataclass
 from typing import Callable, Any, List
 from emu_sentry import Sentry
 import datetime
 from emu_sentry import Sentry, get_timestamp_bytes, get_random_timestamp
-import sys
-import os
 
 
 @dataclass 
@@ -15,14 +19,34 @@ class TestEntry:
     success: bool
     func: Callable[..., bool]
     args: List[Any] = None
+    deferred: bool = False  # Verdict left for a human to review (headless runs)
+    # Preconditions, used by scheduler.py to order tests
+    paper: int = None       # Paper width (mm) that must be loaded, None if any
+    paired: bool = False    # True: needs a paired SENTRY printer, False: must run before pairing, None: either
+    unpairs: bool = False   # Leaves the printer unpaired (ESC/POS tests disable SENTRY)
+    external_config: bool = False  # The operator may change settings with another tool
+    monitored: bool = False  # Aborted and failed on a printer fault while printing (see faults.py)
+
+    @property
+    def verdict(self):
+        if self.deferred:
+            return prompts.DEFERRED
+        return prompts.PASSED if self.success else prompts.FAILED
 
     def run(self):
         """Run the test and update the 'success' attribute based on the result."""
+        self.deferred = False
+        prompts.current().begin(self.name)
         try: 
             if self.args:
                 self.success = self.func(*self.args, self)  # Pass self (the TestEntry instance) as the last argument
             else:
                 self.success = self.func(self)  # Pass self directly if no arguments
+        except OperatorRequired as e:
+            # Headless run without the value this test needs: nothing more can be done unattended
+            prompts.current().defer(self.name, str(e))
+            self.deferred = True
+            self.success = True
         except Exception as e:
             print(f"Error running test {self.name}: {e}")
             self.success = False
@@ -36,32 +60,19 @@ DIS = 0x00
 CR_CMD = b'\x0D'
 LF_CMD = b'\x0A'
 
-def datetime_to_bytes(dt: datetime.datetime) -> bytes:
-    # Extract date and time components
-    year = dt.year
-    month = dt.month
-    day = dt.day
-    hour = dt.hour
-    minute = dt.minute
-
-    # Pack the components into bytes
-    year_bytes = year.to_bytes(2, 'little')  
-    month_byte = month.to_bytes(1, 'little')  
-    day_byte = day.to_bytes(1, 'little')     
-    hour_byte = hour.to_bytes(1, 'little')   
-    minute_byte = minute.to_bytes(1, 'little')
-
-    return year_bytes + month_byte + day_byte + hour_byte + minute_byte
-
-def checkSuccess(testName, test_entry: TestEntry):
-    """Updates the success attribute of the TestEntry instance."""
-    while True:
-        status = input(f"Pass? (y/n): ").strip().lower()
-        if status in ['y', 'n']:
-            break
-        print("Invalid input. Please enter 'y' or 'n'.")
-    
-    if status == 'n':
+def checkSuccess(testName, test_entry: TestEntry, auto=None):
+    """
+    Updates the success attribute of the TestEntry instance.
+    :param auto: result of the test's automatic checks, if it has any. Headless runs
+                 use it as the verdict; without it the verdict is deferred.
+    """
+    status = prompts.current().confirm(testName, auto)
+    if status is None:
+        test_entry.deferred = True
+        test_entry.success = True
+        return True
+
+    if not status:
         print(f"{testName} - Test failed")
         test_entry.success = False  # Update the test entry as failed
         return False
@@ -70,9 +81,26 @@ def checkSuccess(testName, test_entry: TestEntry):
         test_entry.success = True  # Update the test entry as passed
         return True
 
+def faultCheck(device):
+    """Automatic check for tests that otherwise need a human: fail on printer error flags, else defer."""
+    return False if printer_ok(device) is False else None
+
+def goldenCheck(testName, recorder, auto):
+    """
+    Combines a test's automatic result with the golden image comparison of the
+    tickets it printed (see render.py). A golden mismatch fails the test; a match
+    leaves the verdict to `auto` (and so to the operator), since goldens only
+    check the stream the suite sent, not what the printer made of it.
+    """
+    if recorder is None or auto is False:
+        return auto
+    if render.goldens.check(testName, recorder.tickets()) is False:
+        return False
+    return auto
+
 def test_printQuality(ser, device, quantity, test_entry: TestEntry):
     
-    input("Tickets will print with three different qualities that affect print speed." \
+    pause("Tickets will print with three different qualities that affect print speed." \
     "\nHigh speed: faster prints" \
     "\nHigh quality: slower prints" \
     "\nNormal: balanced between speed and quality" \
@@ -91,7 +119,7 @@ def test_printQuality(ser, device, quantity, test_entry: TestEntry):
         for j in range(10):
             ser.write(b'PRINT QUALITY NORMAL\n')
         ser.write(PRNT_CMD)
-        time.sleep(2)  
+        wait_for_ticket(device)
 
     response = write_command(device, "SET_PRINT_QUALITY_HIGH_QUALITY")
     if response == "NAK":
@@ -103,9 +131,9 @@ def test_printQuality(ser, device, quantity, test_entry: TestEntry):
         for j in range(10):
             ser.write(b'PRINT QUALITY HIGH QUALITY\n')
         ser.write(PRNT_CMD)
-        time.sleep(2)  
+        wait_for_ticket(device)
     
-    time.sleep(3)
+    wait_until_ready(device)
     response = write_command(device, "SET_PRINT_QUALITY_HIGH_SPEED")
     if response == "NAK":
         print("Failed to set print quality")
@@ -116,33 +144,27 @@ def test_printQuality(ser, device, quantity, test_entry: TestEntry):
         for j in range(10):
             ser.write(b'PRINT QUALITY HIGH SPEED\n')
         ser.write(PRNT_CMD)
-        time.sleep(2)  
+        wait_for_ticket(device)
 
     response = write_command(device, "SET_PRINT_QUALITY_NORMAL")
     if response == "NAK":
         print("Failed to set print quality")
         return
     
-    return checkSuccess("PRINT_QUALITY", test_entry)
+    return checkSuccess("PRINT_QUALITY", test_entry, auto=printer_ok(device))
     
 
 def test_jamTestingRetractionMode(ser, device, quantity, mm, test_entry: TestEntry):
     print(f"Load {mm}mm paper into printer")
-    input("Tickets will print and then retract into the\ndisposal on the bottom of the printer\nwhen a new ticket is sent" \
+    pause("Tickets will print and then retract into the\ndisposal on the bottom of the printer\nwhen a new ticket is sent" \
     "\nSet printer on the edge of your desk to allow space for disposal." \
     "\nPASS CONDITIONS:" \
     "\n - No jamming occurs" \
     "\n - Tickets are correctly retracted" \
     "\nPress Enter to begin...")
 
-    #Set paper size to mm
-    if mm == 80:
-        size = 0x50
-    elif mm == 58:
-        size = 0x3A
-    
     # Set paper size to 80mm or 58mm
-    response = write_command(device, "SET_PAPER_SIZE", size)
+    response = write_command(device, "SET_PAPER_SIZE", mm)
     if response == "NAK":
         print("Failed to set paper size")
         return
@@ -167,10 +189,10 @@ def test_jamTestingRetractionMode(ser, device, quantity, mm, test_entry: TestEnt
         for j in range(10):
             ser.write(b'\nRETRACT TESTING\n')
         ser.write(PRNT_CMD)
-        time.sleep(2)  
+        wait_for_ticket(device)
 
     ## Return to default settings ##
-    time.sleep(3)
+    wait_until_ready(device)
     response = write_command(device, "SET_RETRACT_ENABLE", DIS)
     if response == "NAK":
         print("Failed to set retraction mode")
@@ -186,25 +208,19 @@ def test_jamTestingRetractionMode(ser, device, quantity, mm, test_entry: TestEnt
         print("Failed to set print quality")
         return
 
-    return checkSuccess(f"JAM_RETRACTION_{mm}MM", test_entry)
+    return checkSuccess(f"JAM_RETRACTION_{mm}MM", test_entry, auto=printer_ok(device))
 
 def test_jamTestingContinuousMode(ser, device, quantity, mm, test_entry: TestEntry):
     print(f"Load {mm}mm paper into printer")
-    input("Tickets will print and then eject\nwhen a new ticket is sent" \
+    pause("Tickets will print and then eject\nwhen a new ticket is sent" \
     "\nBe prepared to catch them" \
     "\nPASS CONDITIONS:" \
     "\n - No jamming occurs" \
     "\n - Tickets are correctly ejected in succession" \
     "\nPress Enter to begin...")
 
-    #Set paper size to mm
-    if mm == 80:
-        size = 0x50
-    elif mm == 58:
-        size = 0x3A
-    
     # Set paper size to 80mm or 58mm
-    response = write_command(device, "SET_PAPER_SIZE", size)
+    response = write_command(device, "SET_PAPER_SIZE", mm)
     if response == "NAK":
         print("Failed to set paper size")
         return
@@ -219,7 +235,7 @@ def test_jamTestingContinuousMode(ser, device, quantity, mm, test_entry: TestEnt
         for j in range(10):
             ser.write(b'PRINT DENSITY 160% \nCONTINUOUS TESTING\n')
         ser.write(PRNT_CMD)
-        time.sleep(2)  
+        wait_for_ticket(device)
 
     #Print density set to 100%
     response = write_command(device, "SET_PRINT_DENSITY", 0x64)
@@ -231,244 +247,144 @@ def test_jamTestingContinuousMode(ser, device, quantity, mm, test_entry: TestEnt
         for j in range(10):
             ser.write(b'PRINT DENSITY 100% \nCONTINUOUS TESTING\n')
         ser.write(PRNT_CMD)
-        time.sleep(2)
+        wait_for_ticket(device)
     
     if mm == 80:
         print("You can keep the 80mm paper in the printer\nfor the rest of the tests!")
 
-    return checkSuccess(f"JAM_CONTINUOUS_{mm}MM", test_entry)
+    return checkSuccess(f"JAM_CONTINUOUS_{mm}MM", test_entry, auto=printer_ok(device))
 
-def test_presentLength(ser, device, test_entry: TestEntry):
-    input("Two tickets will print. First with present length set to 200\nand then with present length set to 10\n" \
+def runScenario(plan, ser, device, test_entry: TestEntry):
+    """Runs a compiled scenario, then asks for (or automatically gives) the verdict."""
+    with render.recording(ser, device, test_entry.paper or 80) as recorder:
+        completed, auto = plan.run(ser, device)
+    if not completed:
+        return
+    return checkSuccess(plan.name, test_entry, auto=goldenCheck(plan.name, recorder, auto))
+
+PRESENT_LENGTH = Scenario("PRESENT_LENGTH", intro="Two tickets will print. First with present length set to 200\nand then with present length set to 10\n" \
     "\nObserve how much the ticket sticks out and note the difference between the two." \
     "\nPASS CONDITIONS:" \
     "\n - First ticket sticks out more than the second" \
     "\n - Both tickets are obtainable" \
-    "\nPress Enter to begin...")
-
-    response = write_command(device, "SET_PRESENTER_LENGTH", 0xC8)
-    if response == "NAK":
-        print("Failed to set presenter length")
-        return
-    
-    ser.write(b'OBSERVE PRESENT LENGTH: 200\n')
-    ser.write(PRNT_CMD)
+    "\nPress Enter to begin...", steps=[
+    Set("SET_PRESENTER_LENGTH", 0xC8, "Failed to set presenter length"),
+    Text(b'OBSERVE PRESENT LENGTH: 200\n'), Control(PRNT_CMD),
+    Pause("Observe present length. \nPress Enter to continue...\n", until="ticket"),
 
-    input("Observe present length. \nPress Enter to continue...\n")
+    Set("SET_PRESENTER_LENGTH", 0x0A, "Failed to set presenter length"),
+    Text(b'OBSERVE PRESENT LENGTH: 10\n'), Control(PRNT_CMD),
+    Pause("Observe present length. \nPress Enter to continue...\n", until="ticket"),
 
-    response = write_command(device, "SET_PRESENTER_LENGTH", 0x0A)
-    if response == "NAK":
-        print("Failed to set presenter length")
-        return
-    
-    ser.write(b'OBSERVE PRESENT LENGTH: 10\n')
-    ser.write(PRNT_CMD)
-
-    input(f"Observe present length. \nPress Enter to continue...\n")
+    Set("SET_PRESENTER_LENGTH", 0xC8, "Failed to set presenter length"),
+    Expect(faultCheck),
+]).compile()
 
-    response = write_command(device, "SET_PRESENTER_LENGTH", 0xC8)
-    if response == "NAK":
-        print("Failed to set presenter length")
-        return
-
-    return checkSuccess(f"PRESENT_LENGTH", test_entry)
+def test_presentLength(ser, device, test_entry: TestEntry):
+    return runScenario(PRESENT_LENGTH, ser, device, test_entry)
 
-def test_CRLF(ser, device, test_entry: TestEntry):
-    input("The Carriage Return (CR) and Line Feed (LF) configurables \nwill be tested. \nwhen a new ticket is sent" \
+CRLF = Scenario("CRLF", intro="The Carriage Return (CR) and Line Feed (LF) configurables \nwill be tested. \nwhen a new ticket is sent" \
     "\nBoth of these serve the same function: to start a new line" \
     "\nPASS CONDITIONS:" \
     "\n - If enabled there will be space between the printed lines. These are LF or CR commands." \
     "\n - If disabled there will be no space between the lines" \
-    "\nPress Enter to begin...")
-
-    print("Testing carriage return (0x0D)\n")
-    response = write_command(device, "SET_CR_CFG", EN)
-    if response == "NAK":
-        print("Failed to set carriage return")
-        return
-    time.sleep(1)
-    ser.write(b'CARRIAGE RETURN ENABLE\n')
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(b'THIS LINE SHOULD BE\n 5 BELOW FIRST LINE\n')
-    ser.write(PRNT_CMD)
-
-    input("Observe ticket. Press Enter to continue...\n")
-
-    response = write_command(device, "SET_CR_CFG", DIS)
-    if response == "NAK":
-        print("Failed to set carriage return")
-        return
-    time.sleep(1)
-    ser.write(b'CARRIAGE RETURN DISABLED\n')
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(CR_CMD)
-    ser.write(b'THIS LINE SHOULD BE ONE LINE\n BELOW FIRST\n')    
-    ser.write(PRNT_CMD) 
-
-    input("Observe ticket. \nPress Enter to continue...\n")
-
-    print("Testing line feed (0x0A)\n")
-    response = write_command(device, "SET_LF_CFG", EN)
-    if response == "NAK":
-        print("Failed to set line feed")
-        return
-    
-    #fun fact: \n and 0x0A over ser     are the same thing, but we are 
+    "\nPress Enter to begin...", steps=[
+    Say("Testing carriage return (0x0D)\n"),
+    Set("SET_CR_CFG", EN, "Failed to set carriage return"),
+    Wait("ready"),
+    Text(b'CARRIAGE RETURN ENABLE\n'), Control(CR_CMD, repeat=5),
+    Text(b'THIS LINE SHOULD BE\n 5 BELOW FIRST LINE\n'), Control(PRNT_CMD),
+    Pause("Observe ticket. Press Enter to continue...\n", until="ticket"),
+
+    Set("SET_CR_CFG", DIS, "Failed to set carriage return"),
+    Wait("ready"),
+    Text(b'CARRIAGE RETURN DISABLED\n'), Control(CR_CMD, repeat=5),
+    Text(b'THIS LINE SHOULD BE ONE LINE\n BELOW FIRST\n'), Control(PRNT_CMD),
+    Pause("Observe ticket. \nPress Enter to continue...\n", until="ticket"),
+
+    #fun fact: \n and 0x0A over ser are the same thing, but we are
     #keeping this format for consistency with the CR_CMD :)
+    Say("Testing line feed (0x0A)\n"),
+    Set("SET_LF_CFG", EN, "Failed to set line feed"),
+    Text(b'LINEFEED ENABLED\n'), Control(LF_CMD, repeat=5),
+    Text(b'THIS LINE SHOULD BE FIVE LINES\n BELOW FIRST\n'), Control(PRNT_CMD),
+    Pause("Observe ticket!\n Press Enter to continue...\n", until="ticket"),
 
-    ser.write(b'LINEFEED ENABLED\n')
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(b'THIS LINE SHOULD BE FIVE LINES\n BELOW FIRST\n')        
-    ser.write(PRNT_CMD) 
+    Set("SET_LF_CFG", DIS, "Failed to set line feed"),
+    Text(b'LINEFEED DISABLED  \n'), Control(LF_CMD, repeat=5),
+    Text(b'THIS LINE SHOULD BE ON THE SAME AS THE FIRST'), Control(PRNT_CMD),
 
-    input("Observe ticket!\n Press Enter to continue...\n")
-
-    response = write_command(device, "SET_LF_CFG", DIS)
-    if response == "NAK":
-        print("Failed to set line feed")
-        return
-    
-    ser.write(b'LINEFEED DISABLED  \n')
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(LF_CMD)
-    ser.write(b'THIS LINE SHOULD BE ON THE SAME AS THE FIRST')
-    ser.write(PRNT_CMD) 
-
-    response = write_command(device, "SET_LF_CFG", EN)
-    if response == "NAK":
-        print("Failed to set line feed")
-        return
+    Set("SET_LF_CFG", EN, "Failed to set line feed"),
+    Expect(faultCheck),
+]).compile()
 
-    return checkSuccess(f"PRESENT_LENGTH", test_entry)
+def test_CRLF(ser, device, test_entry: TestEntry):
+    return runScenario(CRLF, ser, device, test_entry)
 
-def test_autocut(ser, device, test_entry: TestEntry):
-    input("Tickets will print without an explicit cut command and the \nautocut feature will cut and present them. \nThe timeout feature is also tested, \nwhere autocut will wait for the timer to run out before presenting." \
+AUTOCUT = Scenario("AUTOCUT", intro="Tickets will print without an explicit cut command and the \nautocut feature will cut and present them. \nThe timeout feature is also tested, \nwhere autocut will wait for the timer to run out before presenting." \
     "\nSet printer on the edge of your desk to allow space for disposal." \
     "\nPASS CONDITIONS:" \
     "\n - No jamming occurs" \
     "\n - Tickets are correctly cut and presented when autocut is enabled" \
-    "\nPress Enter to begin...")
-    response = write_command(device, "SET_AUTOCUT_EN", EN)
-    if response == "NAK":
-        print("Failed to set autocut")
-        return
-    for i in range(10):
-        ser.write(b'AUTOCUT ENABLED\n')
-    
-
-    input("Auto cut enabled!\nPress Enter to continue...\n")
-
-    response = write_command(device, "SET_AUTOCUT_TIMEOUT", 0x0A)
-    if response == "NAK":
-        print("Failed to set autocut")
-        return
-    for i in range(10):
-        ser.write(b'AUTOCUT DISABLED\n')   
+    "\nPress Enter to begin...", steps=[
+    Set("SET_AUTOCUT_EN", EN, "Failed to set autocut"),
+    Text(b'AUTOCUT ENABLED\n', repeat=10),
+    Pause("Auto cut enabled!\nPress Enter to continue...\n", until="ticket", start_timeout=15),
+
+    Set("SET_AUTOCUT_TIMEOUT", 0x0A, "Failed to set autocut"),
+    Text(b'AUTOCUT DISABLED\n', repeat=10),
+    Say("Autocut timeout set to 10 seconds. Wait for print!"),
+    Pause("Press Enter to continue...\n", until="ticket", timeout=25, start_timeout=15),
+
+    Set("SET_AUTOCUT_TIMEOUT", 0x03, "Failed to set autocut"),
+    Text(b'AUTOCUT DISABLED\n', repeat=10),
+    Say("Autocut timeout set to 3 seconds. Wait for print!"),
+    Pause("Press Enter to continue...\n", until="ticket", start_timeout=8),
+
+    Set("SET_AUTOCUT_EN", DIS, "Failed to set autocut"),
+    Text(b'AUTOCUT DISABLED\n', repeat=10),
+    Pause("Autocut disabled!\nTicket should be inside printer.\nPress enter to continue/eject ticket\n"),
+    Control(PRNT_CMD),
+
+    Set("SET_AUTOCUT_EN", EN, "Failed to set autocut"),
+    Expect(faultCheck),
+]).compile()
 
-    print("Autocut timeout set to 10 seconds. Wait for print!")
-    input("Press Enter to continue...\n")
-
-    response = write_command(device, "SET_AUTOCUT_TIMEOUT", 0x03)
-    if response == "NAK":
-        print("Failed to set autocut")
-        return
-    for i in range(10):
-        ser.write(b'AUTOCUT DISABLED\n')   
-
-    print("Autocut timeout set to 3 seconds. Wait for print!")
-    input("Press Enter to continue...\n")
-
-    response = write_command(device, "SET_AUTOCUT_EN", DIS)
-    if response == "NAK":
-        print("Failed to set autocut")
-        return
-    for i in range(10):
-        ser.write(b'AUTOCUT DISABLED\n')
-    input("Autocut disabled!\nTicket should be inside printer.\nPress enter to continue/eject ticket\n")
-    ser.write(PRNT_CMD)
-
-    response = write_command(device, "SET_AUTOCUT_EN", EN)
-    if response == "NAK":
-        print("Failed to set autocut")
-        return    
-
-    return checkSuccess(f"AUTOCUT", test_entry)
+def test_autocut(ser, device, test_entry: TestEntry):
+    return runScenario(AUTOCUT, ser, device, test_entry)
+
+TRUNCATE_WS = Scenario("TRUNCATE_WS", steps=[
+    Set("SET_TRUNCATE_WS", EN, "Failed to set truncate whitespace"),
+    Set("SET_LF_CFG", EN, "Failed to set line feed"),
+    Text(b'TRUNCATE WHITE SPACE ENABLED\n', repeat=10),
+    Text(b'This ticket should not have\nextra space at the end'),
+    Control(LF_CMD, repeat=10), Control(PRNT_CMD),
+    Wait("ticket"),
+
+    Set("SET_TRUNCATE_WS", DIS, "Failed to set truncate whitespace"),
+    Text(b'TRUNCATE WHITE SPACE DISABLED\n', repeat=10),
+    Text(b'This ticket SHOULD have\nwhite space at the end\n'),
+    Control(LF_CMD, repeat=10), Control(PRNT_CMD),
+    Pause("Compare the two tickets to confirm truncate WS works\nPress Enter to continue...\n", until="ticket"),
+    Expect(faultCheck),
+]).compile()
 
 def test_truncateWS(ser, device, test_entry: TestEntry):
-    response = write_command(device, "SET_TRUNCATE_WS", EN)
-    if response == "NAK":
-        print("Failed to set truncate whitespace")
-        return
-    
-    response = write_command(device, "SET_LF_CFG", EN)
-    if response == "NAK":
-        print("Failed to set line feed")
-        return
-    
-    for i in range(10):
-        ser.write(b'TRUNCATE WHITE SPACE ENABLED\n')
-    ser.write(b'This ticket should not have\nextra space at the end')
-    for i in range(10):
-        ser.write(LF_CMD)
+    return runScenario(TRUNCATE_WS, ser, device, test_entry)
 
-    ser.write(PRNT_CMD)
-    
-    time.sleep(2)
-
-    response = write_command(device, "SET_TRUNCATE_WS", DIS)
-    if response == "NAK":
-        print("Failed to set truncate whitespace")
-        return
-    
-    for i in range(10):
-        ser.write(b'TRUNCATE WHITE SPACE DISABLED\n')
-    ser.write(b'This ticket SHOULD have\nwhite space at the end\n')
-    for i in range(10):
-        ser.write(LF_CMD)
-    ser.write(PRNT_CMD)
+PULL_TAB = Scenario("PULL_TAB", steps=[
+    Set("SET_PULL_TAB_MODE", EN, "Failed to set pull tab mode"),
+    Text(b'PULL TAB ENABLED\n'), Text(b'This is a test of the pull tab mode.\n'), Control(PRNT_CMD),
+    Pause("Observe ticket!\nPress Enter to continue...\n", until="ticket"),
 
-    input("Compare the two tickets to confirm truncate WS works\nPress Enter to continue...\n")
-    
-    return checkSuccess(f"TRUNCATE_WS", test_entry)
+    Set("SET_PULL_TAB_MODE", DIS, "Failed to set pull tab mode"),
+    Text(b'PULL TAB DISABLED\n'), Text(b'This is a test of the pull tab mode.\n'), Control(PRNT_CMD),
+    Pause("Observe ticket!\nPress Enter to continue...\n", until="ticket"),
+    Expect(faultCheck),
+]).compile()
 
 def test_pullTabMode(ser, device, test_entry: TestEntry):
-    response = write_command(device, "SET_PULL_TAB_MODE", EN)
-    if response == "NAK":
-        print("Failed to set pull tab mode")
-        return
-    
-    ser.write(b'PULL TAB ENABLED\n')
-    ser.write(b'This is a test of the pull tab mode.\n')
-    ser.write(PRNT_CMD)
-
-    input("Observe ticket!\nPress Enter to continue...\n")
-
-    response = write_command(device, "SET_PULL_TAB_MODE", DIS)
-    if response == "NAK":
-        print("Failed to set pull tab mode")
-        return
-    
-    ser.write(b'PULL TAB DISABLED\n')
-    ser.write(b'This is a test of the pull tab mode.\n')
-    ser.write(PRNT_CMD)
-
-    input("Observe ticket!\nPress Enter to continue...\n")
-
-    return checkSuccess(f"PULL_TAB", test_entry)
+    return runScenario(PULL_TAB, ser, device, test_entry)
 
 def convert_to_percentage(value):
     percentage_map = {
@@ -488,7 +404,7 @@ def convert_to_percentage(value):
 
 def test_fonts(ser, device, test_entry: TestEntry):
 
-    input("Font features will be tested.\nincluding custom characters per inch (CPI) and the CPI lock." \
+    pause("Font features will be tested.\nincluding custom characters per inch (CPI) and the CPI lock." \
     "\nPASS CONDITIONS:" \
     "\n - CPI changes accordingly" \
     "\n - Custom CPI shows the different spacing between each setting" \
@@ -500,82 +416,88 @@ def test_fonts(ser, device, test_entry: TestEntry):
     #    print("Failed to set font")
     #    return
 
-    input("Go onto Reliance Tools and select the font page.\nThen hit APPLY AND TEST PRINT \nEnsure all code pages and CPIs are displayed.\nPress enter to continue...")
-
-    print("Testing custom CPI options")
-    for i in range(-3, 7):
-        if i == 0:
-            response = write_command(device, "SET_CUSTOM_CPI", int(format(7 & 0xFF, '02X'), 16))
-        else:    
-            response = write_command(device, "SET_CUSTOM_CPI", int(format(i & 0xFF, '02X'), 16))
-        if response == "NAK":
-            print("Failed to set font")
-            return    
-        ser.write(f"CUSTOM CPI AT {convert_to_percentage(i)}".encode('utf-8'))
-        ser.write(LF_CMD)
-        time.sleep(.1)
-    ser.write(PRNT_CMD)
-    input("Observe ticket!\nPress Enter to continue...\n")#
+    pause("Go onto Reliance Tools and select the font page.\nThen hit APPLY AND TEST PRINT \nEnsure all code pages and CPIs are displayed.\nPress enter to continue...")
+
+    with render.recording(ser, device) as recorder:
+        print("Testing custom CPI options")
+        for i in range(-3, 7):
+            # 7 stands in for 0 (0 disables custom CPI)
+            response = write_command(device, "SET_CUSTOM_CPI", 7 if i == 0 else i)
+            if response == "NAK":
+                print("Failed to set font")
+                return    
+            ser.write(f"CUSTOM CPI AT {convert_to_percentage(i)}".encode('utf-8'))
+            ser.write(LF_CMD)
+            # The printer may still be taking in the line; a HID CPI change
+            # must not overtake it
+            drain_serial(ser)
+            sleep(.1)
+        ser.write(PRNT_CMD)
+        pause("Observe ticket!\nPress Enter to continue...\n", until=lambda: wait_for_ticket(device))#
 
 
-    response = write_command(device, "SET_CUSTOM_CPI", DIS)
-    if response == "NAK":
-        print("Failed to disable custom CPI")
-        return
+        response = write_command(device, "SET_CUSTOM_CPI", DIS)
+        if response == "NAK":
+            print("Failed to disable custom CPI")
+            return
     
-    print("Testing Lock CPI")
-    response = write_command(device, "SET_LOCK_CPI", DIS)
-    if response == "NAK":
-        print("Failed to set font")
-        return
+        print("Testing Lock CPI")
+        response = write_command(device, "SET_LOCK_CPI", DIS)
+        if response == "NAK":
+            print("Failed to set font")
+            return
     
-    time.sleep(1)
-    ser.write([0x1B, 0xC1, 0x00])
-    ser.write(b'LOCK CPI DISABLED\n')
-    time.sleep(.2)
-    ser.write([0x1B, 0xC1, 0x01])   
-    ser.write(b'LOCK CPI DISABLED\n')
-    time.sleep(.2)
-    ser.write([0x1B, 0xC1, 0x02])
-    ser.write(b'LOCK CPI DISABLED\n')
-    ser.write(b'\nThe above should all\n be different widths')
-    ser.write(PRNT_CMD)
-    time.sleep(.2)
+        wait_until_ready(device)
+        ser.write([0x1B, 0xC1, 0x00])
+        ser.write(b'LOCK CPI DISABLED\n')
+        drain_serial(ser)
+        sleep(.2)
+        ser.write([0x1B, 0xC1, 0x01])   
+        ser.write(b'LOCK CPI DISABLED\n')
+        drain_serial(ser)
+        sleep(.2)
+        ser.write([0x1B, 0xC1, 0x02])
+        ser.write(b'LOCK CPI DISABLED\n')
+        ser.write(b'\nThe above should all\n be different widths')
+        ser.write(PRNT_CMD)
+        wait_for_ticket(device)
 
-    response = write_command(device, "SET_LOCK_CPI", EN)
-    if response == "NAK":
-        print("Failed to set font")
-        return
+        response = write_command(device, "SET_LOCK_CPI", EN)
+        if response == "NAK":
+            print("Failed to set font")
+            return
     
-    time.sleep(1)
-    ser.write([0x1B, 0xC1, 0x00])
-    ser.write(b'LOCK CPI ENABLED\n')
-    time.sleep(.2)
-    ser.write([0x1B, 0xC1, 0x01])
-    ser.write(b'LOCK CPI ENABLED\n')
-    time.sleep(.2)
-    ser.write([0x1B, 0xC1, 0x02])
-    ser.write(b'LOCK CPI ENABLED\n')
-    ser.write(b'\nThe above should all\n be the same width')
-    ser.write(PRNT_CMD)
-    time.sleep(1)
+        wait_until_ready(device)
+        ser.write([0x1B, 0xC1, 0x00])
+        ser.write(b'LOCK CPI ENABLED\n')
+        drain_serial(ser)
+        sleep(.2)
+        ser.write([0x1B, 0xC1, 0x01])
+        ser.write(b'LOCK CPI ENABLED\n')
+        drain_serial(ser)
+        sleep(.2)
+        ser.write([0x1B, 0xC1, 0x02])
+        ser.write(b'LOCK CPI ENABLED\n')
+        ser.write(b'\nThe above should all\n be the same width')
+        ser.write(PRNT_CMD)
+        wait_for_ticket(device)
 
-    response = write_command(device, "SET_LOCK_CPI", DIS)
-    if response == "NAK":
-        print("Failed to set font")
-        return
+        response = write_command(device, "SET_LOCK_CPI", DIS)
+        if response == "NAK":
+            print("Failed to set font")
+            return
 
-    return checkSuccess(f"FONTS", test_entry)
+    return checkSuccess(f"FONTS", test_entry, auto=goldenCheck("FONTS", recorder, faultCheck(device)))
 
 def test_SENTRY_duplicateKeywords(ser, device, test_entry: TestEntry):
-    input("This is a SENTRY test. \n>>PAIR PRINTER BEFORE CONTINUING<<" \
+    pause("This is a SENTRY test. \n>>PAIR PRINTER BEFORE CONTINUING<<" \
           "\nDUPLICATE keywords are meant to suppress the QR code.\n We will test setting a single dup keyword and multiple dup keywords."\
           "\nPASS CONDITIONS:" \
           "\n - DUPLICATE keyword suppresses the QR code correctly." \
           "\n - Tickets without the keyword display the QR code AND Value error" \
           "\nPress Enter to continue...\n")
 
-    response = write_command(device, "SET_DUPLICATE_KEYWORD", [0x4D, 0x41, 0x49, 0x4E, 0x54, 0x45, 0x4E, 0x41, 0x4E, 0x43, 0x45] + [0x00] * 9)
+    response = write_command(device, "SET_DUPLICATE_KEYWORD", "MAINTENANCE")
     if response == "NAK":
         print("Failed to set duplicate keywords")
         return
@@ -585,15 +507,15 @@ def test_SENTRY_duplicateKeywords(ser, device, test_entry: TestEntry):
     ser.write(b'\nThere should be no QR code\n on this ticket!\n')
     ser.write(PRNT_CMD)
 
-    time.sleep(2)
+    wait_for_ticket(device)
 
     ser.write(b'DUP KEYWORD TESTING\n')
     ser.write(b'This one should have a QR code!\n')
     ser.write(PRNT_CMD)
     
-    input("Observe ticket!\nPress Enter to continue...\n")
+    pause("Observe ticket!\nPress Enter to continue...\n", until=lambda: wait_for_ticket(device))
 
-    response = write_command(device, "SET_MULTI_DUPKEY", [0x00, 0x55, 0x4C, 0x54, 0x52, 0x41, 0x4C, 0x49, 0x47, 0x48, 0x54, 0x42, 0x45, 0x41, 0x4D] + [0x00] * 6)
+    response = write_command(device, "SET_MULTI_DUPKEY", {"index": 0, "keyword": "ULTRALIGHTBEAM"})
     if response == "NAK":
         print("Failed to set duplicate keywords")
         return
@@ -607,9 +529,9 @@ def test_SENTRY_duplicateKeywords(ser, device, test_entry: TestEntry):
     ser.write(b'This one SHOULD have a QR code!\n')
     ser.write(PRNT_CMD)
     
-    time.sleep(2)
+    wait_for_ticket(device)
     
-    response = write_command(device, "SET_MULTI_DUPKEY", [0x01, 0x4E, 0x45, 0x56, 0x45, 0x52, 0x45, 0x4E, 0x44, 0x45, 0x52] + [0x00] * 10)
+    response = write_command(device, "SET_MULTI_DUPKEY", {"index": 1, "keyword": "NEVERENDER"})
     if response == "NAK":
         print("Failed to set duplicate keywords")
         return
@@ -623,9 +545,9 @@ def test_SENTRY_duplicateKeywords(ser, device, test_entry: TestEntry):
     ser.write(b'This one SHOULD have a QR code!\n')
     ser.write(PRNT_CMD)
     
-    time.sleep(2)
+    wait_for_ticket(device)
 
-    response = write_command(device, "SET_MULTI_DUPKEY", [0x02, 0x4C, 0x55, 0x43, 0x4B, 0x59, 0x43, 0x41, 0x54] + [0x00] * 12)
+    response = write_command(device, "SET_MULTI_DUPKEY", {"index": 2, "keyword": "LUCKYCAT"})
     if response == "NAK":
         print("Failed to set duplicate keywords")
         return
@@ -639,12 +561,13 @@ def test_SENTRY_duplicateKeywords(ser, device, test_entry: TestEntry):
     ser.write(b'This one SHOULD have a QR code!\n')
     ser.write(PRNT_CMD)
     
-    return checkSuccess(f"DUPLICATE_KEY", test_entry)
+    return checkSuccess(f"DUPLICATE_KEY", test_entry, auto=faultCheck(device))
 
 def test_SENTRY_config(ser, device, test_entry: TestEntry):
     sentry = Sentry()
+    checks_ok = True  # Scanned checks; the case sensitivity ticket is visual
     print("80mm paper required.\n")
-    input ("This is a SENTRY test. \n>>PAIR PRINTER<<\n>>CONNECT A USB QR SCANNER<<\n" \
+    pause("This is a SENTRY test. \n>>PAIR PRINTER<<\n>>CONNECT A USB QR SCANNER<<\n" \
            "\nSENTRY config will be tested, including:"\
            "\nSENTRY keywords, case sensitivity, line parse, skip parse."\
            "\nPASS CONDITIONS:" \
@@ -660,18 +583,22 @@ def test_SENTRY_config(ser, device, test_entry: TestEntry):
      
     while(1):
         try:
-            pairing_code = input("Pairing Code: ")
+            pairing_code = ask("pairing_code", "Pairing Code: ")
             sentry.pair(pairing_code)
             break
+        except OperatorRequired:
+            raise
         except Exception as e:
             print(f"Error pairing with SENTRY: {e}")
+            if prompts.current().headless:
+                raise
     
     print("\nSENTRY Keyword Test\n------------\n")
     # Set SENTRY config to:
     # Keyword parse, keyword: "WINNER"
     # case, skip, parse disabled
     print("Keyword: WINNER")
-    response = write_command(device, "SET_SENTRY_CONFIG", [0x02, 0x57, 0x49, 0x4E, 0x4E, 0x45, 0x52] + [0x00] * 14 +[0x00, 0x00, 0x00])  
+    response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "KEYWORD", "keyword": "WINNER"})
     if response == "NAK":
         print("Failed to set SENTRY config")
         return
@@ -679,18 +606,19 @@ def test_SENTRY_config(ser, device, test_entry: TestEntry):
     ser.write(b'WINNER $32.00\n')
     ser.write(PRNT_CMD)
 
-    redemption = input("Scan ticket to redeem: ")
+    redemption = ask("redemption", "Scan ticket to redeem: ")
     is_valid, is_duplicate, timestamp_redemption = sentry.validate_ticket(redemption)
     if is_valid:
         print(f"VALID")
     else:
         print("INVALID TICKET")
+        checks_ok = False
     
     # Set SENTRY config to:
     # Keyword parse, keyword: "antiestablishmentism"
     # case, skip, parse disabled
     print("\nKeyword: antiestablishmentism")
-    response = write_command(device, "SET_SENTRY_CONFIG", [0x02, 0x61, 0x6E, 0x74, 0x69, 0x65, 0x73, 0x74, 0x61, 0x62, 0x6C, 0x69, 0x73, 0x68, 0x6D, 0x65, 0x6E, 0x74, 0x69, 0x73, 0x6D] +[0x00, 0x00, 0x00])  
+    response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "KEYWORD", "keyword": "antiestablishmentism"})
     if response == "NAK":
         print("Failed to set SENTRY config")
         return
@@ -698,15 +626,16 @@ def test_SENTRY_config(ser, device, test_entry: TestEntry):
     ser.write(b'antiestablishmentism $21.00\n')
     ser.write(PRNT_CMD)
 
-    redemption = input("Scan ticket to redeem: ")
+    redemption = ask("redemption", "Scan ticket to redeem: ")
     is_valid, is_duplicate, timestamp_redemption = sentry.validate_ticket(redemption)
     if is_valid:
         print(f"VALID")
     else:
         print("INVALID TICKET")
+        checks_ok = False
 
     print("\nCase sensitive test")
-    response = write_command(device, "SET_SENTRY_CONFIG", [0x02, 0x61, 0x6E, 0x74, 0x69, 0x65, 0x73, 0x74, 0x61, 0x62, 0x6C, 0x69, 0x73, 0x68, 0x6D, 0x65, 0x6E, 0x74, 0x69, 0x73, 0x6D] +[0x01, 0x00, 0x00])  
+    response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "KEYWORD", "keyword": "antiestablishmentism", "case": True})
     if response == "NAK":
         print("Failed to set SENTRY config")
         return
@@ -715,10 +644,10 @@ def test_SENTRY_config(ser, device, test_entry: TestEntry):
     ser.write(b'This ticket should have a value error\n')
     ser.write(PRNT_CMD)
 
-    input("Ticket should dispaly error message\nPress Enter to continue...\n")
+    pause("Ticket should dispaly error message\nPress Enter to continue...\n", until=lambda: wait_for_ticket(device))
 
     print("Line parse test\nSet to parse 3rd line")
-    response = write_command(device, "SET_SENTRY_CONFIG", [0x03, 0x61, 0x6E, 0x74, 0x69, 0x65, 0x73, 0x74, 0x61, 0x62, 0x6C, 0x69, 0x73, 0x68, 0x6D, 0x65, 0x6E, 0x74, 0x69, 0x73, 0x6D] +[0x00, 0x00, 0x03])  
+    response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "LINE", "keyword": "antiestablishmentism", "line": 3})
     if response == "NAK":
         print("Failed to set SENTRY config")
         return
@@ -729,21 +658,23 @@ def test_SENTRY_config(ser, device, test_entry: TestEntry):
     ser.write(b'antiestablishmentism $9.00\n')
     ser.write(PRNT_CMD)
 
-    redemption = input("Scan ticket to redeem: ")
+    redemption = ask("redemption", "Scan ticket to redeem: ")
     is_valid, is_duplicate, timestamp_redemption = sentry.validate_ticket(redemption)
     if is_valid:
         print(f"VALID")
     else:
         print("INVALID TICKET")
+        checks_ok = False
     parsed_redemption = sentry.parse(redemption)
     payout = parsed_redemption.split(",")[0].split(" ")[1]  
     if payout == "$1.00":
         print(f"Payout is correct: {payout}\n")
     else:
         print(f"Payout is incorrect: {payout}")
+        checks_ok = False
 
     print("\nSkip parse test\nSet to skip 3 occurances")
-    response = write_command(device, "SET_SENTRY_CONFIG", [0x04, 0x61, 0x6E, 0x74, 0x69, 0x65, 0x73, 0x74, 0x61, 0x62, 0x6C, 0x69, 0x73, 0x68, 0x6D, 0x65, 0x6E, 0x74, 0x69, 0x73, 0x6D] +[0x00, 0x03, 0x00])  
+    response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "SKIP", "keyword": "antiestablishmentism", "skip": 3})
     if response == "NAK":
         print("Failed to set SENTRY config")
         return
@@ -754,24 +685,27 @@ def test_SENTRY_config(ser, device, test_entry: TestEntry):
     ser.write(b'antiestablishmentism $9.00\n')
     ser.write(PRNT_CMD)
 
-    redemption = input("Scan ticket to redeem: ")
+    redemption = ask("redemption", "Scan ticket to redeem: ")
     is_valid, is_duplicate, timestamp_redemption = sentry.validate_ticket(redemption)
     if is_valid:
         print(f"VALID")
     else:
         print("INVALID TICKET")
+        checks_ok = False
     parsed_redemption = sentry.parse(redemption)
     payout = parsed_redemption.split(",")[0].split(" ")[1]  
     if payout == "$9.00":
         print(f"Payout is correct: {payout}\n")
     else:
         print(f"Payout is incorrect: {payout}")
+        checks_ok = False
 
-    return checkSuccess(f"SENTRY_CONFIG", test_entry)
+    return checkSuccess(f"SENTRY_CONFIG", test_entry, auto=faultCheck(device) if checks_ok else False)
 
 def test_SENTRY_qrTimeStamp (ser, device, test_entry: TestEntry):
     sentry = Sentry()
-    input ("This is a SENTRY test. \n>>PAIR PRINTER<<\n>>CONNECT A USB QR SCANNER<<\n" \
+    checks_ok = True
+    pause("This is a SENTRY test. \n>>PAIR PRINTER<<\n>>CONNECT A USB QR SCANNER<<\n" \
            "\nSENTRY QR Time stamp will be tested."\
            "\nEach QR will be assigned a random time stamp."\
            "\nPASS CONDITIONS:" \
@@ -780,15 +714,19 @@ def test_SENTRY_qrTimeStamp (ser, device, test_entry: TestEntry):
            "\nPress Enter to continue...\n")
     
     
-    qty = input("Enter number of tickets to print: ")
+    qty = ask("quantity", "Enter number of tickets to print: ")
 
     while(1):
         try:
-            pairing_code = input("Pairing Code: ")
+            pairing_code = ask("pairing_code", "Pairing Code: ")
             sentry.pair(pairing_code)
             break
+        except OperatorRequired:
+            raise
         except Exception as e:
             print(f"Error pairing with SENTRY: {e}")
+            if prompts.current().headless:
+                raise
 
 
     response = write_command(device, "SEN_QR_TS_CFG", EN)
@@ -800,20 +738,14 @@ def test_SENTRY_qrTimeStamp (ser, device, test_entry: TestEntry):
     # Keyword parse, keyword: "WINNER"
     # case, skip, parse disabled
     print("Keyword: WINNER")
-    response = write_command(device, "SET_SENTRY_CONFIG", [0x02, 0x57, 0x49, 0x4E, 0x4E, 0x45, 0x52] + [0x00] * 14 +[0x00, 0x00, 0x00])  
+    response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "KEYWORD", "keyword": "WINNER"})
     if response == "NAK":
         print("Failed to set SENTRY config")
         return
     for i in range(int(qty)):
         timestamp = get_random_timestamp()
         timestamp = timestamp.replace(second=0, microsecond=0)  # Create a new datetime object with seconds set to 0
-        timestamp_bytes = datetime_to_bytes(timestamp)
-
-        # Convert timestamp_bytes to a list
-        timestamp_bytes_list = list(timestamp_bytes)  
-
-        # timestamp + 0x00 (for the seconds byte)
-        response = write_command(device, "SET_RTC", timestamp_bytes_list + [0x00])
+        response = write_command(device, "SET_RTC", timestamp)
         if response == "NAK":
             print("Failed to set RTC")
             return
@@ -823,7 +755,7 @@ def test_SENTRY_qrTimeStamp (ser, device, test_entry: TestEntry):
         ser.write(b'\x0C')
 
 
-        redemption = input("Redemption TKT: ")
+        redemption = ask("redemption", "Redemption TKT: ")
         is_valid, is_duplicate, timestamp_redemption = sentry.validate_ticket(redemption)
         if is_valid:
             print(f"VALID")
@@ -833,102 +765,46 @@ def test_SENTRY_qrTimeStamp (ser, device, test_entry: TestEntry):
                 print("Timestamp does not match!")
                 print(f"Generated TS: {timestamp}")
                 print(f"Redemption TS: {timestamp_redemption}")
+                checks_ok = False
+        else:
+            print("INVALID TICKET")
+            checks_ok = False
     
-    return checkSuccess(f"SENTRY_QR_TIMESTAMP", test_entry)
-
-def test_ESCPOS(ser, device, test_entry: TestEntry):
-    
-    if getattr(sys, 'frozen', False):
-    # Running in a bundle (e.g., PyInstaller)
-        base_path = sys._MEIPASS
-    else:
-    # Running in a normal Python environment
-        base_path = os.path.dirname(__file__)
+    return checkSuccess(f"SENTRY_QR_TIMESTAMP", test_entry, auto=checks_ok and printer_ok(device) is not False)
 
-    file_path = os.path.join(base_path, "main.bin")
-
-    time.sleep(1)
+def disableSentry(device):
+    """ESC/POS tickets must print as sent, so make sure SENTRY is not rewriting them."""
     print("Attempting to unpair. If already unpaired, you will see a NAK response")
     response = write_command(device, "GET_SENTRY_CONFIG")
-    if response[1][0] == 0x01:  
+    if response != "NAK" and response[1][0] == 0x01:
         # Unpair printer to reset SENTRY
         print("Unpairing printer...")
-        response = write_command(device, "SET_SENTRY_CONFIG", [0x00] + [0x00] * 20 +[0x00, 0x00, 0x00])  
+        response = write_command(device, "SET_SENTRY_CONFIG", {"mode": "DISABLED", "keyword": ""})
         if response == "NAK":
             print("Failed to set SENTRY config")
-            return
-    input("\n\nAbout to test all ESC/POS commands\nTons of tickets will print!\nPress Enter to continue...\n")
-    
-    while True:
-        try:
-            # Open the binary file in read-binary mode
-            with open(file_path, "rb") as binary_file:
-                # Read the file in chunks and write to the serial port
-                while chunk := binary_file.read(1024):  # Read in 1KB chunks
-                    ser.write(chunk)
-                    time.sleep(0.1)  # Optional: Add a small delay to ensure data is sent properly
-                break
-        except Exception as e:
-            print(f"Could not find file. Please enter the path to main.bin\n (should be in the same folder as this exe): {e}")
-            try:
-                # Prompt user for the path to the binary file
-                file_path = input("Enter the full path to main.bin: ").strip()
-                with open(file_path, "rb") as binary_file:
-                    # Read the file in chunks and write to the serial port
-                    while chunk := binary_file.read(1024):  # Read in 1KB chunks
-                        ser.write(chunk)
-                        time.sleep(0.1)  # Optional: Add a small delay to ensure data is sent properly
-                    break
-            except Exception as e:
-                print(f"Error reading the provided file path: {e}")
-                continue
-    return checkSuccess(f"ESC_POS", test_entry)
+            return False
+    return True
 
-def test_pageESCPOS(ser, device, test_entry: TestEntry):
-    
-    if getattr(sys, 'frozen', False):
-    # Running in a bundle (e.g., PyInstaller)
-        base_path = sys._MEIPASS
-    else:
-    # Running in a normal Python environment
-        base_path = os.path.dirname(__file__)
+def streamEscposTest(ser, device, test_entry: TestEntry, binary, testName):
+    """Shared body of the ESC/POS tests: stream a binary of ESC/POS commands to the printer."""
+    file_path = locate_binary(binary)
 
-    file_path = os.path.join(base_path, "page_main.bin")
+    wait_until_ready(device)
+    if not disableSentry(device):
+        return
+    pause("\n\nAbout to test all ESC/POS commands\nTons of tickets will print!\nPress Enter to continue...\n")
 
-    time.sleep(1)
-    print("Attempting to unpair. If already unpaired, you will see a NAK response")
-    response = write_command(device, "GET_SENTRY_CONFIG")
-    if response[1][0] == 0x01:  
-        # Unpair printer to reset SENTRY
-        print("Unpairing printer...")
-        response = write_command(device, "SET_SENTRY_CONFIG", [0x00] + [0x00] * 20 +[0x00, 0x00, 0x00])  
-        if response == "NAK":
-            print("Failed to set SENTRY config")
-            return
-    input("\n\nAbout to test all ESC/POS commands\nTons of tickets will print!\nPress Enter to continue...\n")
+    with render.recording(ser, device) as recorder:
+        result = stream_binary(ser, device, file_path, getattr(ser, "baudrate", 19200))
+    if result.error is not None:
+        _, sections = load_index(file_path)
+        print(f"Stopped in {', '.join(sections_at(sections, result.position - 1))} (byte {result.position}); "
+              f"rerun with: python escpos.py stream {binary} \"<section>\" <port> {result.position}")
+        return checkSuccess(testName, test_entry, auto=False)
+    return checkSuccess(testName, test_entry, auto=goldenCheck(testName, recorder, faultCheck(device)))
 
-    
-    while True:
-        try:
-            # Open the binary file in read-binary mode
-            with open(file_path, "rb") as binary_file:
-                # Read the file in chunks and write to the serial port
-                while chunk := binary_file.read(1024):  # Read in 1KB chunks
-                    ser.write(chunk)
-                    time.sleep(0.1)  # Optional: Add a small delay to ensure data is sent properly
-                break
-        except Exception as e:
-            print(f"Could not find file. Please enter the path to main.bin\n (should be in the same folder as this exe): {e}")
-            try:
-                # Prompt user for the path to the binary file
-                file_path = input("Enter the full path to main.bin: ").strip()
-                with open(file_path, "rb") as binary_file:
-                    # Read the file in chunks and write to the serial port
-                    while chunk := binary_file.read(1024):  # Read in 1KB chunks
-                        ser.write(chunk)
-                        time.sleep(0.1)  # Optional: Add a small delay to ensure data is sent properly
-                    break
-            except Exception as e:
-                print(f"Error reading the provided file path: {e}")
-                continue
-    return checkSuccess(f"ESC_POS", test_entry)
\ No newline at end of file
+def test_ESCPOS(ser, device, test_entry: TestEntry):
+    return streamEscposTest(ser, device, test_entry, "main.bin", "ESC_POS")
+
+def test_pageESCPOS(ser, device, test_entry: TestEntry):
+    return streamEscposTest(ser, device, test_entry, "page_main.bin", "PAGE_ESC_POS")
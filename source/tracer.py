@@ -0,0 +1,188 @@
+"""
+Ticket lifecycle tracer.
+
+Correlates the form feed that ends each ticket on the serial port with the
+ticket state transitions and sensor edges seen by a StatusPoller, and splits
+every ticket into phases:
+
+    queue    form feed written     -> Printing
+    print    Printing              -> Unpresented
+    cut      Cutter Home cleared   -> Cutter Home set again
+    present  Unpresented           -> Presented
+    removal  Presented             -> Idle (taken, or retracted in retraction mode)
+
+Tickets that skip a state between two polls have no span for the phases
+around it. Sensor edges (path, presenter, notch, cutter home) are kept with
+each ticket. Spans are tagged with the running test, so retraction and
+continuous mode tests get separate p50/p95 figures:
+
+    tracer = TicketTracer(poller, ser)
+    ...
+    tracer.report()
+    tracer.dump("trace.jsonl")
+"""
+import json
+import threading
+import time
+
+import transport
+from metrics import LogHistogram
+from printStatus import SENSOR_FLAGS
+
+FORM_FEED = 0x0C
+PHASES = (                      # name, start event, end event
+    ("queue", "sent", "Printing"),
+    ("print", "Printing", "Unpresented"),
+    ("cut", "Cutter Home off", "Cutter Home on"),
+    ("present", "Unpresented", "Presented"),
+    ("removal", "Presented", "Idle"),
+)
+EDGES = ("Path Paper", "Presenter Paper", "Notch Sensor", "Cutter Home")
+BUSY = ("Printing", "Unpresented")
+
+
+class Trace:
+    """Events of one ticket: [(time, event)], event is a ticket state, "sent" or "<sensor> on/off"."""
+    def __init__(self, index, test, sent=None):
+        self.index = index
+        self.test = test
+        self.events = [(sent, "sent")] if sent is not None else []
+        self.printed = False    # Has been seen busy
+
+    def first(self, name, after=None):
+        return next((t for t, event in self.events if event == name and (after is None or t >= after)), None)
+
+    def spans(self):
+        """:return: [(phase, start, duration)] for every phase both ends were seen of"""
+        out = []
+        for phase, start_event, end_event in PHASES:
+            start = self.first(start_event)
+            end = self.first(end_event, after=start) if start is not None else None
+            if end is not None:
+                out.append((phase, start, end - start))
+        return out
+
+
+class TicketTracer:
+    """
+    :param poller: running statusPoller.StatusPoller
+    :param ser: serial port whose form feeds mark tickets as sent (None: any port)
+    """
+    def __init__(self, poller, ser=None):
+        self.poller = poller
+        self.port = getattr(ser, "ser", ser)     # The ObservedSerial under a SerialWriter
+        self.test = None
+        self.traces = []
+        self._open = []         # Tickets not finished yet, oldest first
+        self._state = None
+        self._sensors = None
+        self._lock = threading.Lock()
+        transport.subscribe(self._on_frame)
+        poller.subscribe(self._on_status)
+
+    # run_tests hooks
+
+    def begin(self, entry):
+        self.test = entry.name
+
+    def end(self, entry):
+        pass
+
+    def close(self):
+        transport.unsubscribe(self._on_frame)
+        self.poller.unsubscribe(self._on_status)
+
+    # observers
+
+    def _on_frame(self, kind, data, **info):
+        if kind != transport.SERIAL_TX or FORM_FEED not in data:
+            return
+        if self.port is not None and info.get("port") is not self.port:
+            return
+        t = time.monotonic()
+        with self._lock:
+            for _ in range(data.count(FORM_FEED)):
+                self._new(t)
+
+    def _new(self, sent=None):
+        trace = Trace(len(self.traces) + 1, self.test, sent)
+        self.traces.append(trace)
+        self._open.append(trace)
+        return trace
+
+    def _current(self):
+        # The ticket now in the printer: the oldest open one, or one the printer
+        # started by itself (autocut, test print)
+        return self._open[0] if self._open else self._new()
+
+    def _finish(self, trace):
+        if trace in self._open:
+            self._open.remove(trace)
+
+    def _on_status(self, t, record):
+        with self._lock:
+            state = record.ticket_state
+            if state != self._state:
+                self._transition(t, state)
+                self._state = state
+            sensors = record.sensor_status
+            if self._sensors is not None and sensors != self._sensors and (self._open or self._state in BUSY):
+                trace = self._current()
+                for name in EDGES:
+                    bit = 1 << SENSOR_FLAGS.index(name)
+                    if (sensors ^ self._sensors) & bit:
+                        trace.events.append((t, f"{name} {'on' if sensors & bit else 'off'}"))
+            self._sensors = sensors
+
+    def _transition(self, t, state):
+        if state in BUSY:
+            trace = self._current()
+            if state == "Printing" and trace.printed:
+                # The next ticket started while this one was still presented or waiting (continuous mode)
+                self._finish(trace)
+                trace = self._current()
+            trace.printed = True
+            trace.events.append((t, state))
+        elif state in ("Presented", "Idle") and self._open and (self._open[0].printed or self._open[0].events):
+            # A short ticket can print between two polls and show up Presented directly
+            trace = self._open[0]
+            trace.printed = True
+            trace.events.append((t, state))
+            if state == "Idle":
+                self._finish(trace)
+
+    # results
+
+    def histograms(self):
+        """:return: {(test, phase): LogHistogram of durations in seconds}"""
+        histograms = {}
+        with self._lock:
+            traces = list(self.traces)
+        for trace in traces:
+            for phase, _, duration in trace.spans():
+                histograms.setdefault((trace.test, phase), LogHistogram()).add(duration)
+        return histograms
+
+    def report(self):
+        histograms = self.histograms()
+        if not histograms:
+            print("No ticket phases traced")
+            return
+        order = [phase for phase, _, _ in PHASES]
+        print(f"\n{'TEST':<28}{'PHASE':<10}{'N':>5}{'P50 ms':>10}{'P95 ms':>10}{'MAX ms':>10}")
+        for (test, phase), h in sorted(histograms.items(), key=lambda item: (item[0][0] or "", order.index(item[0][1]))):
+            print(f"{test or '-':<28}{phase:<10}{h.count:>5}{1000 * h.quantile(0.5):>10.1f}"
+                  f"{1000 * h.quantile(0.95):>10.1f}{1000 * h.max:>10.1f}")
+
+    def dump(self, path):
+        """One JSON line per span, then one per ticket with its raw events."""
+        with self._lock:
+            traces = list(self.traces)
+        with open(path, "w") as f:
+            for trace in traces:
+                for phase, start, duration in trace.spans():
+                    f.write(json.dumps({"ticket": trace.index, "test": trace.test, "phase": phase,
+                                        "start": round(start, 4), "duration_s": round(duration, 4)}) + "\n")
+            for trace in traces:
+                f.write(json.dumps({"ticket": trace.index, "test": trace.test,
+                                    "events": [[round(t, 4), event] for t, event in trace.events]}) + "\n")
@@ -0,0 +1,387 @@
+"""
+HID transport policy for the Reliance command channel.
+
+Sits underneath write_command and decides how long to wait for a response,
+how to classify what came back, and whether a failed exchange is worth retrying.
+Also publishes every HID frame and serial chunk to subscribed observers.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import reduce
+from operator import xor
+
+import metrics
+
+ACK_BYTE = 0xAA
+REPORT_SIZE = 128
+
+# Failure reasons carried by Nak.reason
+TIMEOUT = "TIMEOUT"      # No report arrived before the deadline
+CHECKSUM = "CHECKSUM"    # A report arrived but its XOR checksum does not match
+FIRMWARE = "FIRMWARE"    # The firmware answered with something other than ACK
+
+
+class Nak(str):
+    """
+    A failed command response.
+
+    Compares equal to "NAK" so existing `response == "NAK"` checks keep working,
+    while `reason` tells a timeout, a corrupt frame and a real firmware NAK apart.
+    """
+    def __new__(cls, reason, response=None):
+        obj = super().__new__(cls, "NAK")
+        obj.reason = reason
+        obj.response = response
+        return obj
+
+    def __repr__(self):
+        return f"Nak({self.reason})"
+
+
+def calculate_checksum(data: bytes) -> int:
+    return reduce(xor, data, 0)
+
+
+def checksum_ok(response) -> bool:
+    """
+    Verifies an incoming report laid out like an outgoing one:
+    [report id, length, packet..., checksum] where length counts packet + checksum.
+    """
+    length = response[1] if len(response) > 1 else 0
+    if length < 2 or length + 2 > len(response):
+        return False
+    return calculate_checksum(response[2:1 + length]) == response[1 + length]
+
+
+class LatencyEstimator:
+    """
+    Smoothed round-trip estimate in the style of TCP's retransmission timer
+    (Jacobson/Karels). The timeout tracks srtt + 4 * rttvar, so a fast device
+    gets a tight deadline and a slow one is not cut off.
+    """
+    ALPHA = 0.125
+    BETA = 0.25
+
+    def __init__(self, initial_timeout, min_timeout, max_timeout):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.backoff = 1
+        self.samples = 0
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            base = self.initial_timeout
+        else:
+            base = self.srtt + 4 * self.rttvar
+        return min(self.max_timeout, max(self.min_timeout, base * self.backoff))
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.backoff = 1
+        self.samples += 1
+
+    def timed_out(self):
+        # Double the deadline until a response comes back, capped by max_timeout
+        self.backoff = min(self.backoff * 2, 64)
+
+
+@dataclass
+class TransportPolicy:
+    """
+    Timeouts are in seconds. Only commands considered idempotent are retried,
+    so a SET or PRINT is never sent twice behind the test's back. Those get
+    the adaptive deadline; commands sent once wait at least once_timeout, and
+    read a second time before a timeout counts, so a latency spike on e.g.
+    SAVE_CONFIG does not fail the test.
+    """
+    initial_timeout: float = 1.0
+    min_timeout: float = 0.02
+    once_timeout: float = 1.0
+    max_timeout: float = 5.0
+    max_attempts: int = 4
+    backoff_base: float = 0.05
+    backoff_cap: float = 1.0
+    retry_reasons: tuple = (TIMEOUT, CHECKSUM)
+    verify_checksum: bool = False
+    idempotent: set = field(default_factory=lambda: {"PING"})
+    _estimators: dict = field(default_factory=dict, repr=False)
+
+    def is_idempotent(self, command) -> bool:
+        return command.startswith("GET_") or command in self.idempotent
+
+    def estimator(self, device, command) -> LatencyEstimator:
+        # Latency is learned per device and per command: SAVE_CONFIG writes flash,
+        # GET_PRINTER_STATUS does not, and both should get a deadline that fits.
+        key = (id(device), command)
+        est = self._estimators.get(key)
+        if est is None:
+            est = LatencyEstimator(self.initial_timeout, self.min_timeout, self.max_timeout)
+            self._estimators[key] = est
+        return est
+
+    def backoff_delay(self, attempt) -> float:
+        return min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+
+    def forget(self, device):
+        """Drops learned latencies for a device, e.g. after RESET_DEVICE or a reconnect."""
+        for key in [k for k in self._estimators if k[0] == id(device)]:
+            del self._estimators[key]
+
+
+policy = TransportPolicy()
+
+
+# Observers see every frame that crosses the wire: fn(kind, data, **info) where
+# kind is one of HID_TX, HID_RX, SERIAL_TX, SERIAL_RX. SERIAL_WRITE is ticket
+# data handed to a buffering writer (serialWriter.SerialWriter), published in
+# the thread of the test that wrote it; the SERIAL_TX of those bytes may come
+# later and from another thread. Publishing is skipped
+# entirely when nobody is subscribed. The list is replaced rather than mutated,
+# so threads publishing concurrently never see it change under them.
+HID_TX = "hid_tx"
+HID_RX = "hid_rx"
+SERIAL_TX = "serial_tx"
+SERIAL_RX = "serial_rx"
+SERIAL_WRITE = "serial_write"
+
+_observers = []
+
+
+def subscribe(fn):
+    global _observers
+    if fn not in _observers:
+        _observers = _observers + [fn]
+    return fn
+
+
+def unsubscribe(fn):
+    global _observers
+    if fn in _observers:
+        _observers = [observer for observer in _observers if observer is not fn]
+
+
+def publish(kind, data, **info):
+    for fn in _observers:
+        fn(kind, data, **info)
+
+
+class ObservedSerial:
+    """
+    Wraps a pyserial port so writes and reads are published to observers.
+    Everything else is passed straight through to the port.
+    """
+    def __init__(self, ser):
+        self._ser = ser
+
+    def write(self, data):
+        if _observers:
+            publish(SERIAL_TX, bytes(data), port=self)
+        return self._ser.write(data)
+
+    def read(self, size=1):
+        data = self._ser.read(size)
+        if _observers and data:
+            publish(SERIAL_RX, bytes(data), port=self)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def device_lock(device):
+    """
+    One lock per device so a background poller and the test thread never
+    interleave a write with someone else's read.
+    """
+    lock = _locks.get(id(device))
+    if lock is None:
+        with _locks_guard:
+            lock = _locks.setdefault(id(device), threading.RLock())
+    return lock
+
+
+# Devices with a request that timed out: its response may still turn up, and
+# would then be read as the answer to the next command. Their input is drained
+# right after the timeout and again before every send until a request gets
+# its own response.
+_stale = set()
+
+
+def _drain(device):
+    # Discard a late response to a timed out request so it is not mistaken
+    # for the answer to the next one
+    try:
+        while device.read(REPORT_SIZE, 1):
+            pass
+    except Exception:
+        pass
+
+
+def _timed_out(device):
+    _stale.add(id(device))
+    _drain(device)
+
+
+def _before_send(device):
+    if id(device) in _stale:
+        _drain(device)
+
+
+def _read(device, timeout):
+    timeout_ms = max(1, int(timeout * 1000))
+    return device.read(REPORT_SIZE, timeout_ms)
+
+
+def exchange_once(device, command, frame, policy=policy, once=False):
+    """
+    Sends one frame and classifies the response.
+    :param once: the frame will not be retried, so wait at least
+        policy.once_timeout and read again before giving up
+    :return: ("ACK", data) on success or a Nak with the failure reason
+    """
+    est = policy.estimator(device, command)
+    timeout = max(est.timeout(), policy.once_timeout) if once else est.timeout()
+    with device_lock(device):
+        _before_send(device)
+        if _observers:
+            publish(HID_TX, bytes(frame), device=device, command=command)
+        start = time.perf_counter()
+        device.write(frame)
+        response = _read(device, timeout)
+        if not response and once:
+            # Nothing else was sent, so a late report is still this frame's answer
+            response = _read(device, timeout)
+        rtt = time.perf_counter() - start
+        if _observers:
+            publish(HID_RX, bytes(response), device=device, command=command, rtt=rtt)
+        if not response:
+            _timed_out(device)
+        else:
+            _stale.discard(id(device))
+
+    if not response:
+        est.timed_out()
+    else:
+        est.observe(rtt)
+    result = _classify(response, policy)
+    if metrics.enabled:
+        metrics.record(command, rtt, result)
+    return result
+
+
+def _classify(response, policy):
+    if not response:
+        return Nak(TIMEOUT)
+    if policy.verify_checksum and not checksum_ok(response):
+        return Nak(CHECKSUM, response)
+    if len(response) < 4 or response[3] != ACK_BYTE:
+        return Nak(FIRMWARE, response)
+    return "ACK", response[4:]
+
+
+def exchange_pipelined(device, command, frames, window=4, policy=policy):
+    """
+    Sends frames keeping up to `window` of them in flight, for bulk transfers
+    (flash images, logos) where the firmware queues requests and answers them
+    in order. The device is locked for the whole batch.
+    :return: one result per frame like exchange_once, ending early at the first
+        failure (responses still in flight are discarded)
+    """
+    est = policy.estimator(device, command)
+    results = []
+    sent = []           # Write times of frames in flight, oldest first
+    with device_lock(device):
+        _before_send(device)
+        next_frame = 0
+        while len(results) < len(frames):
+            while next_frame < len(frames) and len(sent) < window:
+                frame = frames[next_frame]
+                if _observers:
+                    publish(HID_TX, bytes(frame), device=device, command=command)
+                sent.append(time.perf_counter())
+                device.write(frame)
+                next_frame += 1
+            response = _read(device, est.timeout())
+            rtt = time.perf_counter() - sent.pop(0)
+            if _observers:
+                publish(HID_RX, bytes(response), device=device, command=command, rtt=rtt)
+            if response:
+                est.observe(rtt)
+            else:
+                est.timed_out()
+            result = _classify(response, policy)
+            if metrics.enabled:
+                metrics.record(command, rtt, result)
+            results.append(result)
+            if result == "NAK":
+                if sent or not response:
+                    _timed_out(device)
+                break
+        else:
+            _stale.discard(id(device))
+    return results
+
+
+class TransferError(IOError):
+    """A bulk transfer (see send_chunks) was refused or kept failing."""
+
+
+def send_chunks(device, command, frames, window=8, batch=256, retries=5, progress=None, policy=policy):
+    """
+    Sends a long sequence of frames (e.g. from commands.build_chunk_frames) with
+    exchange_pipelined, `batch` at a time. Failed frames are resent with half
+    the window, so the transfer settles at what the firmware keeps up with.
+    :param progress: optional fn(frames sent, total frames), called after every batch
+    :return: window the transfer ended with
+    """
+    failures = 0
+    index = 0
+    while index < len(frames):
+        chunk = [bytes(frame) for frame in frames[index:index + batch]]
+        results = exchange_pipelined(device, command, chunk, window, policy)
+        acked = sum(1 for result in results if result != "NAK")
+        index += acked
+        if acked < len(chunk):
+            failures += 1
+            reason = results[-1].reason
+            if failures > retries:
+                raise TransferError(f"{command}: frame {index} failed {failures} times ({reason})")
+            window = max(1, window // 2)
+            print(f"{command}: frame {index} {reason.lower()}, resending with {window} in flight")
+        if progress is not None:
+            progress(index, len(frames))
+    return window
+
+
+def exchange(device, command, frame, policy=policy):
+    """
+    Sends a frame, retrying transient failures of idempotent commands with
+    bounded exponential backoff.
+    """
+    attempts = policy.max_attempts if policy.is_idempotent(command) else 1
+    for attempt in range(attempts):
+        result = exchange_once(device, command, frame, policy, once=attempts == 1)
+        if result != "NAK" or result.reason not in policy.retry_reasons:
+            return result
+        if attempt + 1 < attempts:
+            print(f"{command}: {result.reason.lower()}, retrying ({attempt + 1}/{attempts - 1})")
+            if result.reason != TIMEOUT:
+                with device_lock(device):
+                    _stale.add(id(device))
+            # exchange_once drains again just before resending, so a response
+            # that turns up during the backoff is not taken for the retry's
+            time.sleep(policy.backoff_delay(attempt))
+    return result
@@ -0,0 +1,107 @@
+"""
+Event-driven waits on printer status.
+
+Instead of sleeping a fixed time after each ticket, poll GET_PRINTER_STATUS
+until the ticket state or sensor flags say the printer is ready, bounded by
+a deadline. If status cannot be read at all, fall back to the old fixed delay
+so a printer without status support is never rushed.
+"""
+import time
+
+import transport
+from commands import build_frame
+from printStatus import StatusRecord
+from results import record_status, timed
+
+STATUS_FRAME = build_frame("GET_PRINTER_STATUS")
+
+BUSY_STATES = ("Printing", "Unpresented")
+READY_STATES = ("Idle", "Presented")
+
+
+def read_status(device):
+    """Quietly reads one status sample. :return: StatusRecord or None"""
+    response = transport.exchange(device, "GET_PRINTER_STATUS", STATUS_FRAME)
+    if response == "NAK":
+        return None
+    try:
+        status = StatusRecord.from_bytes(bytes(response[1]))
+    except ValueError:
+        return None
+    record_status(status)
+    return status
+
+
+def printer_ok(device):
+    """:return: True if no error flag is set, False if one is, None if status cannot be read"""
+    status = read_status(device)
+    return None if status is None else status.error_status == 0
+
+
+def wait_for_status(device, predicate, timeout=10.0, interval=0.05, fallback=None):
+    """
+    Polls status until predicate(StatusRecord) is true or the deadline passes.
+    :param fallback: seconds to sleep instead if status cannot be read
+    :return: the matching StatusRecord, or None on timeout / no status
+    """
+    deadline = time.monotonic() + timeout
+    with timed("printer_wait"):
+        while True:
+            status = read_status(device)
+            if status is None:
+                if fallback is not None:
+                    time.sleep(fallback)
+                return None
+            if predicate(status):
+                return status
+            if time.monotonic() >= deadline:
+                print(f"Timed out after {timeout}s waiting for printer (state: {status.ticket_state})")
+                return None
+            time.sleep(interval)
+
+
+def wait_for_ticket_state(device, states, timeout=10.0, interval=0.05, fallback=None):
+    """Waits until the ticket state is one of `states` (e.g. "Presented")."""
+    if isinstance(states, str):
+        states = (states,)
+    return wait_for_status(device, lambda s: s.ticket_state in states, timeout, interval, fallback)
+
+
+def wait_for_sensor(device, name, value=True, timeout=10.0, interval=0.05, fallback=None):
+    """Waits until a sensor flag (see printStatus.SENSOR_FLAGS) reads `value`."""
+    return wait_for_status(device, lambda s: s.sensor(name) == value, timeout, interval, fallback)
+
+
+def wait_until_ready(device, timeout=10.0, fallback=1.0):
+    """Waits until nothing is printing or waiting to be presented."""
+    return wait_for_ticket_state(device, READY_STATES, timeout, fallback=fallback)
+
+
+def wait_for_ticket(device, timeout=15.0, start_timeout=1.0, interval=0.05, fallback=2.0):
+    """
+    Waits for a ticket that was just sent to finish: first for it to start
+    (Printing/Unpresented), then for Presented or Idle. The previous ticket can
+    still be Presented when this is called, so a ready state only counts once
+    the new ticket has been seen, or after `start_timeout` if it never shows up
+    (short tickets can print between two polls).
+    An error flag ends the wait early.
+    :return: the final StatusRecord, or None on timeout / no status
+    """
+    start = time.monotonic()
+    started = False
+
+    def done(status):
+        nonlocal started
+        if status.error_status:
+            return True
+        if status.ticket_state in BUSY_STATES:
+            started = True
+            return False
+        return started or time.monotonic() - start >= start_timeout
+
+    return wait_for_status(device, done, timeout, interval, fallback)
+
+
+def drain_serial(ser):
+    """Blocks until everything written to the serial port has left the host."""
+    ser.flush()